@@ -0,0 +1,135 @@
+"""
+Fan-out of Xray logs to any number of viewers.
+
+Log lines are published by reader threads into one ring buffer, numbered with a sequence.
+Every viewer only keeps its position in the sequence, so a line is stored once however many
+are watching. Waiting viewers are woken by the publisher, an idle viewer costs nothing.
+A viewer that falls behind by more than the buffer skips the overwritten lines and is told
+how many it missed.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from contextlib import suppress
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+BUFFER_SIZE = 1000
+BACKLOG = 100
+
+
+class LogBroadcaster:
+    def __init__(self, size: int = BUFFER_SIZE):
+        self._lines = deque(maxlen=size)
+        self._seq = 0  # sequence number of the next line
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def publish(self, line: str):
+        self.publish_many((line,))
+
+    def publish_many(self, lines: Iterable[str]):
+        """Appends the lines and wakes the waiting viewers, can be called from any thread."""
+        lines = list(lines)
+        with self._lock:
+            self._lines.extend(lines)
+            self._seq += len(lines)
+            waiters = list(self._waiters)
+            self._cond.notify_all()
+
+        for loop, event in waiters:
+            with suppress(RuntimeError):  # closed loop
+                loop.call_soon_threadsafe(event.set)
+
+    def subscribe(self, backlog: int = BACKLOG) -> "LogSubscription":
+        """A viewer starting with the last `backlog` lines."""
+        with self._lock:
+            return LogSubscription(self, self._seq - min(backlog, len(self._lines)))
+
+
+class LogSubscription:
+    def __init__(self, broadcaster: LogBroadcaster, position: int):
+        self._broadcaster = broadcaster
+        self.position = position
+        self.missed = 0  # lines overwritten before they were read, since the last read
+        self.dropped = 0  # in total
+
+    def _pending(self) -> bool:
+        return self.position < self._broadcaster._seq
+
+    def read(self, limit: Optional[int] = None) -> List[str]:
+        """Takes the lines published since the last read, without waiting."""
+        b = self._broadcaster
+        with b._lock:
+            first = b._seq - len(b._lines)
+            self.missed = max(first - self.position, 0)
+            self.dropped += self.missed
+            start = max(self.position, first) - first
+            end = len(b._lines) if limit is None else min(start + limit, len(b._lines))
+            lines = [b._lines[i] for i in range(start, end)]
+            self.position = first + end
+        return lines
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits for new lines, returns whether there are any."""
+        b = self._broadcaster
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with b._lock:
+            if self._pending():
+                return True
+            b._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with b._lock:
+                b._waiters.discard(waiter)
+
+    def wait_sync(self, timeout: Optional[float] = None) -> bool:
+        """Blocking `wait`, for threads."""
+        b = self._broadcaster
+        with b._cond:
+            return b._cond.wait_for(self._pending, timeout)
+
+
+async def stream_logs(websocket: WebSocket, logs: LogSubscription, interval: Optional[float] = None,
+                      alive: Optional[Callable[[], bool]] = None, check_interval: float = 5):
+    """
+    Sends the logs to the websocket until it's closed or `alive` returns False.
+
+    Lines are sent one by one, or every `interval` seconds in one message when given.
+    """
+    async def until_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    disconnect = asyncio.ensure_future(until_disconnect())
+    try:
+        while not disconnect.done() and (alive is None or alive()):
+            waiter = asyncio.ensure_future(logs.wait(check_interval if alive else None))
+            await asyncio.wait({disconnect, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                waiter.cancel()
+                break
+
+            lines = logs.read()
+            if logs.missed:
+                lines.insert(0, f"[{logs.missed} log lines skipped, the viewer is too slow]")
+            if not lines:
+                continue
+
+            if interval:
+                await websocket.send_text("\n".join(lines) + "\n")
+                await asyncio.wait({disconnect}, timeout=interval)
+            else:
+                for line in lines:
+                    await websocket.send_text(line)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        disconnect.cancel()
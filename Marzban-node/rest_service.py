@@ -1,4 +1,3 @@
-import asyncio
 import json
 import time
 from uuid import UUID, uuid4
@@ -8,10 +7,10 @@ from fastapi import (APIRouter, Body, FastAPI, HTTPException, Request,
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
-from starlette.websockets import WebSocketDisconnect
 
 from config import XRAY_ASSETS_PATH, XRAY_EXECUTABLE_PATH
 from logger import logger
+from logs import stream_logs
 from xray import XRayConfig, XRayCore
 from tunnel_service import tunnel_router
 
@@ -133,13 +132,10 @@ class Service(object):
                 end_time = start_time + 3
                 last_log = ''
                 while time.time() < end_time:
-                    while logs:
-                        log = logs.popleft()
+                    for log in logs.read():
                         if log:
                             last_log = log
-                        if f'Xray {self.core_version} started' in log:
-                            break
-                    time.sleep(0.1)
+                    logs.wait_sync(end_time - time.time())
 
             except Exception as exc:
                 logger.error(f"Failed to start core: {exc}")
@@ -188,13 +184,10 @@ class Service(object):
                 end_time = start_time + 3
                 last_log = ''
                 while time.time() < end_time:
-                    while logs:
-                        log = logs.popleft()
+                    for log in logs.read():
                         if log:
                             last_log = log
-                        if f'Xray {self.core_version} started' in log:
-                            break
-                    time.sleep(0.1)
+                    logs.wait_sync(end_time - time.time())
 
         except Exception as exc:
             logger.error(f"Failed to restart core: {exc}")
@@ -235,37 +228,8 @@ class Service(object):
 
         await websocket.accept()
 
-        cache = ''
-        last_sent_ts = 0
         with self.core.get_logs() as logs:
-            while session_id == self.session_id:
-                if interval and time.time() - last_sent_ts >= interval and cache:
-                    try:
-                        await websocket.send_text(cache)
-                    except (WebSocketDisconnect, RuntimeError):
-                        break
-                    cache = ''
-                    last_sent_ts = time.time()
-
-                if not logs:
-                    try:
-                        await asyncio.wait_for(websocket.receive(), timeout=0.2)
-                        continue
-                    except asyncio.TimeoutError:
-                        continue
-                    except (WebSocketDisconnect, RuntimeError):
-                        break
-
-                log = logs.popleft()
-
-                if interval:
-                    cache += f'{log}\n'
-                    continue
-
-                try:
-                    await websocket.send_text(log)
-                except (WebSocketDisconnect, RuntimeError):
-                    break
+            await stream_logs(websocket, logs, interval, alive=lambda: session_id == self.session_id)
 
         await websocket.close()
 
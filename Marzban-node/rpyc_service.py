@@ -24,20 +24,15 @@ class XrayCoreLogsHandler(object):
 
     def cast(self):
         with self.core.get_logs() as logs:
-            cache = ''
-            last_sent_ts = 0
             while self.active:
-                if time.time() - last_sent_ts >= self.interval and cache:
-                    self.callback(cache)
-                    cache = ''
-                    last_sent_ts = time.time()
-
-                if not logs:
-                    time.sleep(0.2)
+                if not logs.wait_sync(self.interval):
                     continue
 
-                log = logs.popleft()
-                cache += f'{log}\n'
+                lines = logs.read()
+                if logs.missed:
+                    lines.insert(0, f'[{logs.missed} log lines skipped, the viewer is too slow]')
+                self.callback('\n'.join(lines) + '\n')
+                time.sleep(self.interval)
 
 
 @rpyc.service
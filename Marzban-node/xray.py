@@ -3,11 +3,12 @@ import json
 import re
 import subprocess
 import threading
-from collections import deque
 from contextlib import contextmanager
+from typing import Iterator
 
 from config import DEBUG, SSL_CERT_FILE, SSL_KEY_FILE, XRAY_API_HOST, XRAY_API_PORT, INBOUNDS
 from logger import logger
+from logs import BACKLOG, LogBroadcaster, LogSubscription
 
 
 class XRayConfig(dict):
@@ -108,8 +109,7 @@ class XRayCore:
         self.process = None
         self.restarting = False
 
-        self._logs_buffer = deque(maxlen=100)
-        self._temp_log_buffers = {}
+        self.logs = LogBroadcaster()
         self._on_start_funcs = []
         self._on_stop_funcs = []
         self._env = {
@@ -126,49 +126,24 @@ class XRayCore:
         if m:
             return m.groups()[0]
 
-    def __capture_process_logs(self):
-        def capture_and_debug_log():
-            while self.process:
-                output = self.process.stdout.readline()
-                if output:
-                    output = output.strip()
-                    self._logs_buffer.append(output)
-                    for buf in list(self._temp_log_buffers.values()):
-                        buf.append(output)
-                    logger.debug(output)
-
-                elif not self.process or self.process.poll() is not None:
-                    break
-
-        def capture_only():
-            while self.process:
-                output = self.process.stdout.readline()
-                if output:
-                    output = output.strip()
-                    self._logs_buffer.append(output)
-                    for buf in list(self._temp_log_buffers.values()):
-                        buf.append(output)
-
-                elif not self.process or self.process.poll() is not None:
-                    break
-
-        if DEBUG:
-            threading.Thread(target=capture_and_debug_log).start()
-        else:
-            threading.Thread(target=capture_only).start()
+    def __capture_process_logs(self, process: subprocess.Popen):
+        # stderr is merged into stdout, reading until EOF keeps both drained
+        def capture_logs():
+            for output in process.stdout:
+                if output := output.strip():
+                    self.logs.publish(output)
+                    if DEBUG:
+                        logger.debug(output)
+            process.wait()
+
+        threading.Thread(target=capture_logs, daemon=True).start()
 
     @contextmanager
-    def get_logs(self):
-        buf = deque(self._logs_buffer, maxlen=100)
-        buf_id = id(buf)
+    def get_logs(self, backlog: int = BACKLOG) -> Iterator[LogSubscription]:
         try:
-            self._temp_log_buffers[buf_id] = buf
-            yield buf
+            yield self.logs.subscribe(backlog)
         except (EOFError, TimeoutError):
             pass
-        finally:
-            del self._temp_log_buffers[buf_id]
-            del buf
 
     @property
     def started(self):
@@ -197,15 +172,16 @@ class XRayCore:
             cmd,
             env=self._env,
             stdin=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             stdout=subprocess.PIPE,
-            universal_newlines=True
+            universal_newlines=True,
+            errors="replace"
         )
         self.process.stdin.write(config.to_json())
         self.process.stdin.flush()
         self.process.stdin.close()
 
-        self.__capture_process_logs()
+        self.__capture_process_logs(self.process)
 
         # execute on start functions
         for func in self._on_start_funcs:
@@ -215,8 +191,13 @@ class XRayCore:
         if not self.started:
             return
 
-        self.process.terminate()
-        self.process = None
+        process, self.process = self.process, None
+        process.terminate()
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
         logger.warning("Xray core stopped")
 
         # execute on stop functions
@@ -1,70 +1,133 @@
 import logging
+from typing import TYPE_CHECKING
 
-from apscheduler.schedulers.background import BackgroundScheduler
-from fastapi import FastAPI, Request, status
-from fastapi.encoders import jsonable_encoder
-from fastapi.exceptions import RequestValidationError
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi.routing import APIRoute
+from config import ALLOWED_ORIGINS, DOCS, METRICS_ENABLED, QUERY_PROFILE, XRAY_SUBSCRIPTION_PATH
 
-from config import ALLOWED_ORIGINS, DOCS, XRAY_SUBSCRIPTION_PATH
+if TYPE_CHECKING:
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from fastapi import FastAPI, Request
+    from fastapi.exceptions import RequestValidationError
 
 __version__ = "0.8.4"
 
-app = FastAPI(
-    title="MarzbanAPI",
-    description="Unified GUI Censorship Resistant Solution Powered by Xray",
-    version=__version__,
-    docs_url="/docs" if DOCS else None,
-    redoc_url="/redoc" if DOCS else None,
-)
-
-scheduler = BackgroundScheduler(
-    {"apscheduler.job_defaults.max_instances": 20}, timezone="UTC"
-)
 logger = logging.getLogger("uvicorn.error")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=ALLOWED_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-from app import dashboard, jobs, routers, telegram  # noqa
-from app.routers import api_router  # noqa
 
-app.include_router(api_router)
+def __getattr__(name: str):
+    # the app and the scheduler are created on first use, importing fastapi and apscheduler
+    # takes a while and the CLI or migrations need neither
+    if name == "app":
+        value = _create_app()
+    elif name == "scheduler":
+        value = _create_scheduler()
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
 
 
-def use_route_names_as_operation_ids(app: FastAPI) -> None:
+def _create_scheduler() -> "BackgroundScheduler":
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    executors = {}
+    if QUERY_PROFILE:
+        from app.db.profile import TracingExecutor
+
+        executors["default"] = TracingExecutor()
+
+    return BackgroundScheduler(
+        {"apscheduler.job_defaults.max_instances": 20}, timezone="UTC", executors=executors
+    )
+
+
+def _create_app() -> "FastAPI":
+    from fastapi import FastAPI
+    from fastapi.exceptions import RequestValidationError
+    from fastapi.middleware.cors import CORSMiddleware
+
+    app = FastAPI(
+        title="MarzbanAPI",
+        description="Unified GUI Censorship Resistant Solution Powered by Xray",
+        version=__version__,
+        docs_url="/docs" if DOCS else None,
+        redoc_url="/redoc" if DOCS else None,
+    )
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=ALLOWED_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    if QUERY_PROFILE:
+        from app.db.profile import ProfileMiddleware
+
+        app.add_middleware(ProfileMiddleware)
+    app.add_event_handler("startup", on_startup)
+    app.add_event_handler("shutdown", on_shutdown)
+    app.add_exception_handler(RequestValidationError, validation_exception_handler)
+    return app
+
+
+from app.utils import workers  # noqa
+
+
+def use_route_names_as_operation_ids(app: "FastAPI") -> None:
+    from fastapi.routing import APIRoute
+
     for route in app.routes:
         if isinstance(route, APIRoute):
             route.operation_id = route.name
 
 
-use_route_names_as_operation_ids(app)
+def include_panel():
+    """
+    Loads the routers, dashboard, jobs and bot of the panel, called by main.py.
+
+    Importing `app` alone stays cheap for the CLI, migrations and subscription servers.
+    """
+    from app import scheduler
+
+    if METRICS_ENABLED:
+        from app.metrics import panel
+
+        # first, the calls of the Xray API clients created before aren't measured
+        panel.instrument(scheduler)
+
+    from app import app, dashboard, jobs, routers, telegram  # noqa
+    from app.routers import api_router
+
+    app.include_router(api_router)
+    use_route_names_as_operation_ids(app)
+    workers.on_elected(scheduler.start)
 
 
-@app.on_event("startup")
 def on_startup():
+    from app import app
+
     paths = [f"{r.path}/" for r in app.routes]
     paths.append("/api/")
     if f"/{XRAY_SUBSCRIPTION_PATH}/" in paths:
         raise ValueError(
             f"you can't use /{XRAY_SUBSCRIPTION_PATH}/ as subscription path it reserved for {app.title}"
         )
-    scheduler.start()
+    workers.start()
 
 
-@app.on_event("shutdown")
 def on_shutdown():
-    scheduler.shutdown()
+    from app import scheduler
+
+    workers.stop()
+    if scheduler.running:
+        scheduler.shutdown()
+
 
+def validation_exception_handler(request: "Request", exc: "RequestValidationError"):
+    from fastapi import status
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
 
-@app.exception_handler(RequestValidationError)
-def validation_exception_handler(request: Request, exc: RequestValidationError):
     details = {}
     for error in exc.errors():
         details[error["loc"][-1]] = error.get("msg")
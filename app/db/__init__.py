@@ -1,21 +1,38 @@
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from .base import Base, SessionLocal, engine  # noqa
+from . import write_queue
+from .base import Base, ReadSessionLocal, SessionLocal, engine  # noqa
 
 
 class GetDB:  # Context Manager
-    def __init__(self):
-        self.db = SessionLocal()
+    """
+    A session, closed on exit.
+
+    Args:
+        read_only (bool): Reads through the read-only connections, on SQLite.
+        queued (bool): Waits for the turn of the session in the write queue of background
+            jobs until exit, on SQLite. See app/db/write_queue.py.
+    """
+
+    def __init__(self, read_only: bool = False, queued: bool = False):
+        self.db = ReadSessionLocal() if read_only else SessionLocal()
+        self.queued = queued and write_queue.enabled
 
     def __enter__(self):
+        if self.queued:
+            write_queue.queue.acquire()
         return self.db
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if isinstance(exc_value, SQLAlchemyError):
-            self.db.rollback()  # rollback on exception
+        try:
+            if isinstance(exc_value, SQLAlchemyError):
+                self.db.rollback()  # rollback on exception
 
-        self.db.close()
+            self.db.close()
+        finally:
+            if self.queued:
+                write_queue.queue.release()
 
 
 def get_db():  # Dependency
@@ -23,9 +40,16 @@ def get_db():  # Dependency
         yield db
 
 
+def get_read_db():  # Dependency
+    # for endpoints that only read, such as reports and lists, on the read-only connections
+    with GetDB(read_only=True) as db:
+        yield db
+
+
 from .crud import (create_admin, create_notification_reminder,  # noqa
                    create_user, delete_notification_reminder, get_admin,
                    get_admins, get_jwt_secret_key, get_notification_reminder,
+                   get_notification_reminder_keys,
                    get_or_create_inbound, get_system_usage,
                    get_tls_certificate, get_user, get_user_by_id, get_users,
                    get_users_count, remove_admin, remove_user, revoke_user_sub,
@@ -63,10 +87,12 @@ __all__ = [
 
     "create_notification_reminder",
     "get_notification_reminder",
+    "get_notification_reminder_keys",
     "delete_notification_reminder",
 
     "GetDB",
     "get_db",
+    "get_read_db",
 
     "User",
     "System",
@@ -0,0 +1,337 @@
+"""
+Columnar archive of usage rows.
+
+Old rows of `node_user_usages`, its daily and monthly rollups and `node_usages` are
+exported, in primary key order and through a streaming cursor, into files partitioned
+by month and node:
+
+    <USAGE_ARCHIVE_DIR>/<table>/<YYYY-MM>/<node>/<min_id>-<max_id>/
+        meta.json
+        <column>.i64    int64 values of one column, in `meta.json`'s byte order
+
+`<node>` is `master` for the main core and `created_at` is stored as unix seconds.
+Column files are plain arrays, so they're memory-mapped and summed up with numpy.
+
+Every exported part is registered in `usage_archives`. Once its rows are removed
+from the live table (`pruned`), the usage reports read it alongside the database.
+Archives are history: resetting or deleting a user doesn't touch archived rows.
+"""
+
+import array
+import json
+import os
+import secrets
+import shutil
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db.models import (
+    Admin,
+    NodeUsage,
+    NodeUserUsage,
+    NodeUserUsageDaily,
+    NodeUserUsageMonthly,
+    UsageArchive,
+    User,
+)
+from app.models.node import UsagePeriod
+from config import USAGE_ARCHIVE_DIR
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def start_of_hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def start_of_day(dt: datetime) -> datetime:
+    return start_of_hour(dt).replace(hour=0)
+
+
+def start_of_month(dt: datetime) -> datetime:
+    return start_of_day(dt).replace(day=1)
+
+
+# table name -> (model, archived value columns, start of the hour, day or month a row covers)
+TABLES: Dict[str, Tuple[type, Tuple[str, ...], Callable[[datetime], datetime]]] = {
+    "node_user_usages": (NodeUserUsage, ("user_id", "used_traffic"), start_of_hour),
+    "node_user_usages_daily": (NodeUserUsageDaily, ("user_id", "used_traffic"), start_of_day),
+    "node_user_usages_monthly": (NodeUserUsageMonthly, ("user_id", "used_traffic"), start_of_month),
+    "node_usages": (NodeUsage, ("uplink", "downlink"), start_of_hour),
+}
+USER_USAGE_TABLES = ("node_user_usages", "node_user_usages_daily", "node_user_usages_monthly")
+
+
+def to_utc(dt: datetime) -> datetime:
+    """The naive UTC datetime, as stored in the database, of a naive UTC or aware datetime."""
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_timestamp(dt: datetime) -> int:
+    return int((to_utc(dt) - EPOCH).total_seconds())
+
+
+def from_timestamp(ts: int) -> datetime:
+    return EPOCH + timedelta(seconds=ts)
+
+
+class PartWriter:
+    def __init__(self, path: str, columns: Tuple[str, ...], buffer_rows: int = 65536):
+        self.path = path
+        self.columns = ("id", "created_at") + columns
+        self.buffer_rows = buffer_rows
+        self.rows = 0
+        self.min_id = self.max_id = None
+        self.start = self.end = None
+
+        os.makedirs(path)
+        self._buffers = {c: array.array("q") for c in self.columns}
+        self._files = {c: open(os.path.join(path, f"{c}.i64"), "wb") for c in self.columns}
+
+    def append(self, values: tuple):
+        for column, value in zip(self.columns, values):
+            self._buffers[column].append(value)
+
+        row_id, created_at = values[0], values[1]
+        self.min_id = row_id if self.min_id is None else min(self.min_id, row_id)
+        self.max_id = row_id if self.max_id is None else max(self.max_id, row_id)
+        self.start = created_at if self.start is None else min(self.start, created_at)
+        self.end = created_at if self.end is None else max(self.end, created_at)
+        self.rows += 1
+
+        if len(self._buffers["id"]) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        for column, buffer in self._buffers.items():
+            buffer.tofile(self._files[column])
+            del buffer[:]
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({
+                "columns": self.columns,
+                "rows": self.rows,
+                "byteorder": sys.byteorder,
+                "min_id": self.min_id,
+                "max_id": self.max_id,
+                "start": self.start,
+                "end": self.end,
+            }, f)
+
+
+def get_watermark(db: Session, table_name: str) -> int:
+    """The highest primary key exported from the table so far."""
+    return db.query(func.max(UsageArchive.max_id)).filter(UsageArchive.table_name == table_name).scalar() or 0
+
+
+def export(db: Session, table_name: str, before: datetime,
+           prune: bool = True, batch_size: int = 10000) -> List[UsageArchive]:
+    """
+    Exports rows of the table created before `before` that weren't exported yet.
+
+    Args:
+        db (Session): Database session.
+        table_name (str): One of `TABLES`.
+        before (datetime): Only rows of hours, days or months that ended by then are exported.
+        prune (bool): Deletes exported rows from the live table, in batches.
+        batch_size (int): Rows fetched from the cursor and deleted per batch.
+
+    Returns:
+        List[UsageArchive]: The registered archive parts.
+    """
+    model, columns, bucket_start = TABLES[table_name]
+    before = bucket_start(before)
+    since = get_watermark(db, table_name)
+    conditions = (model.id > since, model.created_at < before)
+
+    stmt = select(model.id, model.created_at, model.node_id, *(getattr(model, c) for c in columns)) \
+        .where(*conditions) \
+        .order_by(model.id) \
+        .execution_options(stream_results=True, yield_per=batch_size)
+
+    staging = os.path.join(USAGE_ARCHIVE_DIR, f".staging-{secrets.token_hex(4)}")
+    writers: Dict[Tuple[str, Optional[int]], PartWriter] = {}
+    try:
+        for row_id, created_at, node_id, *values in db.execute(stmt):
+            key = (created_at.strftime("%Y-%m"), node_id)
+            writer = writers.get(key)
+            if writer is None:
+                writer = writers[key] = PartWriter(os.path.join(staging, str(len(writers))), columns)
+            writer.append((row_id, to_timestamp(created_at), *(v or 0 for v in values)))
+
+        archives = []
+        for (month, node_id), writer in writers.items():
+            writer.close()
+            path = os.path.join(table_name, month, str(node_id or "master"), f"{writer.min_id}-{writer.max_id}")
+            os.makedirs(os.path.dirname(os.path.join(USAGE_ARCHIVE_DIR, path)), exist_ok=True)
+            os.replace(writer.path, os.path.join(USAGE_ARCHIVE_DIR, path))
+            archives.append(UsageArchive(
+                table_name=table_name,
+                node_id=node_id,
+                month=month,
+                path=path,
+                rows=writer.rows,
+                min_id=writer.min_id,
+                max_id=writer.max_id,
+                start=from_timestamp(writer.start),
+                end=from_timestamp(writer.end),
+            ))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    if not archives:
+        return archives
+
+    db.add_all(archives)
+    db.commit()
+
+    if prune:
+        # flagged first: reports may count a row twice while it's being deleted, never miss it
+        for archive in archives:
+            archive.pruned = True
+        db.commit()
+
+        max_id = max(archive.max_id for archive in archives)
+        lower = since
+        while lower < max_id:
+            upper = lower + batch_size
+            db.query(model).filter(*conditions, model.id > lower, model.id <= upper) \
+                .delete(synchronize_session=False)
+            db.commit()
+            lower = upper
+
+    return archives
+
+
+def read_part(archive: UsageArchive) -> Dict[str, np.ndarray]:
+    """Memory-maps the columns of an archive part as int64 arrays."""
+    path = os.path.join(USAGE_ARCHIVE_DIR, archive.path)
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    dtype = np.dtype("<i8" if meta["byteorder"] == "little" else ">i8")
+    columns = {}
+    for column in meta["columns"]:
+        if meta["rows"] == 0:
+            columns[column] = np.empty(0, dtype=np.int64)
+        else:
+            columns[column] = np.memmap(
+                os.path.join(path, f"{column}.i64"), dtype=dtype, mode="r", shape=(meta["rows"],)
+            )
+    return columns
+
+
+def _get_parts(db: Session, table_name: str, start: datetime, end: datetime) -> List[UsageArchive]:
+    if not USAGE_ARCHIVE_DIR:
+        return []
+    return db.query(UsageArchive).filter(
+        UsageArchive.table_name == table_name,
+        UsageArchive.pruned.is_(True),
+        UsageArchive.start <= end,
+        UsageArchive.end >= start,
+    ).all()
+
+
+def _sum_by_bucket(timestamps: np.ndarray, period: Optional[UsagePeriod],
+                   *values: np.ndarray) -> Dict[Optional[datetime], List[int]]:
+    """Sums up each of `values` per hourly or daily bucket of the timestamps, or overall."""
+    if period is None:
+        return {None: [int(column.sum(dtype=np.int64)) for column in values]}
+
+    step = 3600 if period == UsagePeriod.hour else 86400
+    buckets, inverse = np.unique(timestamps - timestamps % step, return_inverse=True)
+    sums = np.zeros((len(buckets), len(values)), dtype=np.int64)
+    np.add.at(sums, inverse, np.column_stack(values))
+    return {from_timestamp(bucket): total for bucket, total in zip(buckets.tolist(), sums.tolist())}
+
+
+def get_user_usages(db: Session, start: datetime, end: datetime,
+                    period: Optional[UsagePeriod] = None,
+                    user_id: Optional[int] = None,
+                    admins: Optional[List[str]] = None) -> Dict[Tuple[Optional[datetime], int], int]:
+    """
+    Archived user usages within the range, hourly rows and rollups alike. As for the live
+    tables, the range is widened to the hours, days or months it overlaps.
+
+    Returns:
+        Dict[Tuple[Optional[datetime], int], int]: Used traffic by period start (None without
+            a period) and node id (0 for the main core).
+    """
+    totals = defaultdict(int)
+    start, end = to_utc(start), to_utc(end)
+    parts = {
+        table_name: _get_parts(db, table_name, TABLES[table_name][2](start), end)
+        for table_name in USER_USAGE_TABLES
+    }
+    if not any(parts.values()):
+        return totals
+
+    user_ids: Optional[np.ndarray] = None
+    if user_id is not None:
+        user_ids = np.array([user_id], dtype=np.int64)
+    elif admins:
+        user_ids = np.array(
+            [uid for uid, in db.query(User.id).join(Admin).filter(Admin.username.in_(admins))], dtype=np.int64
+        )
+
+    upper = to_timestamp(end)
+    for table_name, table_parts in parts.items():
+        lower = to_timestamp(TABLES[table_name][2](start))
+        for part in table_parts:
+            columns = read_part(part)
+            created_at = columns["created_at"]
+            mask = (created_at >= lower) & (created_at <= upper)
+            if user_ids is not None:
+                mask &= np.isin(columns["user_id"], user_ids)
+            if not mask.any():
+                continue
+            node_id = part.node_id or 0
+            for bucket, (total,) in _sum_by_bucket(created_at[mask], period, columns["used_traffic"][mask]).items():
+                totals[(bucket, node_id)] += total
+    return totals
+
+
+def get_node_usages(db: Session, start: datetime, end: datetime,
+                    period: Optional[UsagePeriod] = None) -> Dict[Tuple[Optional[datetime], int], List[int]]:
+    """
+    Archived node usages within the range.
+
+    Returns:
+        Dict[Tuple[Optional[datetime], int], List[int]]: Uplink and downlink by period start
+            (None without a period) and node id (0 for the main core).
+    """
+    totals = defaultdict(lambda: [0, 0])
+    start, end = to_utc(start), to_utc(end)
+    parts = _get_parts(db, "node_usages", start, end)
+    if not parts:
+        return totals
+
+    lower, upper = to_timestamp(start), to_timestamp(end)
+    for part in parts:
+        columns = read_part(part)
+        created_at = columns["created_at"]
+        mask = (created_at >= lower) & (created_at <= upper)
+        if not mask.any():
+            continue
+        node_id = part.node_id or 0
+        sums = _sum_by_bucket(created_at[mask], period, columns["uplink"][mask], columns["downlink"][mask])
+        for bucket, (uplink, downlink) in sums.items():
+            total = totals[(bucket, node_id)]
+            total[0] += uplink
+            total[1] += downlink
+    return totals
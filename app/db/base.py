@@ -1,28 +1,105 @@
-from sqlalchemy import create_engine
+import threading
+import time
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import QueuePool
 from config import (
     SQLALCHEMY_DATABASE_URL,
     SQLALCHEMY_POOL_SIZE,
     SQLIALCHEMY_MAX_OVERFLOW,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_WAL,
 )
 
 IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith('sqlite')
 
-if IS_SQLITE:
+
+class TimedQueuePool(QueuePool):
+    """The default pool, counting checkouts, their total time and the timed out ones, for /metrics."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_time = 0.0
+        self.timeouts = 0
+        self._stats_lock = threading.Lock()
+
+    def connect(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            with self._stats_lock:
+                self.checkouts += 1
+                self.checkout_time += time.perf_counter() - started
+                self.timeouts += timed_out
+
+
+def is_memory_database(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def create_sqlite_engine(url: str, wal: bool = SQLITE_WAL, read_only: bool = False):
+    """
+    An engine tuned for many threads sharing one SQLite database file.
+
+    In WAL mode readers and the writer don't block each other, and with synchronous=NORMAL
+    commits aren't synced until checkpoints: a power loss may lose the last transactions,
+    but never corrupts the database. Writers wait for each other up to SQLITE_BUSY_TIMEOUT.
+    Read-only engines refuse writes (query_only), for the sessions of endpoints that only
+    read, see `get_read_db`.
+    """
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL,
-        connect_args={"check_same_thread": False}
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT / 1000},
+        # in-memory databases keep their default pool, a single connection per thread
+        poolclass=None if is_memory_database(url) else TimedQueuePool,
     )
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if wal:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE * 1024}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE * 1024 * 1024}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return engine
+
+
+if IS_SQLITE:
+    engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
+    # an in-memory database isn't shared between engines
+    if not is_memory_database(SQLALCHEMY_DATABASE_URL):
+        read_engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL, read_only=True)
+    else:
+        read_engine = engine
 else:
     engine = create_engine(
         SQLALCHEMY_DATABASE_URL,
+        poolclass=TimedQueuePool,
         pool_size=SQLALCHEMY_POOL_SIZE,
         max_overflow=SQLIALCHEMY_MAX_OVERFLOW,
         pool_recycle=3600,
         pool_timeout=10
     )
+    read_engine = engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 
 class Base(DeclarativeBase):
@@ -2,14 +2,16 @@
 Functions for managing proxy hosts, users, user templates, nodes, and administrative tasks.
 """
 
+from collections import defaultdict
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
 
-from sqlalchemy import and_, delete, func, or_
-from sqlalchemy.orm import Query, Session, joinedload
+from sqlalchemy import and_, case, delete, func, insert, or_, select, union_all, update
+from sqlalchemy.orm import Query, Session, aliased, joinedload
 from sqlalchemy.sql.functions import coalesce
 
+from app.db import archive
 from app.db.models import (
     JWT,
     TLS,
@@ -19,6 +21,8 @@ from app.db.models import (
     Node,
     NodeUsage,
     NodeUserUsage,
+    NodeUserUsageDaily,
+    NodeUserUsageMonthly,
     NotificationReminder,
     Proxy,
     ProxyHost,
@@ -27,10 +31,12 @@ from app.db.models import (
     System,
     User,
     UserTemplate,
+    UserTombstone,
     UserUsageResetLogs,
+    excluded_inbounds_association,
 )
 from app.models.admin import AdminCreate, AdminModify, AdminPartialModify
-from app.models.node import NodeCreate, NodeModify, NodeStatus, NodeUsageResponse
+from app.models.node import NodeCreate, NodeModify, NodeStatus, NodeUsageResponse, UsagePeriod
 from app.models.proxy import ProxyHost as ProxyHostModify
 from app.models.user import (
     ReminderType,
@@ -42,8 +48,86 @@ from app.models.user import (
     UserUsageResponse,
 )
 from app.models.user_template import UserTemplateCreate, UserTemplateModify
+from app.subscription import snapshot
+from app.utils import events
 from app.utils.helpers import calculate_expiration_days, calculate_usage_percent
-from config import NOTIFY_DAYS_LEFT, NOTIFY_REACHED_USAGE_PERCENT, USERS_AUTODELETE_DAYS
+from config import (
+    NOTIFY_DAYS_LEFT,
+    NOTIFY_REACHED_USAGE_PERCENT,
+    USER_TOMBSTONE_RETENTION_DAYS,
+    USERS_AUTODELETE_DAYS,
+)
+
+
+def next_revision(db: Session) -> int:
+    """
+    Advances the global revision sequence within the current transaction.
+
+    Args:
+        db (Session): Database session.
+
+    Returns:
+        int: The new revision.
+    """
+    db.query(System).update({System.revision: System.revision + 1}, synchronize_session=False)
+    return db.query(System.revision).scalar()
+
+
+def bump_hosts_revision(db: Session) -> int:
+    """
+    Advances the hosts/config revision within the current transaction.
+
+    Args:
+        db (Session): Database session.
+
+    Returns:
+        int: The new hosts revision.
+    """
+    db.query(System).update({System.hosts_revision: System.hosts_revision + 1}, synchronize_session=False)
+    return db.query(System.hosts_revision).scalar()
+
+
+def get_revisions(db: Session) -> Tuple[int, int]:
+    """
+    Retrieves the current global user revision and hosts revision.
+
+    Args:
+        db (Session): Database session.
+
+    Returns:
+        Tuple[int, int]: The user revision and the hosts revision.
+    """
+    return tuple(db.query(System.revision, System.hosts_revision).first())
+
+
+RESET_STRATEGY_DAYS = {
+    UserDataLimitResetStrategy.day: 1,
+    UserDataLimitResetStrategy.week: 7,
+    UserDataLimitResetStrategy.month: 30,
+    UserDataLimitResetStrategy.year: 365,
+}
+
+
+def _next_reset_at(strategy: UserDataLimitResetStrategy, last_reset: datetime) -> Optional[datetime]:
+    """When the data usage is next reset by the strategy, None if it's never reset."""
+    days = RESET_STRATEGY_DAYS.get(strategy)
+    return last_reset + timedelta(days=days) if days else None
+
+
+def _user_changed(dbuser: User, event: str):
+    """Propagates a committed user change to the subscription snapshots and the event bus."""
+    snapshot.mark_user(dbuser.id)
+    data = events.user_data(dbuser)
+    events.publish(event, data, audience=data["admin"])
+
+
+def _node_data(dbnode: Node) -> dict:
+    return {"id": dbnode.id, "name": dbnode.name, "status": dbnode.status, "message": dbnode.message}
+
+
+def _hosts_changed(db: Session):
+    snapshot.mark_all()
+    events.publish("hosts.updated", {"hosts_revision": get_revisions(db)[1]}, audience=events.EVERYONE)
 
 
 def add_default_host(db: Session, inbound: ProxyInbound):
@@ -122,8 +206,10 @@ def add_host(db: Session, inbound_tag: str, host: ProxyHostModify) -> List[Proxy
             fingerprint=host.fingerprint
         )
     )
+    bump_hosts_revision(db)
     db.commit()
     db.refresh(inbound)
+    _hosts_changed(db)
     return inbound.hosts
 
 
@@ -161,8 +247,10 @@ def update_hosts(db: Session, inbound_tag: str, modified_hosts: List[ProxyHostMo
             use_sni_as_host=host.use_sni_as_host,
         ) for host in modified_hosts
     ]
+    bump_hosts_revision(db)
     db.commit()
     db.refresh(inbound)
+    _hosts_changed(db)
     return inbound.hosts
 
 
@@ -294,7 +382,179 @@ def get_users(db: Session,
     return query.all()
 
 
-def get_user_usages(db: Session, dbuser: User, start: datetime, end: datetime) -> List[UserUsageResponse]:
+def get_user_changes(db: Session,
+                     since_revision: int,
+                     since_id: int = 0,
+                     limit: Optional[int] = None,
+                     admins: Optional[List[str]] = None) -> Tuple[List[User], List[UserTombstone]]:
+    """
+    Retrieves users changed or deleted after the given cursor, oldest change first.
+
+    Changes are ordered by revision then user id, since bulk operations give all the users
+    they change the same revision, and the cursor is the last change the caller has.
+
+    Args:
+        db (Session): Database session.
+        since_revision (int): Revision of the last change the caller has.
+        since_id (int): User id of the last change the caller has, 0 for the whole revision.
+        limit (Optional[int]): Number of changes to retrieve.
+        admins (Optional[List[str]]): List of admin usernames to filter users by.
+
+    Returns:
+        Tuple[List[User], List[UserTombstone]]: The changed users and the deleted users.
+    """
+    def after_cursor(revision, user_id):
+        return or_(revision > since_revision, and_(revision == since_revision, user_id > since_id))
+
+    users = get_user_queryset(db).filter(after_cursor(User.revision, User.id))
+    deleted = db.query(UserTombstone).filter(after_cursor(UserTombstone.revision, UserTombstone.user_id))
+
+    if admins:
+        users = users.filter(User.admin.has(Admin.username.in_(admins)))
+        deleted = deleted.filter(UserTombstone.admin_id.in_(select(Admin.id).where(Admin.username.in_(admins))))
+
+    users = users.order_by(User.revision, User.id)
+    deleted = deleted.order_by(UserTombstone.revision, UserTombstone.user_id)
+    if not limit:
+        return users.all(), deleted.all()
+
+    # each change of the page is among the first `limit` changes of its kind
+    users, deleted = users.limit(limit).all(), deleted.limit(limit).all()
+    page = sorted(
+        [(user.revision, user.id, user) for user in users] + [(t.revision, t.user_id, t) for t in deleted],
+        key=lambda change: change[:2],
+    )[:limit]
+    return (
+        [change for _, _, change in page if isinstance(change, User)],
+        [change for _, _, change in page if isinstance(change, UserTombstone)],
+    )
+
+
+def _add_user_tombstones(db: Session, removed: List[Dict]):
+    """
+    Records the deletion of users under a new revision, in the transaction deleting them,
+    and drops the tombstones older than USER_TOMBSTONE_RETENTION_DAYS.
+
+    Args:
+        db (Session): Database session.
+        removed (List[Dict]): The `events.user_data` of the users, their revision is updated.
+    """
+    revision = next_revision(db)
+    now = datetime.utcnow()
+    admin_ids = dict(db.query(Admin.username, Admin.id).filter(
+        Admin.username.in_({data["admin"] for data in removed if data["admin"]})
+    ).all())
+    db.execute(insert(UserTombstone), [
+        {
+            "user_id": data["id"],
+            "username": data["username"],
+            "admin_id": admin_ids.get(data["admin"]),
+            "revision": revision,
+            "deleted_at": now,
+        }
+        for data in removed
+    ])
+    db.query(UserTombstone) \
+        .filter(UserTombstone.deleted_at < now - timedelta(days=USER_TOMBSTONE_RETENTION_DAYS)) \
+        .delete(synchronize_session=False)
+    for data in removed:
+        data["revision"] = revision
+
+
+def _clear_node_usages(dbuser: User):
+    dbuser.node_usages.clear()
+    dbuser.daily_node_usages.clear()
+    dbuser.monthly_node_usages.clear()
+
+
+def _get_node_names(db: Session) -> Dict[int, str]:
+    """Node names by id, the main core is 0."""
+    return {0: "Master", **dict(db.query(Node.id, Node.name).all())}
+
+
+def _usage_period_column(column, period: UsagePeriod):
+    if period == UsagePeriod.day:
+        return func.date(column)
+    return column  # usages are recorded in hourly rows already, rollups are dated at their start
+
+
+def _to_period_start(value) -> datetime:
+    # sqlite returns date() as a string, other backends as a date
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+def _user_usages_subquery(start: datetime, end: datetime,
+                          user_id: Optional[int] = None,
+                          admins: Optional[List[str]] = None):
+    """
+    Usage rows of the hourly table and its daily and monthly rollups within the range.
+
+    Rows are dated at the start of the hour, day or month they cover and count whole, so the
+    range is widened to the buckets it overlaps: a rolled up day or month is included if
+    any of it is in the range.
+    """
+    hour_start = start.replace(minute=0, second=0, microsecond=0)
+    range_starts = {
+        NodeUserUsage: hour_start,
+        NodeUserUsageDaily: hour_start.replace(hour=0),
+        NodeUserUsageMonthly: hour_start.replace(hour=0, day=1),
+    }
+    selects = []
+    for model, range_start in range_starts.items():
+        stmt = select(model.created_at, model.user_id, model.node_id, model.used_traffic) \
+            .where(model.created_at >= range_start, model.created_at <= end)
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        if admins:
+            stmt = stmt.join(User, User.id == model.user_id) \
+                .join(Admin, Admin.id == User.admin_id) \
+                .where(Admin.username.in_(admins))
+        selects.append(stmt)
+    return union_all(*selects).subquery()
+
+
+def _aggregate_user_usages(db: Session, usages_subquery, period: Optional[UsagePeriod],
+                           archived: Dict[Tuple[Optional[datetime], int], int]) -> List[UserUsageResponse]:
+    node_names = _get_node_names(db)
+    node_id = coalesce(usages_subquery.c.node_id, 0)
+    used_traffic = func.sum(usages_subquery.c.used_traffic)
+
+    if not period:
+        usages = {
+            nid: UserUsageResponse(node_id=nid or None, node_name=name, used_traffic=0)
+            for nid, name in node_names.items()
+        }
+        for nid, total in db.query(node_id, used_traffic).group_by(node_id):
+            if nid in usages:
+                usages[nid].used_traffic = int(total or 0)
+        for (_, nid), total in archived.items():
+            if nid in usages:
+                usages[nid].used_traffic += total
+        return list(usages.values())
+
+    period_start = _usage_period_column(usages_subquery.c.created_at, period)
+    totals = defaultdict(int, archived)
+    for bucket, nid, total in db.query(period_start, node_id, used_traffic).group_by(period_start, node_id):
+        totals[(_to_period_start(bucket), nid)] += int(total or 0)
+
+    return [
+        UserUsageResponse(
+            node_id=nid or None,
+            node_name=node_names[nid],
+            used_traffic=total,
+            period_start=bucket,
+        )
+        for (bucket, nid), total in sorted(totals.items())
+        if nid in node_names
+    ]
+
+
+def get_user_usages(db: Session, dbuser: User, start: datetime, end: datetime,
+                    period: Optional[UsagePeriod] = None) -> List[UserUsageResponse]:
     """
     Retrieves user usages within a specified date range.
 
@@ -303,35 +563,42 @@ def get_user_usages(db: Session, dbuser: User, start: datetime, end: datetime) -
         dbuser (User): The user object.
         start (datetime): Start date for usage retrieval.
         end (datetime): End date for usage retrieval.
+        period (Optional[UsagePeriod]): Splits the usages into hourly or daily buckets if given.
 
     Returns:
         List[UserUsageResponse]: List of user usage responses.
     """
+    archived = archive.get_user_usages(db, start, end, period, user_id=dbuser.id)
+    return _aggregate_user_usages(db, _user_usages_subquery(start, end, user_id=dbuser.id), period, archived)
 
-    usages = {0: UserUsageResponse(  # Main Core
-        node_id=None,
-        node_name="Master",
-        used_traffic=0
-    )}
 
-    for node in db.query(Node).all():
-        usages[node.id] = UserUsageResponse(
-            node_id=node.id,
-            node_name=node.name,
-            used_traffic=0
-        )
+def get_user_usage_buckets(db: Session, start: datetime, end: datetime, period: UsagePeriod,
+                           admins: Optional[List[str]] = None) -> Iterator[Tuple[int, int, datetime, int]]:
+    """
+    Streams the used traffic of every user per hourly or daily bucket within the range.
 
-    cond = and_(NodeUserUsage.user_id == dbuser.id,
-                NodeUserUsage.created_at >= start,
-                NodeUserUsage.created_at <= end)
+    Args:
+        db (Session): Database session.
+        start (datetime): Start date of the range.
+        end (datetime): End date of the range.
+        period (UsagePeriod): Size of the buckets.
+        admins (Optional[List[str]]): Usernames of the admins whose users to include, all users if not given.
 
-    for v in db.query(NodeUserUsage).filter(cond):
-        try:
-            usages[v.node_id or 0].used_traffic += v.used_traffic
-        except KeyError:
-            pass
+    Returns:
+        Iterator[Tuple[int, int, datetime, int]]: User id, admin id (0 if none), period start and used
+            traffic, one row per user and bucket, ordered by admin id and user id.
+    """
+    usages = _user_usages_subquery(start, end, admins=admins)
+    period_start = _usage_period_column(usages.c.created_at, period)
+    admin_id = coalesce(User.admin_id, 0)
+    stmt = select(usages.c.user_id, admin_id, period_start, func.sum(usages.c.used_traffic)) \
+        .join(User, User.id == usages.c.user_id) \
+        .group_by(admin_id, usages.c.user_id, period_start) \
+        .order_by(admin_id, usages.c.user_id) \
+        .execution_options(stream_results=True, yield_per=50000)
 
-    return list(usages.values())
+    for user_id, aid, bucket, used_traffic in db.execute(stmt):
+        yield user_id, aid, _to_period_start(bucket), int(used_traffic or 0)
 
 
 def get_users_count(db: Session, status: UserStatus = None, admin: Admin = None) -> int:
@@ -397,9 +664,13 @@ def create_user(db: Session, user: UserCreate, admin: Admin = None) -> User:
             fire_on_either=user.next_plan.fire_on_either,
         ) if user.next_plan else None
     )
+    dbuser.created_at = datetime.utcnow()
+    dbuser.next_reset_at = _next_reset_at(user.data_limit_reset_strategy, dbuser.created_at)
+    dbuser.revision = next_revision(db)
     db.add(dbuser)
     db.commit()
     db.refresh(dbuser)
+    _user_changed(dbuser, "user.created")
     return dbuser
 
 
@@ -414,8 +685,12 @@ def remove_user(db: Session, dbuser: User) -> User:
     Returns:
         User: The removed user object.
     """
+    data = events.user_data(dbuser)
+    _add_user_tombstones(db, [data])
     db.delete(dbuser)
     db.commit()
+    snapshot.remove_user(dbuser.username)
+    events.publish("user.deleted", data, audience=data["admin"])
     return dbuser
 
 
@@ -427,12 +702,56 @@ def remove_users(db: Session, dbusers: List[User]):
         db (Session): Database session.
         dbusers (List[User]): List of user objects to be removed.
     """
+    removed = [events.user_data(dbuser) for dbuser in dbusers]
+    if removed:
+        _add_user_tombstones(db, removed)
     for dbuser in dbusers:
         db.delete(dbuser)
     db.commit()
+    for data in removed:
+        snapshot.remove_user(data["username"])
+        events.publish("user.deleted", data, audience=data["admin"])
     return
 
 
+def bulk_remove_users(db: Session, users: List, chunk_size: int = 500) -> Dict[str, int]:
+    """
+    Removes users and their dependent rows with bulk DELETE statements, `chunk_size` users
+    per transaction, instead of deleting and cascading ORM objects one by one.
+
+    Args:
+        db (Session): Database session.
+        users (List): Users or rows with their id, username, status, revision and admin.
+        chunk_size (int): Users deleted per transaction, kept under SQLite's bound parameter limit.
+
+    Returns:
+        Dict[str, int]: Number of deleted rows per table.
+    """
+    stats = defaultdict(int)
+    for i in range(0, len(users), chunk_size):
+        chunk = users[i:i + chunk_size]
+        removed = [events.user_data(user) for user in chunk]
+        user_ids = [user.id for user in chunk]
+        proxy_ids = select(Proxy.id).where(Proxy.user_id.in_(user_ids))
+
+        stats[excluded_inbounds_association.name] += db.execute(
+            delete(excluded_inbounds_association).where(excluded_inbounds_association.c.proxy_id.in_(proxy_ids))
+        ).rowcount
+        for model in (Proxy, NodeUserUsage, NodeUserUsageDaily, NodeUserUsageMonthly, NotificationReminder, NextPlan):
+            stats[model.__tablename__] += db.execute(delete(model).where(model.user_id.in_(user_ids))).rowcount
+        # reset logs are kept, like when a user object is deleted
+        db.execute(update(UserUsageResetLogs).where(UserUsageResetLogs.user_id.in_(user_ids)).values(user_id=None))
+        stats[User.__tablename__] += db.execute(delete(User).where(User.id.in_(user_ids))).rowcount
+        _add_user_tombstones(db, removed)
+        db.commit()
+
+        for data in removed:
+            snapshot.remove_user(data["username"])
+            events.publish("user.deleted", data, audience=data["admin"])
+
+    return dict(stats)
+
+
 def update_user(db: Session, dbuser: User, modify: UserModify) -> User:
     """
     Updates a user with new details.
@@ -508,6 +827,7 @@ def update_user(db: Session, dbuser: User, modify: UserModify) -> User:
 
     if modify.data_limit_reset_strategy is not None:
         dbuser.data_limit_reset_strategy = modify.data_limit_reset_strategy.value
+        dbuser.next_reset_at = _next_reset_at(modify.data_limit_reset_strategy, dbuser.last_traffic_reset_time)
 
     if modify.on_hold_timeout is not None:
         dbuser.on_hold_timeout = modify.on_hold_timeout
@@ -526,9 +846,11 @@ def update_user(db: Session, dbuser: User, modify: UserModify) -> User:
         db.delete(dbuser.next_plan)
 
     dbuser.edit_at = datetime.utcnow()
+    dbuser.revision = next_revision(db)
 
     db.commit()
     db.refresh(dbuser)
+    _user_changed(dbuser, "user.updated")
     return dbuser
 
 
@@ -546,24 +868,81 @@ def reset_user_data_usage(db: Session, dbuser: User) -> User:
     usage_log = UserUsageResetLogs(
         user=dbuser,
         used_traffic_at_reset=dbuser.used_traffic,
+        reset_at=datetime.utcnow(),
     )
     db.add(usage_log)
 
     dbuser.used_traffic = 0
-    dbuser.node_usages.clear()
+    dbuser.next_reset_at = _next_reset_at(dbuser.data_limit_reset_strategy, usage_log.reset_at)
+    _clear_node_usages(dbuser)
     if dbuser.status not in (UserStatus.expired or UserStatus.disabled):
         dbuser.status = UserStatus.active.value
 
     if dbuser.next_plan:
         db.delete(dbuser.next_plan)
         dbuser.next_plan = None
+    dbuser.revision = next_revision(db)
     db.add(dbuser)
 
     db.commit()
     db.refresh(dbuser)
+    _user_changed(dbuser, "user.usage_reset")
     return dbuser
 
 
+def reset_due_users_data_usage(db: Session, now: Optional[datetime] = None,
+                               chunk_size: int = 500) -> List[Tuple[int, str, UserStatus]]:
+    """
+    Resets the data usage of the active and limited users whose reset strategy is due,
+    with bulk statements for `chunk_size` users per transaction.
+
+    Args:
+        db (Session): Database session.
+        now (Optional[datetime]): The time the resets are due by, defaults to the current UTC time.
+        chunk_size (int): Users reset per transaction.
+
+    Returns:
+        List[Tuple[int, str, UserStatus]]: ID, username and status before the reset of the reset users.
+    """
+    now = now or datetime.utcnow()
+    admin = aliased(Admin, name="admin")
+    users = db.query(User.id, User.username, User.status, User.revision, User.used_traffic, admin) \
+        .outerjoin(admin, User.admin) \
+        .filter(User.status.in_([UserStatus.active, UserStatus.limited]), User.next_reset_at <= now) \
+        .order_by(User.id) \
+        .all()
+
+    next_reset_at = case(
+        {strategy: now + timedelta(days=days) for strategy, days in RESET_STRATEGY_DAYS.items()},
+        value=User.data_limit_reset_strategy,
+    )
+    for i in range(0, len(users), chunk_size):
+        chunk = users[i:i + chunk_size]
+        user_ids = [user.id for user in chunk]
+
+        db.execute(insert(UserUsageResetLogs), [
+            {"user_id": user.id, "used_traffic_at_reset": user.used_traffic, "reset_at": now} for user in chunk
+        ])
+        for model in (NodeUserUsage, NodeUserUsageDaily, NodeUserUsageMonthly, NextPlan):
+            db.execute(delete(model).where(model.user_id.in_(user_ids)))
+        revision = next_revision(db)
+        db.query(User).filter(User.id.in_(user_ids)).update({
+            User.used_traffic: 0,
+            User.status: UserStatus.active,
+            User.next_reset_at: next_reset_at,
+            User.revision: revision,
+        }, synchronize_session=False)
+        db.commit()
+
+        for user in chunk:
+            snapshot.mark_user(user.id)
+            data = events.user_data(user)
+            events.publish("user.usage_reset", {**data, "status": UserStatus.active, "revision": revision},
+                           audience=data["admin"])
+
+    return [(user.id, user.username, user.status) for user in users]
+
+
 def reset_user_by_next(db: Session, dbuser: User) -> User:
     """
     Resets the data usage of a user based on next user.
@@ -582,11 +961,13 @@ def reset_user_by_next(db: Session, dbuser: User) -> User:
     usage_log = UserUsageResetLogs(
         user=dbuser,
         used_traffic_at_reset=dbuser.used_traffic,
+        reset_at=datetime.utcnow(),
     )
     db.add(usage_log)
 
-    dbuser.node_usages.clear()
+    _clear_node_usages(dbuser)
     dbuser.status = UserStatus.active.value
+    dbuser.next_reset_at = _next_reset_at(dbuser.data_limit_reset_strategy, usage_log.reset_at)
 
     dbuser.data_limit = dbuser.next_plan.data_limit + \
         (0 if dbuser.next_plan.add_remaining_traffic else dbuser.data_limit - dbuser.used_traffic)
@@ -595,10 +976,12 @@ def reset_user_by_next(db: Session, dbuser: User) -> User:
     dbuser.used_traffic = 0
     db.delete(dbuser.next_plan)
     dbuser.next_plan = None
+    dbuser.revision = next_revision(db)
     db.add(dbuser)
 
     db.commit()
     db.refresh(dbuser)
+    _user_changed(dbuser, "user.next_plan_applied")
     return dbuser
 
 
@@ -659,18 +1042,25 @@ def reset_all_users_data_usage(db: Session, admin: Optional[Admin] = None):
     if admin:
         query = query.filter(User.admin == admin)
 
+    revision = next_revision(db)
     for dbuser in query.all():
+        dbuser.revision = revision
         dbuser.used_traffic = 0
         if dbuser.status not in [UserStatus.on_hold, UserStatus.expired, UserStatus.disabled]:
             dbuser.status = UserStatus.active
         dbuser.usage_logs.clear()
-        dbuser.node_usages.clear()
+        # without reset logs the next reset is counted from the creation again
+        dbuser.next_reset_at = _next_reset_at(dbuser.data_limit_reset_strategy, dbuser.created_at)
+        _clear_node_usages(dbuser)
         if dbuser.next_plan:
             db.delete(dbuser.next_plan)
             dbuser.next_plan = None
         db.add(dbuser)
 
     db.commit()
+    snapshot.mark_all()
+    events.publish("users.usage_reset", {"admin": admin.username if admin else None},
+                   audience=admin.username if admin else events.EVERYONE)
 
 
 def disable_all_active_users(db: Session, admin: Optional[Admin] = None):
@@ -685,9 +1075,16 @@ def disable_all_active_users(db: Session, admin: Optional[Admin] = None):
     if admin:
         query = query.filter(User.admin == admin)
 
-    query.update({User.status: UserStatus.disabled, User.last_status_change: datetime.utcnow()}, synchronize_session=False)
+    query.update({
+        User.status: UserStatus.disabled,
+        User.last_status_change: datetime.utcnow(),
+        User.revision: next_revision(db),
+    }, synchronize_session=False)
 
     db.commit()
+    snapshot.mark_all()
+    events.publish("users.disabled", {"admin": admin.username if admin else None},
+                   audience=admin.username if admin else events.EVERYONE)
 
 
 def activate_all_disabled_users(db: Session, admin: Optional[Admin] = None):
@@ -708,16 +1105,41 @@ def activate_all_disabled_users(db: Session, admin: Optional[Admin] = None):
         query_for_active_users = query_for_active_users.filter(User.admin == admin)
         query_for_on_hold_users = query_for_on_hold_users.filter(User.admin == admin)
 
+    revision = next_revision(db)
     query_for_on_hold_users.update(
-        {User.status: UserStatus.on_hold, User.last_status_change: datetime.utcnow()}, synchronize_session=False)
+        {User.status: UserStatus.on_hold, User.last_status_change: datetime.utcnow(), User.revision: revision},
+        synchronize_session=False)
     query_for_active_users.update(
-        {User.status: UserStatus.active, User.last_status_change: datetime.utcnow()}, synchronize_session=False)
+        {User.status: UserStatus.active, User.last_status_change: datetime.utcnow(), User.revision: revision},
+        synchronize_session=False)
 
     db.commit()
+    snapshot.mark_all()
+    events.publish("users.activated", {"admin": admin.username if admin else None},
+                   audience=admin.username if admin else events.EVERYONE)
+
+
+def _autodelete_due(db: Session, statuses: List[UserStatus], now: datetime):
+    """
+    Filter for users whose auto-delete time has passed, or None if no user can be auto-deleted.
+
+    The auto-delete days of users take few distinct values, so the filter compares
+    `last_status_change` with a precomputed datetime per value instead of doing date
+    arithmetic in SQL, which differs between dialects (SQLite stores datetimes as text).
+    """
+    auto_delete = coalesce(User.auto_delete_in_days, USERS_AUTODELETE_DAYS)
+    days = [d for d, in db.query(auto_delete).filter(auto_delete >= 0, User.status.in_(statuses)).distinct()]
+    if not days:
+        return None
+    return or_(*(
+        and_(auto_delete == d, User.last_status_change <= now - timedelta(days=d))
+        for d in days
+    ))
 
 
 def autodelete_expired_users(db: Session,
-                             include_limited_users: bool = False) -> List[User]:
+                             include_limited_users: bool = False,
+                             dry_run: bool = False) -> Tuple[List[Tuple[int, str, Optional[Admin]]], Dict[str, int]]:
     """
     Deletes expired (optionally also limited) users whose auto-delete time has passed.
 
@@ -725,39 +1147,62 @@ def autodelete_expired_users(db: Session,
         db (Session): Database session
         include_limited_users (bool, optional): Whether to delete limited users as well.
             Defaults to False.
+        dry_run (bool, optional): Only find the users without deleting them. Defaults to False.
 
     Returns:
-        list[User]: List of deleted users.
+        Tuple[List[Tuple[int, str, Optional[Admin]]], Dict[str, int]]: ID, username and admin of the
+            deleted users, and the number of deleted rows per table.
     """
     target_status = (
         [UserStatus.expired] if not include_limited_users
         else [UserStatus.expired, UserStatus.limited]
     )
 
-    auto_delete = coalesce(User.auto_delete_in_days, USERS_AUTODELETE_DAYS)
+    due = _autodelete_due(db, target_status, datetime.utcnow())
+    if due is None:
+        return [], {}
 
-    query = db.query(
-        User, auto_delete,  # Use global auto-delete days as fallback
-    ).filter(
-        auto_delete >= 0,  # Negative values prevent auto-deletion
-        User.status.in_(target_status),
-    ).options(joinedload(User.admin))
-
-    # TODO: Handle time filter in query itself (NOTE: Be careful with sqlite's strange datetime handling)
-    expired_users = [
-        user
-        for (user, auto_delete) in query
-        if user.last_status_change + timedelta(days=auto_delete) <= datetime.utcnow()
-    ]
+    admin = aliased(Admin, name="admin")
+    users = db.query(User.id, User.username, User.status, User.revision, admin) \
+        .outerjoin(admin, User.admin) \
+        .filter(User.status.in_(target_status), due) \
+        .order_by(User.id) \
+        .all()
+
+    stats = {}
+    if users and not dry_run:
+        stats = bulk_remove_users(db, users)
 
-    if expired_users:
-        remove_users(db, expired_users)
+    return [(user.id, user.username, user.admin) for user in users], stats
 
-    return expired_users
+
+def get_expired_users(db: Session, expired_after: datetime, expired_before: datetime,
+                      admin: Optional[Admin] = None) -> List[User]:
+    """
+    Retrieves expired and limited users whose expiry is within the range.
+
+    Args:
+        db (Session): Database session.
+        expired_after (datetime): Start of the range.
+        expired_before (datetime): End of the range.
+        admin (Optional[Admin]): Only users of this admin, if given.
+
+    Returns:
+        List[User]: List of user objects.
+    """
+    query = get_user_queryset(db).filter(
+        User.status.in_([UserStatus.expired, UserStatus.limited]),
+        User.expire.isnot(None),
+        User.expire.between(int(expired_after.timestamp()), int(expired_before.timestamp())),
+    )
+    if admin:
+        query = query.filter(User.admin == admin)
+    return query.all()
 
 
 def get_all_users_usages(
-        db: Session, admin: Admin, start: datetime, end: datetime
+        db: Session, admin: Optional[List[str]], start: datetime, end: datetime,
+        period: Optional[UsagePeriod] = None
 ) -> List[UserUsageResponse]:
     """
     Retrieves usage data for all users associated with an admin within a specified time range.
@@ -767,42 +1212,17 @@ def get_all_users_usages(
 
     Args:
         db (Session): Database session for querying.
-        admin (Admin): The admin user for which to retrieve user usage data.
+        admin (Optional[List[str]]): Usernames of the admins whose users to include, all users if not given.
         start (datetime): The start date and time of the period to consider.
         end (datetime): The end date and time of the period to consider.
+        period (Optional[UsagePeriod]): Splits the usages into hourly or daily buckets if given.
 
     Returns:
         List[UserUsageResponse]: A list of UserUsageResponse objects, each representing
         the usage data for a specific node or the main core.
     """
-    usages = {0: UserUsageResponse(  # Main Core
-        node_id=None,
-        node_name="Master",
-        used_traffic=0
-    )}
-
-    for node in db.query(Node).all():
-        usages[node.id] = UserUsageResponse(
-            node_id=node.id,
-            node_name=node.name,
-            used_traffic=0
-        )
-
-    admin_users = set(user.id for user in get_users(db=db, admins=admin))
-
-    cond = and_(
-        NodeUserUsage.created_at >= start,
-        NodeUserUsage.created_at <= end,
-        NodeUserUsage.user_id.in_(admin_users)
-    )
-
-    for v in db.query(NodeUserUsage).filter(cond):
-        try:
-            usages[v.node_id or 0].used_traffic += v.used_traffic
-        except KeyError:
-            pass
-
-    return list(usages.values())
+    archived = archive.get_user_usages(db, start, end, period, admins=admin)
+    return _aggregate_user_usages(db, _user_usages_subquery(start, end, admins=admin), period, archived)
 
 
 def update_user_status(db: Session, dbuser: User, status: UserStatus) -> User:
@@ -819,8 +1239,10 @@ def update_user_status(db: Session, dbuser: User, status: UserStatus) -> User:
     """
     dbuser.status = status
     dbuser.last_status_change = datetime.utcnow()
+    dbuser.revision = next_revision(db)
     db.commit()
     db.refresh(dbuser)
+    _user_changed(dbuser, "user.status_changed")
     return dbuser
 
 
@@ -837,8 +1259,10 @@ def set_owner(db: Session, dbuser: User, admin: Admin) -> User:
         User: The updated user object.
     """
     dbuser.admin = admin
+    dbuser.revision = next_revision(db)
     db.commit()
     db.refresh(dbuser)
+    _user_changed(dbuser, "user.owner_changed")
     return dbuser
 
 
@@ -857,8 +1281,10 @@ def start_user_expire(db: Session, dbuser: User) -> User:
     dbuser.expire = expire
     dbuser.on_hold_expire_duration = None
     dbuser.on_hold_timeout = None
+    dbuser.revision = next_revision(db)
     db.commit()
     db.refresh(dbuser)
+    _user_changed(dbuser, "user.expire_started")
     return dbuser
 
 
@@ -1254,7 +1680,8 @@ def get_nodes(db: Session,
     return query.all()
 
 
-def get_nodes_usage(db: Session, start: datetime, end: datetime) -> List[NodeUsageResponse]:
+def get_nodes_usage(db: Session, start: datetime, end: datetime,
+                    period: Optional[UsagePeriod] = None) -> List[NodeUsageResponse]:
     """
     Retrieves usage data for all nodes within a specified time range.
 
@@ -1262,35 +1689,50 @@ def get_nodes_usage(db: Session, start: datetime, end: datetime) -> List[NodeUsa
         db (Session): The database session.
         start (datetime): The start time of the usage period.
         end (datetime): The end time of the usage period.
+        period (Optional[UsagePeriod]): Splits the usages into hourly or daily buckets if given.
 
     Returns:
         List[NodeUsageResponse]: A list of NodeUsageResponse objects containing usage data.
     """
-    usages = {0: NodeUsageResponse(  # Main Core
-        node_id=None,
-        node_name="Master",
-        uplink=0,
-        downlink=0
-    )}
-
-    for node in db.query(Node).all():
-        usages[node.id] = NodeUsageResponse(
-            node_id=node.id,
-            node_name=node.name,
-            uplink=0,
-            downlink=0
+    node_names = _get_node_names(db)
+    node_id = coalesce(NodeUsage.node_id, 0)
+    totals = (func.sum(NodeUsage.uplink), func.sum(NodeUsage.downlink))
+    query = db.query(NodeUsage).filter(NodeUsage.created_at >= start, NodeUsage.created_at <= end)
+
+    archived = archive.get_node_usages(db, start, end, period)
+
+    if not period:
+        usages = {
+            nid: NodeUsageResponse(node_id=nid or None, node_name=name, uplink=0, downlink=0)
+            for nid, name in node_names.items()
+        }
+        for nid, uplink, downlink in query.with_entities(node_id, *totals).group_by(node_id):
+            if nid in usages:
+                usages[nid].uplink = int(uplink or 0)
+                usages[nid].downlink = int(downlink or 0)
+        for (_, nid), (uplink, downlink) in archived.items():
+            if nid in usages:
+                usages[nid].uplink += uplink
+                usages[nid].downlink += downlink
+        return list(usages.values())
+
+    period_start = _usage_period_column(NodeUsage.created_at, period)
+    for bucket, nid, uplink, downlink in query.with_entities(period_start, node_id, *totals).group_by(period_start, node_id):
+        total = archived[(_to_period_start(bucket), nid)]
+        total[0] += int(uplink or 0)
+        total[1] += int(downlink or 0)
+
+    return [
+        NodeUsageResponse(
+            node_id=nid or None,
+            node_name=node_names[nid],
+            uplink=uplink,
+            downlink=downlink,
+            period_start=bucket,
         )
-
-    cond = and_(NodeUsage.created_at >= start, NodeUsage.created_at <= end)
-
-    for v in db.query(NodeUsage).filter(cond):
-        try:
-            usages[v.node_id or 0].uplink += v.uplink
-            usages[v.node_id or 0].downlink += v.downlink
-        except KeyError:
-            pass
-
-    return list(usages.values())
+        for (bucket, nid), (uplink, downlink) in sorted(archived.items())
+        if nid in node_names
+    ]
 
 
 def create_node(db: Session, node: NodeCreate) -> Node:
@@ -1312,6 +1754,7 @@ def create_node(db: Session, node: NodeCreate) -> Node:
     db.add(dbnode)
     db.commit()
     db.refresh(dbnode)
+    events.publish("node.created", _node_data(dbnode))
     return dbnode
 
 
@@ -1326,8 +1769,10 @@ def remove_node(db: Session, dbnode: Node) -> Node:
     Returns:
         Node: The removed Node object.
     """
+    data = _node_data(dbnode)
     db.delete(dbnode)
     db.commit()
+    events.publish("node.deleted", data)
     return dbnode
 
 
@@ -1367,6 +1812,7 @@ def update_node(db: Session, dbnode: Node, modify: NodeModify) -> Node:
 
     db.commit()
     db.refresh(dbnode)
+    events.publish("node.updated", _node_data(dbnode))
     return dbnode
 
 
@@ -1390,6 +1836,7 @@ def update_node_status(db: Session, dbnode: Node, status: NodeStatus, message: s
     dbnode.last_status_change = datetime.utcnow()
     db.commit()
     db.refresh(dbnode)
+    events.publish("node.status_changed", _node_data(dbnode))
     return dbnode
 
 
@@ -1455,6 +1902,24 @@ def get_notification_reminder(
     return reminder
 
 
+def get_notification_reminder_keys(
+        db: Session, now: Optional[datetime] = None) -> Set[Tuple[int, ReminderType, Optional[int]]]:
+    """
+    Retrieves the keys of all unexpired notification reminders in one query.
+
+    Args:
+        db (Session): The database session.
+        now (Optional[datetime]): The time reminders are checked at, defaults to the current UTC time.
+
+    Returns:
+        Set[Tuple[int, ReminderType, Optional[int]]]: (user_id, type, threshold) of every unexpired reminder.
+    """
+    now = now or datetime.utcnow()
+    query = db.query(NotificationReminder.user_id, NotificationReminder.type, NotificationReminder.threshold) \
+        .filter(or_(NotificationReminder.expires_at.is_(None), NotificationReminder.expires_at >= now))
+    return {(user_id, reminder_type, threshold) for user_id, reminder_type, threshold in query}
+
+
 def delete_notification_reminder_by_type(
         db: Session, user_id: int, reminder_type: ReminderType, threshold: Optional[int] = None
 ) -> None:
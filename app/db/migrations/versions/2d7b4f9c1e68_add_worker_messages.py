@@ -0,0 +1,33 @@
+"""add worker messages
+
+Revision ID: 2d7b4f9c1e68
+Revises: 6c2f0b8e3a91
+Create Date: 2026-10-19 21:12:40.518203
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '2d7b4f9c1e68'
+down_revision = '6c2f0b8e3a91'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('worker_messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sender', sa.String(length=16), nullable=False),
+        sa.Column('leader_only', sa.Boolean(), nullable=False),
+        sa.Column('type', sa.String(length=64), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_worker_messages_created_at'), 'worker_messages', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_worker_messages_created_at'), table_name='worker_messages')
+    op.drop_table('worker_messages')
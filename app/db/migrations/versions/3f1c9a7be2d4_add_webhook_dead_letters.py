@@ -0,0 +1,31 @@
+"""add webhook dead letters
+
+Revision ID: 3f1c9a7be2d4
+Revises: 591249022938
+Create Date: 2026-10-19 18:12:40.518302
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7be2d4'
+down_revision = '591249022938'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('webhook_dead_letters',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('address', sa.String(length=1024), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('tries', sa.Integer(), nullable=False),
+        sa.Column('error', sa.String(length=1024), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('webhook_dead_letters')
@@ -0,0 +1,39 @@
+"""add usage archives
+
+Revision ID: 591249022938
+Revises: d770640cc6fb
+Create Date: 2026-10-19 17:03:18.220945
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '591249022938'
+down_revision = 'd770640cc6fb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('usage_archives',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('table_name', sa.String(length=64), nullable=False),
+        sa.Column('node_id', sa.Integer(), nullable=True),
+        sa.Column('month', sa.String(length=7), nullable=False),
+        sa.Column('path', sa.String(length=512), nullable=False),
+        sa.Column('rows', sa.BigInteger(), nullable=False),
+        sa.Column('min_id', sa.BigInteger(), nullable=False),
+        sa.Column('max_id', sa.BigInteger(), nullable=False),
+        sa.Column('start', sa.DateTime(), nullable=False),
+        sa.Column('end', sa.DateTime(), nullable=False),
+        sa.Column('pruned', sa.Boolean(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_usage_archives_table_name'), 'usage_archives', ['table_name'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_usage_archives_table_name'), table_name='usage_archives')
+    op.drop_table('usage_archives')
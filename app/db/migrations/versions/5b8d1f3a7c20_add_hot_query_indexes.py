@@ -0,0 +1,35 @@
+"""add hot query indexes
+
+Revision ID: 5b8d1f3a7c20
+Revises: 9e3a5c7d2b14
+Create Date: 2026-10-19 21:12:40.518302
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5b8d1f3a7c20'
+down_revision = '9e3a5c7d2b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_status_expire', 'users', ['status', 'expire'], unique=False)
+    op.create_index('ix_users_admin_id_status', 'users', ['admin_id', 'status'], unique=False)
+    op.create_index(op.f('ix_users_online_at'), 'users', ['online_at'], unique=False)
+    op.create_index(op.f('ix_proxies_user_id'), 'proxies', ['user_id'], unique=False)
+    op.create_index(op.f('ix_next_plans_user_id'), 'next_plans', ['user_id'], unique=False)
+    op.create_index(op.f('ix_user_usage_logs_user_id'), 'user_usage_logs', ['user_id'], unique=False)
+    op.create_index('ix_notification_reminders_user_id_type_threshold', 'notification_reminders',
+                    ['user_id', 'type', 'threshold'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notification_reminders_user_id_type_threshold', table_name='notification_reminders')
+    op.drop_index(op.f('ix_user_usage_logs_user_id'), table_name='user_usage_logs')
+    op.drop_index(op.f('ix_next_plans_user_id'), table_name='next_plans')
+    op.drop_index(op.f('ix_proxies_user_id'), table_name='proxies')
+    op.drop_index(op.f('ix_users_online_at'), table_name='users')
+    op.drop_index('ix_users_admin_id_status', table_name='users')
+    op.drop_index('ix_users_status_expire', table_name='users')
@@ -0,0 +1,72 @@
+"""add user next_reset_at
+
+Revision ID: 6c2f0b8e3a91
+Revises: 8a4e0d6c51f7
+Create Date: 2026-10-19 21:12:40.118305
+
+"""
+from datetime import timedelta
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '6c2f0b8e3a91'
+down_revision = '8a4e0d6c51f7'
+branch_labels = None
+depends_on = None
+
+reset_strategy_to_days = {'day': 1, 'week': 7, 'month': 30, 'year': 365}
+
+users_table = sa.Table(
+    'users',
+    sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('data_limit_reset_strategy', sa.String),
+    sa.Column('created_at', sa.DateTime),
+    sa.Column('next_reset_at', sa.DateTime),
+)
+
+usage_logs_table = sa.Table(
+    'user_usage_logs',
+    sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('user_id', sa.Integer),
+    sa.Column('reset_at', sa.DateTime),
+)
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('next_reset_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_users_next_reset_at'), 'users', ['next_reset_at'], unique=False)
+
+    # the next reset is counted from the last reset, or the creation of users never reset
+    connection = op.get_bind()
+    last_resets = sa.select(
+        usage_logs_table.c.user_id,
+        sa.func.max(usage_logs_table.c.reset_at).label('reset_at'),
+    ).group_by(usage_logs_table.c.user_id).subquery()
+    rows = connection.execute(
+        sa.select(users_table.c.id, users_table.c.data_limit_reset_strategy,
+                  sa.func.coalesce(last_resets.c.reset_at, users_table.c.created_at))
+        .outerjoin(last_resets, last_resets.c.user_id == users_table.c.id)
+        .where(users_table.c.data_limit_reset_strategy.in_(reset_strategy_to_days))
+    ).all()
+
+    values = [
+        {'user_id': user_id, 'next_reset_at': last_reset + timedelta(days=reset_strategy_to_days[strategy])}
+        for user_id, strategy, last_reset in rows
+        if last_reset is not None
+    ]
+    if values:
+        connection.execute(
+            users_table.update()
+            .where(users_table.c.id == sa.bindparam('user_id'))
+            .values(next_reset_at=sa.bindparam('next_reset_at')),
+            values,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_next_reset_at'), table_name='users')
+    op.drop_column('users', 'next_reset_at')
@@ -0,0 +1,37 @@
+"""add user tombstones
+
+Revision ID: 7d4e2a9c1b53
+Revises: 5b8d1f3a7c20
+Create Date: 2026-10-19 23:05:12.730114
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '7d4e2a9c1b53'
+down_revision = '5b8d1f3a7c20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=34), nullable=False),
+        sa.Column('admin_id', sa.Integer(), nullable=True),
+        sa.Column('revision', sa.BigInteger(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['admin_id'], ['admins.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_user_tombstones_revision'), 'user_tombstones', ['revision'], unique=False)
+    op.create_index(op.f('ix_user_tombstones_deleted_at'), 'user_tombstones', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_user_tombstones_deleted_at'), table_name='user_tombstones')
+    op.drop_index(op.f('ix_user_tombstones_revision'), table_name='user_tombstones')
+    op.drop_table('user_tombstones')
@@ -0,0 +1,35 @@
+"""add webhook outbox
+
+Revision ID: 8a4e0d6c51f7
+Revises: 3f1c9a7be2d4
+Create Date: 2026-10-19 19:04:55.731640
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '8a4e0d6c51f7'
+down_revision = '3f1c9a7be2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('webhook_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('endpoint', sa.String(length=16), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('tries', sa.Integer(), nullable=False),
+        sa.Column('due_at', sa.DateTime(), nullable=False),
+        sa.Column('claim', sa.String(length=16), nullable=True),
+        sa.Column('claimed_until', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_webhook_outbox_endpoint_id', 'webhook_outbox', ['endpoint', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_webhook_outbox_endpoint_id', table_name='webhook_outbox')
+    op.drop_table('webhook_outbox')
@@ -0,0 +1,30 @@
+"""add subscription config
+
+Revision ID: 9e3a5c7d2b14
+Revises: 2d7b4f9c1e68
+Create Date: 2026-10-19 22:03:17.402915
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '9e3a5c7d2b14'
+down_revision = '2d7b4f9c1e68'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('subscription_config',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('revision', sa.BigInteger(), nullable=False),
+        sa.Column('inbounds', sa.JSON(), nullable=False),
+        sa.Column('hosts', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('subscription_config')
@@ -0,0 +1,43 @@
+"""add daily and monthly rollups of node user usages
+
+Revision ID: d770640cc6fb
+Revises: ef2625041929
+Create Date: 2026-10-19 16:12:41.502317
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd770640cc6fb'
+down_revision = 'ef2625041929'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ('node_user_usages_daily', 'node_user_usages_monthly'):
+        op.create_table(table,
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('node_id', sa.Integer(), nullable=True),
+            sa.Column('used_traffic', sa.BigInteger(), nullable=True),
+            sa.ForeignKeyConstraint(['node_id'], ['nodes.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('created_at', 'user_id', 'node_id')
+        )
+
+    for table in ('node_user_usages', 'node_user_usages_daily', 'node_user_usages_monthly'):
+        op.create_index(f'ix_{table}_user_id_created_at', table, ['user_id', 'created_at'], unique=False)
+        op.create_index(f'ix_{table}_node_id_created_at', table, ['node_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    for table in ('node_user_usages', 'node_user_usages_daily', 'node_user_usages_monthly'):
+        op.drop_index(f'ix_{table}_node_id_created_at', table_name=table)
+        op.drop_index(f'ix_{table}_user_id_created_at', table_name=table)
+
+    op.drop_table('node_user_usages_monthly')
+    op.drop_table('node_user_usages_daily')
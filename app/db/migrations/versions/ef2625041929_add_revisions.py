@@ -0,0 +1,29 @@
+"""add revisions
+
+Revision ID: ef2625041929
+Revises: 2b231de97dc3
+Create Date: 2026-10-19 14:40:05.906548
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'ef2625041929'
+down_revision = '2b231de97dc3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('system', sa.Column('revision', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('system', sa.Column('hosts_revision', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('revision', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_users_revision'), 'users', ['revision'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_revision'), table_name='users')
+    op.drop_column('users', 'revision')
+    op.drop_column('system', 'hosts_revision')
+    op.drop_column('system', 'revision')
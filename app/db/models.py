@@ -10,6 +10,7 @@ from sqlalchemy import (
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
@@ -61,6 +62,11 @@ class AdminUsageLogs(Base):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # review and expiry jobs filter by status, then by expire
+        Index('ix_users_status_expire', 'status', 'expire'),
+        Index('ix_users_admin_id_status', 'admin_id', 'status'),
+    )
 
     id = Column(Integer, primary_key=True)
     username = Column(String(34, collation='NOCASE'), unique=True, index=True)
@@ -68,6 +74,8 @@ class User(Base):
     status = Column(Enum(UserStatus), nullable=False, default=UserStatus.active)
     used_traffic = Column(BigInteger, default=0)
     node_usages = relationship("NodeUserUsage", back_populates="user", cascade="all, delete-orphan")
+    daily_node_usages = relationship("NodeUserUsageDaily", back_populates="user", cascade="all, delete-orphan")
+    monthly_node_usages = relationship("NodeUserUsageMonthly", back_populates="user", cascade="all, delete-orphan")
     notification_reminders = relationship("NotificationReminder", back_populates="user", cascade="all, delete-orphan")
     data_limit = Column(BigInteger, nullable=True)
     data_limit_reset_strategy = Column(
@@ -84,7 +92,7 @@ class User(Base):
     sub_last_user_agent = Column(String(512), nullable=True, default=None)
     created_at = Column(DateTime, default=datetime.utcnow)
     note = Column(String(500), nullable=True, default=None)
-    online_at = Column(DateTime, nullable=True, default=None)
+    online_at = Column(DateTime, nullable=True, default=None, index=True)
     on_hold_expire_duration = Column(BigInteger, nullable=True, default=None)
     on_hold_timeout = Column(DateTime, nullable=True, default=None)
 
@@ -95,6 +103,10 @@ class User(Base):
 
     edit_at = Column(DateTime, nullable=True, default=None)
     last_status_change = Column(DateTime, default=datetime.utcnow, nullable=True)
+    # when the data usage is due to be reset by the reset strategy, NULL for no_reset
+    next_reset_at = Column(DateTime, nullable=True, default=None, index=True)
+    # value of the global revision sequence (system.revision) at the user's last change
+    revision = Column(BigInteger, nullable=False, default=0, server_default="0", index=True)
 
     next_plan = relationship(
         "NextPlan",
@@ -165,7 +177,7 @@ class NextPlan(Base):
     __tablename__ = 'next_plans'
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     data_limit = Column(BigInteger, nullable=False)
     expire = Column(Integer, nullable=True)
     add_remaining_traffic = Column(Boolean, nullable=False, default=False, server_default='0')
@@ -193,7 +205,7 @@ class UserUsageResetLogs(Base):
     __tablename__ = "user_usage_logs"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     user = relationship("User", back_populates="usage_logs")
     used_traffic_at_reset = Column(BigInteger, nullable=False)
     reset_at = Column(DateTime, default=datetime.utcnow)
@@ -203,7 +215,7 @@ class Proxy(Base):
     __tablename__ = "proxies"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     user = relationship("User", back_populates="proxies")
     type = Column(Enum(ProxyTypes), nullable=False)
     settings = Column(JSON, nullable=False)
@@ -267,12 +279,38 @@ class ProxyHost(Base):
     use_sni_as_host = Column(Boolean, nullable=False, default=False, server_default="0")
 
 
+class UserTombstone(Base):
+    """A deleted user, kept for clients syncing users from `/api/users/changes`."""
+    __tablename__ = "user_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    username = Column(String(34), nullable=False)
+    admin_id = Column(Integer, ForeignKey("admins.id", ondelete="SET NULL"), nullable=True)
+    # value of the global revision sequence (system.revision) at the deletion
+    revision = Column(BigInteger, nullable=False, index=True)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
 class System(Base):
     __tablename__ = "system"
 
     id = Column(Integer, primary_key=True)
     uplink = Column(BigInteger, default=0)
     downlink = Column(BigInteger, default=0)
+    revision = Column(BigInteger, nullable=False, default=0, server_default="0")
+    hosts_revision = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+
+class SubscriptionConfig(Base):
+    """Inbounds and hosts published by the panel for standalone subscription servers, a single row."""
+    __tablename__ = "subscription_config"
+
+    id = Column(Integer, primary_key=True)
+    revision = Column(BigInteger, nullable=False, default=0)
+    inbounds = Column(JSON, nullable=False)
+    hosts = Column(JSON, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class JWT(Base):
@@ -308,6 +346,8 @@ class Node(Base):
     uplink = Column(BigInteger, default=0)
     downlink = Column(BigInteger, default=0)
     user_usages = relationship("NodeUserUsage", back_populates="node", cascade="all, delete-orphan")
+    daily_user_usages = relationship("NodeUserUsageDaily", back_populates="node", cascade="all, delete-orphan")
+    monthly_user_usages = relationship("NodeUserUsageMonthly", back_populates="node", cascade="all, delete-orphan")
     usages = relationship("NodeUsage", back_populates="node", cascade="all, delete-orphan")
     usage_coefficient = Column(Float, nullable=False, server_default=text("1.0"), default=1)
 
@@ -316,6 +356,8 @@ class NodeUserUsage(Base):
     __tablename__ = "node_user_usages"
     __table_args__ = (
         UniqueConstraint('created_at', 'user_id', 'node_id'),
+        Index('ix_node_user_usages_user_id_created_at', 'user_id', 'created_at'),
+        Index('ix_node_user_usages_node_id_created_at', 'node_id', 'created_at'),
     )
 
     id = Column(Integer, primary_key=True)
@@ -327,6 +369,60 @@ class NodeUserUsage(Base):
     used_traffic = Column(BigInteger, default=0)
 
 
+# hourly usages older than USAGE_HOURLY_RETENTION_DAYS are rolled up into daily rows,
+# and daily ones older than USAGE_DAILY_RETENTION_DAYS into monthly rows (see jobs/compact_usages.py)
+class NodeUserUsageDaily(Base):
+    __tablename__ = "node_user_usages_daily"
+    __table_args__ = (
+        UniqueConstraint('created_at', 'user_id', 'node_id'),
+        Index('ix_node_user_usages_daily_user_id_created_at', 'user_id', 'created_at'),
+        Index('ix_node_user_usages_daily_node_id_created_at', 'node_id', 'created_at'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, unique=False, nullable=False)  # one day per record
+    user_id = Column(Integer, ForeignKey("users.id"))
+    user = relationship("User", back_populates="daily_node_usages")
+    node_id = Column(Integer, ForeignKey("nodes.id"))
+    node = relationship("Node", back_populates="daily_user_usages")
+    used_traffic = Column(BigInteger, default=0)
+
+
+class NodeUserUsageMonthly(Base):
+    __tablename__ = "node_user_usages_monthly"
+    __table_args__ = (
+        UniqueConstraint('created_at', 'user_id', 'node_id'),
+        Index('ix_node_user_usages_monthly_user_id_created_at', 'user_id', 'created_at'),
+        Index('ix_node_user_usages_monthly_node_id_created_at', 'node_id', 'created_at'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, unique=False, nullable=False)  # one month per record
+    user_id = Column(Integer, ForeignKey("users.id"))
+    user = relationship("User", back_populates="monthly_node_usages")
+    node_id = Column(Integer, ForeignKey("nodes.id"))
+    node = relationship("Node", back_populates="monthly_user_usages")
+    used_traffic = Column(BigInteger, default=0)
+
+
+class UsageArchive(Base):
+    """A part of a usage table exported to the columnar archive (see app/db/archive.py)."""
+    __tablename__ = "usage_archives"
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String(64), nullable=False, index=True)
+    node_id = Column(Integer, nullable=True)  # not a foreign key, archives outlive their nodes
+    month = Column(String(7), nullable=False)
+    path = Column(String(512), nullable=False)
+    rows = Column(BigInteger, nullable=False, default=0)
+    min_id = Column(BigInteger, nullable=False)
+    max_id = Column(BigInteger, nullable=False)
+    start = Column(DateTime, nullable=False)
+    end = Column(DateTime, nullable=False)
+    pruned = Column(Boolean, nullable=False, default=False, server_default='0')
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class NodeUsage(Base):
     __tablename__ = "node_usages"
     __table_args__ = (
@@ -343,6 +439,9 @@ class NodeUsage(Base):
 
 class NotificationReminder(Base):
     __tablename__ = "notification_reminders"
+    __table_args__ = (
+        Index('ix_notification_reminders_user_id_type_threshold', 'user_id', 'type', 'threshold'),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -353,6 +452,45 @@ class NotificationReminder(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class WebhookOutbox(Base):
+    __tablename__ = "webhook_outbox"
+    __table_args__ = (
+        Index('ix_webhook_outbox_endpoint_id', 'endpoint', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    endpoint = Column(String(16), nullable=False)  # hash of the address, which may be too long to index
+    payload = Column(JSON, nullable=False)
+    tries = Column(Integer, nullable=False, default=0)
+    due_at = Column(DateTime, nullable=False)
+    claim = Column(String(16), nullable=True)
+    claimed_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class WebhookDeadLetter(Base):
+    __tablename__ = "webhook_dead_letters"
+
+    id = Column(Integer, primary_key=True)
+    address = Column(String(1024), nullable=False)
+    payload = Column(JSON, nullable=False)
+    tries = Column(Integer, nullable=False, default=0)
+    error = Column(String(1024), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class WorkerMessage(Base):
+    """Requests of the panel's workers to the leader (`leader_only`) or to every other worker."""
+    __tablename__ = "worker_messages"
+
+    id = Column(Integer, primary_key=True)
+    sender = Column(String(16), nullable=False)
+    leader_only = Column(Boolean, nullable=False, default=True)
+    type = Column(String(64), nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
 class Tunnel(Base):
     __tablename__ = "tunnels"
 
@@ -0,0 +1,188 @@
+"""
+Tracing of the SQL statements sent by each request and scheduler job, with QUERY_PROFILE.
+
+Statements are timed by the cursor events of the engines and added to the trace of the
+request or job running them, which is kept in a context variable so it follows sync
+endpoints and dependencies into the threadpool. Traces are summed up per route, such as
+`GET /api/user/{username}`, and per job: runs, statements, database time, the worst run
+and the slowest statements seen.
+
+A run sending more than QUERY_PROFILE_WARN_STATEMENTS statements is logged, and so is a
+statement sent QUERY_PROFILE_WARN_REPEATS times or more by a single run, the usual sign of
+an N+1 pattern, e.g. a relationship lazily loaded for each user of a list.
+
+Each worker process keeps its own stats, since the last reset or start. They are also
+exported at /metrics, see app/metrics/panel.py.
+"""
+
+import concurrent.futures
+import heapq
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from apscheduler.executors.pool import BasePoolExecutor
+from sqlalchemy import event
+
+from app import logger
+from app.db.base import engine, read_engine
+from config import (
+    QUERY_PROFILE,
+    QUERY_PROFILE_SLOWEST,
+    QUERY_PROFILE_WARN_REPEATS,
+    QUERY_PROFILE_WARN_STATEMENTS,
+)
+
+enabled = QUERY_PROFILE
+
+
+def shorten(statement: str) -> str:
+    """The statement on one line, without its list of selected columns."""
+    return re.sub(r"^SELECT .*? FROM ", "SELECT ... FROM ", " ".join(statement.split()))
+
+
+@dataclass
+class Trace:
+    name: Optional[str] = None
+    statements: int = 0
+    time: float = 0
+    # min-heap of the slowest (seconds, statement)
+    slowest: List[Tuple[float, str]] = field(default_factory=list)
+    repeats: Counter = field(default_factory=Counter)
+
+    def add(self, statement: str, seconds: float):
+        self.statements += 1
+        self.time += seconds
+        self.repeats[statement] += 1
+        if len(self.slowest) < QUERY_PROFILE_SLOWEST:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+
+@dataclass
+class Stats:
+    runs: int = 0
+    statements: int = 0
+    time: float = 0
+    max_statements: int = 0
+    max_time: float = 0
+    slowest: List[Tuple[float, str]] = field(default_factory=list)
+    # statements repeated by a single run, with their most repeats
+    repeated: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, trace: Trace, repeated: Dict[str, int]):
+        self.runs += 1
+        self.statements += trace.statements
+        self.time += trace.time
+        self.max_statements = max(self.max_statements, trace.statements)
+        self.max_time = max(self.max_time, trace.time)
+        self.slowest = heapq.nlargest(QUERY_PROFILE_SLOWEST, self.slowest + trace.slowest)
+        for statement, count in repeated.items():
+            self.repeated[statement] = max(self.repeated.get(statement, 0), count)
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("query_profile_trace", default=None)
+_stats: Dict[str, Stats] = {}
+_lock = threading.Lock()
+
+
+def stats() -> Dict[str, Stats]:
+    with _lock:
+        return dict(_stats)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+@contextmanager
+def tracing(name: Optional[str] = None):
+    """Traces the statements sent inside, under the name set by the time it exits."""
+    trace = Trace(name)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        if trace.name:
+            _finish(trace)
+
+
+def _finish(trace: Trace):
+    repeated = {
+        shorten(statement): count
+        for statement, count in trace.repeats.items()
+        if count >= QUERY_PROFILE_WARN_REPEATS
+    }
+    trace.slowest = [(seconds, shorten(statement)) for seconds, statement in trace.slowest]
+    with _lock:
+        _stats.setdefault(trace.name, Stats()).add(trace, repeated)
+
+    if trace.statements > QUERY_PROFILE_WARN_STATEMENTS:
+        logger.warning(
+            f'"{trace.name}" sent {trace.statements} statements, '
+            f'{trace.time * 1000:.0f} ms in the database'
+        )
+    for statement, count in repeated.items():
+        logger.warning(f'"{trace.name}" sent the same statement {count} times, an N+1 query? {statement[:300]}')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_profile_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current.get()
+    started = conn.info.get("query_profile_started")
+    if trace is not None and started:
+        trace.add(statement, time.perf_counter() - started.pop())
+
+
+class ProfileMiddleware:
+    """Traces each HTTP request, under its method and route path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        with tracing() as trace:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                # set by the router on the scope, not set for static files
+                if route := scope.get("route"):
+                    trace.name = f'{scope["method"]} {route.path}'
+
+
+class _TracingPool(concurrent.futures.ThreadPoolExecutor):
+    def submit(self, fn, job, *args, **kwargs):
+        return super().submit(_run_job, fn, job, *args, **kwargs)
+
+
+def _run_job(fn, job, *args, **kwargs):
+    with tracing(f"job {job.name}"):
+        return fn(job, *args, **kwargs)
+
+
+class TracingExecutor(BasePoolExecutor):
+    """The default thread pool executor of the scheduler, tracing each run of a job."""
+
+    def __init__(self, max_workers: int = 10):
+        super().__init__(_TracingPool(max_workers))
+
+
+if enabled:
+    for _engine in {engine, read_engine}:
+        event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,71 @@
+"""
+Serialization of the write transactions of background jobs, on SQLite.
+
+SQLite has a single writer at a time, the others retry until SQLITE_BUSY_TIMEOUT and then
+fail with "database is locked". The usage, review and cleanup jobs all write every few
+seconds, so instead of racing inside SQLite their sessions (`GetDB(queued=True)`) take
+turns here, in the order they asked. API requests still write directly and only ever
+wait for the one job whose turn it is.
+
+Jobs only run in the leader worker (app/utils/workers.py), so a queue per process is
+enough. On other databases, which handle concurrent writers, it does nothing.
+"""
+
+import threading
+from contextlib import nullcontext
+from typing import Optional
+
+from app.db.base import IS_SQLITE
+
+
+class WriteQueue:
+    """A FIFO lock, reentrant so a job can open a queued session inside another."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        self._owner: Optional[int] = None
+        self._depth = 0
+
+    @property
+    def waiting(self) -> int:
+        """Number of sessions waiting for their turn."""
+        return self._next_ticket - self._serving - (1 if self._owner is not None else 0)
+
+    def acquire(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._cond.wait_for(lambda: self._serving == ticket)
+            self._owner = me
+            self._depth = 1
+
+    def release(self):
+        with self._cond:
+            self._depth -= 1
+            if self._depth:
+                return
+            self._owner = None
+            self._serving += 1
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+enabled = IS_SQLITE
+queue = WriteQueue()
+
+
+def turn():
+    """Waits for a turn, for write transactions of a job outside of a queued session."""
+    return queue if enabled else nullcontext()
@@ -1,6 +1,6 @@
 from typing import Optional, Union
 from app.models.admin import AdminInDB, AdminValidationResult, Admin
-from app.models.user import UserResponse, UserStatus
+from app.models.user import UserResponse
 from app.db import Session, crud, get_db
 from config import SUDOERS
 from fastapi import Depends, HTTPException
@@ -103,13 +103,7 @@ def get_expired_users_list(db: Session, admin: Admin, expired_after: Optional[da
     expired_after = expired_after or datetime.min.replace(tzinfo=timezone.utc)
 
     dbadmin = crud.get_admin(db, admin.username)
-    dbusers = crud.get_users(
-        db=db,
-        status=[UserStatus.expired, UserStatus.limited],
+    return crud.get_expired_users(
+        db, expired_after, expired_before,
         admin=dbadmin if not admin.is_sudo else None
     )
-
-    return [
-        u for u in dbusers
-        if u.expire and expired_after.timestamp() <= u.expire <= expired_before.timestamp()
-    ]
@@ -6,22 +6,43 @@ from app.models.user import UserDataLimitResetStrategy
 from app.models.admin import Admin
 from telebot.formatting import escape_html
 from app import logger
-from config import DISCORD_WEBHOOK_URL
+from app.utils import dispatcher
+from app.utils.dispatcher import Digest, RetryAfter
+from config import DISCORD_RATE_LIMIT, DISCORD_WEBHOOK_URL, REPORT_TIMEOUT
 
 
-def send_webhooks(json_data, admin_webhook:str = None):
-    if DISCORD_WEBHOOK_URL:
-        send_webhook(json_data=json_data, webhook=DISCORD_WEBHOOK_URL)
-    if admin_webhook:
-        send_webhook(json_data=json_data, webhook=admin_webhook)
+def send_webhooks(json_data, admin_webhook:str = None, digest: Digest = None):
+    """
+    Queues the payload for the discord webhooks.
+
+    `digest.render` gets the listed items and their count and returns the payload of the merged reports.
+    """
+    for webhook in filter(None, {DISCORD_WEBHOOK_URL, admin_webhook}):
+        dispatcher.submit(
+            f"discord {webhook}",
+            lambda payload, webhook=webhook: send_webhook(json_data=payload, webhook=webhook),
+            json_data,
+            rate=DISCORD_RATE_LIMIT,
+            digest=digest,
+        )
 
 
 def send_webhook(json_data, webhook):
-    result = requests.post(webhook, json=json_data)
+    result = requests.post(webhook, json=json_data, timeout=REPORT_TIMEOUT)
+    if result.status_code == 429:
+        retry_after = result.headers.get("retry-after")
+        if retry_after is None:
+            try:
+                retry_after = result.json().get("retry_after")
+            except ValueError:
+                pass
+        raise RetryAfter(float(retry_after or 1))
 
     try:
         result.raise_for_status()
     except requests.exceptions.HTTPError as err:
+        if result.status_code >= 500:
+            raise  # retried
         logger.error(err)
     else:
         logger.debug("Discord payload delivered successfully, code {}.".format(result.status_code))
@@ -40,21 +61,29 @@ def report_status_change(username: str, status: str, admin: Admin = None):
         'limited': int("f8a7a8", 16),
         'expired': int("fbd38d", 16)
     }
-    statusChange = {
-        "content": "",
-        "embeds": [
-            {
-                "description": f"{_status[status]}\n----------------------\n**Username:** {username}",
-                "color": _status_color[status],
-                "footer": {
-                    "text": f"Belongs To: {admin.username if admin else None}"
-                },
-            }
-        ],
-    }
+    def status_change(description):
+        return {
+            "content": "",
+            "embeds": [
+                {
+                    "description": f"{_status[status]}\n----------------------\n{description}",
+                    "color": _status_color[status],
+                    "footer": {
+                        "text": f"Belongs To: {admin.username if admin else None}"
+                    },
+                }
+            ],
+        }
+
     send_webhooks(
-        json_data=statusChange, 
-        admin_webhook=admin.discord_webhook if admin and admin.discord_webhook else None
+        json_data=status_change(f"**Username:** {username}"),
+        admin_webhook=admin.discord_webhook if admin and admin.discord_webhook else None,
+        digest=Digest(
+            key=("status", status, admin.username if admin else None),
+            item=username,
+            render=lambda usernames, count: status_change(
+                f"**{count} Users:** {dispatcher.list_items(usernames, count)}"),
+        ),
         )
 
 def report_new_user(username: str, by: str, expire_date: int, data_limit: int, proxies: list, has_next_plan: bool,
@@ -123,22 +152,29 @@ def report_user_modification(username: str, expire_date: int, data_limit: int, p
         )
 
 def report_user_deletion(username: str, by: str, admin: Admin = None):
-    userDeletion = {
-        'content': '',
-        'embeds': [
-            {
-                'title': ':wastebasket: Deleted',
-                'description': f'**Username: **{username}',
-                "footer": {
-                    "text": f"Belongs To: {admin.username if admin else None}\nBy: {by}"
-                },
-                'color': int("ff0000", 16)
-            }
-        ]
-    }
+    def userDeletion(description):
+        return {
+            'content': '',
+            'embeds': [
+                {
+                    'title': ':wastebasket: Deleted',
+                    'description': description,
+                    "footer": {
+                        "text": f"Belongs To: {admin.username if admin else None}\nBy: {by}"
+                    },
+                    'color': int("ff0000", 16)
+                }
+            ]
+        }
+
     send_webhooks(
-        json_data=userDeletion,
-        admin_webhook=admin.discord_webhook if admin and admin.discord_webhook else None
+        json_data=userDeletion(f'**Username: **{username}'),
+        admin_webhook=admin.discord_webhook if admin and admin.discord_webhook else None,
+        digest=Digest(
+            key=("deleted", by, admin.username if admin else None),
+            item=username,
+            render=lambda usernames, count: userDeletion(f"**{count} Users: **{dispatcher.list_items(usernames, count)}"),
+        ),
         )
 
 def report_user_usage_reset(username: str, by: str, admin: Admin = None):
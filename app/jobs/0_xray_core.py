@@ -3,7 +3,10 @@ import traceback
 
 from app import app, logger, scheduler, xray
 from app.db import GetDB, crud
+from app.metrics.panel import nodes_sys_stats
 from app.models.node import NodeStatus
+from app.utils import workers
+from app.xray import published
 from config import JOB_CORE_HEALTH_CHECK_INTERVAL
 from xray_api import exc as xray_exc
 
@@ -11,8 +14,8 @@ from xray_api import exc as xray_exc
 def core_health_check():
     config = None
 
-    # main core
-    if not xray.core.started:
+    # main core, unless it's already waiting to be restarted after exiting
+    if not xray.core.started and not xray.core.restart_pending:
         if not config:
             config = xray.config.include_db_users()
         xray.core.restart(config)
@@ -22,19 +25,21 @@ def core_health_check():
         if node.connected:
             try:
                 assert node.started
-                node.api.get_sys_stats(timeout=2)
+                nodes_sys_stats[node_id] = node.api.get_sys_stats(timeout=2)
             except (ConnectionError, xray_exc.XrayError, AssertionError):
+                nodes_sys_stats.pop(node_id, None)
                 if not config:
                     config = xray.config.include_db_users()
                 xray.operations.restart_node(node_id, config)
 
         if not node.connected:
+            nodes_sys_stats.pop(node_id, None)
             if not config:
                 config = xray.config.include_db_users()
             xray.operations.connect_node(node_id, config)
 
 
-@app.on_event("startup")
+@workers.on_elected
 def start_core():
     logger.info("Generating Xray core config")
 
@@ -42,6 +47,12 @@ def start_core():
     config = xray.config.include_db_users()
     logger.info(f"Xray core config generated in {(time.time() - start_time):.2f} seconds")
 
+    # for standalone subscription servers
+    try:
+        published.publish()
+    except Exception:
+        traceback.print_exc()
+
     # main core
     logger.info("Starting main Xray core")
     try:
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from typing import Callable, Type
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app import logger, scheduler
+from app.db import GetDB, write_queue
+from app.db.models import NodeUserUsage, NodeUserUsageDaily, NodeUserUsageMonthly
+from config import (
+    JOB_COMPACT_USAGES_INTERVAL,
+    USAGE_DAILY_RETENTION_DAYS,
+    USAGE_HOURLY_RETENTION_DAYS,
+    USAGE_MONTHLY_RETENTION_DAYS,
+)
+
+
+def start_of_day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def start_of_month(dt: datetime) -> datetime:
+    return start_of_day(dt).replace(day=1)
+
+
+def next_day(dt: datetime) -> datetime:
+    return dt + timedelta(days=1)
+
+
+def next_month(dt: datetime) -> datetime:
+    return (dt + timedelta(days=32)).replace(day=1)
+
+
+def rollup_bucket(db: Session, source: Type, target: Type, start: datetime, end: datetime):
+    """Moves the source rows in [start, end) into one target row per user and node, dated at `start`."""
+    in_range = (source.created_at >= start, source.created_at < end)
+    totals = db.query(source.user_id, source.node_id, func.sum(source.used_traffic)) \
+        .filter(*in_range) \
+        .group_by(source.user_id, source.node_id) \
+        .all()
+    if not totals:
+        return
+
+    existing = {(row.user_id, row.node_id): row for row in db.query(target).filter(target.created_at == start)}
+    new_rows = []
+    for user_id, node_id, used_traffic in totals:
+        row = existing.get((user_id, node_id))
+        if row:
+            row.used_traffic += int(used_traffic or 0)
+        else:
+            new_rows.append({"created_at": start, "user_id": user_id,
+                             "node_id": node_id, "used_traffic": int(used_traffic or 0)})
+
+    if new_rows:
+        db.execute(insert(target), new_rows)
+    db.query(source).filter(*in_range).delete(synchronize_session=False)
+
+
+def rollup(source: Type, target: Type, cutoff: datetime, next_bucket: Callable[[datetime], datetime],
+           truncate: Callable[[datetime], datetime]):
+    with GetDB() as db:
+        oldest = db.query(func.min(source.created_at)).filter(source.created_at < cutoff).scalar()
+        if oldest is None:
+            return
+
+        bucket = truncate(oldest)
+        count = 0
+        while bucket < cutoff:
+            end = next_bucket(bucket)
+            # one bucket per transaction and turn in the write queue, to keep locks short
+            with write_queue.turn():
+                rollup_bucket(db, source, target, bucket, end)
+                db.commit()
+            bucket = end
+            count += 1
+
+        logger.info(f"Rolled up {count} {source.__tablename__} buckets into {target.__tablename__}")
+
+
+def compact_usages():
+    now = datetime.utcnow()
+
+    if USAGE_HOURLY_RETENTION_DAYS > 0:
+        cutoff = start_of_day(now - timedelta(days=USAGE_HOURLY_RETENTION_DAYS))
+        rollup(NodeUserUsage, NodeUserUsageDaily, cutoff, next_day, start_of_day)
+
+    if USAGE_DAILY_RETENTION_DAYS > 0:
+        cutoff = start_of_month(now - timedelta(days=USAGE_DAILY_RETENTION_DAYS))
+        rollup(NodeUserUsageDaily, NodeUserUsageMonthly, cutoff, next_month, start_of_month)
+
+    if USAGE_MONTHLY_RETENTION_DAYS > 0:
+        cutoff = start_of_month(now - timedelta(days=USAGE_MONTHLY_RETENTION_DAYS))
+        with GetDB(queued=True) as db:
+            deleted = db.query(NodeUserUsageMonthly) \
+                .filter(NodeUserUsageMonthly.created_at < cutoff) \
+                .delete(synchronize_session=False)
+            db.commit()
+        if deleted:
+            logger.info(f"Deleted {deleted} monthly usage rows older than {cutoff}")
+
+
+scheduler.add_job(compact_usages, 'interval',
+                  seconds=JOB_COMPACT_USAGES_INTERVAL,
+                  coalesce=True, max_instances=1)
@@ -0,0 +1,5 @@
+from app import scheduler
+from app.utils.system import record_realtime_bandwidth
+
+# sample time is 2 seconds, values lower than this may not produce good results
+scheduler.add_job(record_realtime_bandwidth, 'interval', seconds=2, coalesce=True, max_instances=1)
@@ -12,6 +12,8 @@ from sqlalchemy.sql.dml import Insert
 from app import scheduler, xray
 from app.db import GetDB
 from app.db.models import Admin, NodeUsage, NodeUserUsage, System, User
+from app.subscription import snapshot
+from app.utils import events
 from config import (
     DISABLE_RECORDING_NODE_USAGE,
     JOB_RECORD_NODE_USAGES_INTERVAL,
@@ -52,7 +54,7 @@ def record_user_stats(params: list, node_id: Union[int, None],
 
     created_at = datetime.fromisoformat(datetime.utcnow().strftime('%Y-%m-%dT%H:00:00'))
 
-    with GetDB() as db:
+    with GetDB(queued=True) as db:
         # make user usage row if doesn't exist
         select_stmt = select(NodeUserUsage.user_id) \
             .where(and_(NodeUserUsage.node_id == node_id, NodeUserUsage.created_at == created_at))
@@ -89,7 +91,7 @@ def record_node_stats(params: dict, node_id: Union[int, None]):
 
     created_at = datetime.fromisoformat(datetime.utcnow().strftime('%Y-%m-%dT%H:00:00'))
 
-    with GetDB() as db:
+    with GetDB(queued=True) as db:
 
         # make node usage row if doesn't exist
         select_stmt = select(NodeUsage.node_id). \
@@ -149,17 +151,20 @@ def record_user_usages():
     if not users_usage:
         return
 
-    with GetDB() as db:
+    with GetDB(read_only=True) as db:
         user_admin_map = dict(db.query(User.id, User.admin_id).all())
+        admin_names = dict(db.query(Admin.id, Admin.username).all())
 
-    admin_usage = defaultdict(int)
+    # users and usage per admin, None for the users without an admin
+    summaries = defaultdict(lambda: {"users": 0, "value": 0})
     for user_usage in users_usage:
-        admin_id = user_admin_map.get(int(user_usage["uid"]))
-        if admin_id:
-            admin_usage[admin_id] += user_usage["value"]
+        summary = summaries[user_admin_map.get(int(user_usage["uid"]))]
+        summary["users"] += 1
+        summary["value"] += user_usage["value"]
+    admin_usage = {admin_id: summary["value"] for admin_id, summary in summaries.items() if admin_id}
 
     # record users usage
-    with GetDB() as db:
+    with GetDB(queued=True) as db:
         stmt = update(User). \
             where(User.id == bindparam('uid')). \
             values(
@@ -176,6 +181,11 @@ def record_user_usages():
                 values(users_usage=Admin.users_usage + bindparam('value'))
             safe_execute(db, admin_update_stmt, admin_data)
 
+    snapshot.mark_usage(int(usage["uid"]) for usage in users_usage)
+    for admin_id, summary in summaries.items():
+        admin = admin_names.get(admin_id)
+        events.publish("usage.recorded", {"admin": admin, **summary}, audience=admin)
+
     if DISABLE_RECORDING_NODE_USAGE:
         return
 
@@ -203,7 +213,7 @@ def record_node_usages():
         return
 
     # record nodes usage
-    with GetDB() as db:
+    with GetDB(queued=True) as db:
         stmt = update(System).values(
             uplink=System.uplink + total_up,
             downlink=System.downlink + total_down
@@ -1,6 +1,6 @@
 import logging
 
-from app import logger, scheduler
+from app import logger, scheduler, xray
 from app.db import GetDB, crud
 from app.models.admin import Admin
 from app.utils import report
@@ -10,14 +10,21 @@ SYSTEM_ADMIN = Admin(username='system', is_sudo=True, telegram_id=None, discord_
 
 
 def remove_expired_users():
-    with GetDB() as db:
-        deleted_users = crud.autodelete_expired_users(db, USER_AUTODELETE_INCLUDE_LIMITED_ACCOUNTS)
+    with GetDB(queued=True) as db:
+        deleted_users, stats = crud.autodelete_expired_users(db, USER_AUTODELETE_INCLUDE_LIMITED_ACCOUNTS)
+        if not deleted_users:
+            return
 
-        for user in deleted_users:
-            report.user_deleted(user.username, SYSTEM_ADMIN,
-                                user_admin=Admin.model_validate(user.admin) if user.admin else None
+        xray.operations.remove_users([(user_id, username) for user_id, username, _ in deleted_users])
+
+        for _, username, admin in deleted_users:
+            report.user_deleted(username, SYSTEM_ADMIN,
+                                user_admin=Admin.model_validate(admin) if admin else None
                                 )
-            logger.log(logging.INFO, "Expired user %s deleted." % user.username)
+            logger.log(logging.INFO, "Expired user %s deleted." % username)
+
+        logger.info("Auto-deleted %d expired users: %s" % (
+            len(deleted_users), ", ".join(f"{count} {table}" for table, count in stats.items())))
 
 
 scheduler.add_job(remove_expired_users, 'interval', coalesce=True, hours=6, max_instances=1)
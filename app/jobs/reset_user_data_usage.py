@@ -1,43 +1,24 @@
 from datetime import datetime
 
 from app import logger, scheduler, xray
-from app.db import crud, GetDB, get_users
-from app.models.user import UserDataLimitResetStrategy, UserStatus
-
-reset_strategy_to_days = {
-    UserDataLimitResetStrategy.day.value: 1,
-    UserDataLimitResetStrategy.week.value: 7,
-    UserDataLimitResetStrategy.month.value: 30,
-    UserDataLimitResetStrategy.year.value: 365,
-}
+from app.db import crud, GetDB, User
+from app.models.user import UserStatus
 
 
 def reset_user_data_usage():
     now = datetime.utcnow()
-    with GetDB() as db:
-        for user in get_users(db,
-                              status=[
-                                  UserStatus.active,
-                                  UserStatus.limited
-                              ],
-                              reset_strategy=[
-                                  UserDataLimitResetStrategy.day.value,
-                                  UserDataLimitResetStrategy.week.value,
-                                  UserDataLimitResetStrategy.month.value,
-                                  UserDataLimitResetStrategy.year.value,
-                              ]):
-            last_reset_time = user.last_traffic_reset_time
-            num_days_to_reset = reset_strategy_to_days[user.data_limit_reset_strategy]
-
-            if not (now - last_reset_time).days >= num_days_to_reset:
-                continue
-
-            crud.reset_user_data_usage(db, user)
-            # make user active if limited on usage reset
-            if user.status == UserStatus.limited:
-                xray.operations.add_user(user)
-
-            logger.info(f"User data usage reset for User \"{user.username}\"")
+    with GetDB(queued=True) as db:
+        reset_users = crud.reset_due_users_data_usage(db, now)
+        if not reset_users:
+            return
+
+        # make users active if limited on usage reset
+        limited = [user_id for user_id, _, status in reset_users if status == UserStatus.limited]
+        for i in range(0, len(limited), 500):
+            xray.operations.add_users(crud.get_user_queryset(db).filter(User.id.in_(limited[i:i + 500])).all())
+
+        for _, username, _ in reset_users:
+            logger.info(f"User data usage reset for User \"{username}\"")
 
 
 scheduler.add_job(reset_user_data_usage, 'interval', coalesce=True, hours=1)
@@ -1,10 +1,10 @@
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional, Set, Tuple
 
 from sqlalchemy.orm import Session
 
 from app import logger, scheduler, xray
-from app.db import (GetDB, get_notification_reminder, get_users,
+from app.db import (GetDB, get_notification_reminder_keys, get_users,
                     start_user_expire, update_user_status, reset_user_by_next)
 from app.models.user import ReminderType, UserResponse, UserStatus
 from app.utils import report
@@ -16,31 +16,36 @@ from config import (JOB_REVIEW_USERS_INTERVAL, NOTIFY_DAYS_LEFT,
 if TYPE_CHECKING:
     from app.db.models import User
 
+ReminderKey = Tuple[int, ReminderType, Optional[int]]
 
-def add_notification_reminders(db: Session, user: "User", now: datetime = datetime.utcnow()) -> None:
+
+def add_notification_reminders(db: Session, user: "User", reminders: Set[ReminderKey], now: datetime) -> None:
+    """
+    Reports the highest usage and the nearest expiry threshold the user reached, unless already
+    reminded. `reminders` holds the (user_id, type, threshold) of the unexpired reminders, loaded
+    once per review, and is updated with the reminders created here.
+    """
     if user.data_limit:
         usage_percent = calculate_usage_percent(user.used_traffic, user.data_limit)
+        percent = next((p for p in sorted(NOTIFY_REACHED_USAGE_PERCENT, reverse=True) if usage_percent >= p), None)
 
-        for percent in sorted(NOTIFY_REACHED_USAGE_PERCENT, reverse=True):
-            if usage_percent >= percent:
-                if not get_notification_reminder(db, user.id, ReminderType.data_usage, threshold=percent):
-                    report.data_usage_percent_reached(
-                        db, usage_percent, UserResponse.model_validate(user),
-                        user.id, user.expire, threshold=percent
-                    )
-                break
+        if percent is not None and (user.id, ReminderType.data_usage, percent) not in reminders:
+            report.data_usage_percent_reached(
+                db, usage_percent, UserResponse.model_validate(user),
+                user.id, user.expire, threshold=percent
+            )
+            reminders.add((user.id, ReminderType.data_usage, percent))
 
     if user.expire:
-        expire_days = calculate_expiration_days(user.expire)
+        expire_days = calculate_expiration_days(user.expire, now)
+        days_left = next((d for d in sorted(NOTIFY_DAYS_LEFT) if expire_days <= d), None)
 
-        for days_left in sorted(NOTIFY_DAYS_LEFT):
-            if expire_days <= days_left:
-                if not get_notification_reminder(db, user.id, ReminderType.expiration_date, threshold=days_left):
-                    report.expire_days_reached(
-                        db, expire_days, UserResponse.model_validate(user),
-                        user.id, user.expire, threshold=days_left
-                    )
-                break
+        if days_left is not None and (user.id, ReminderType.expiration_date, days_left) not in reminders:
+            report.expire_days_reached(
+                db, expire_days, UserResponse.model_validate(user),
+                user.id, user.expire, threshold=days_left
+            )
+            reminders.add((user.id, ReminderType.expiration_date, days_left))
 
 
 def reset_user_by_next_report(db: Session, user: "User"):
@@ -51,10 +56,12 @@ def reset_user_by_next_report(db: Session, user: "User"):
     report.user_data_reset_by_next(user=UserResponse.model_validate(user), user_admin=user.admin)
 
 
-def review():
-    now = datetime.utcnow()
+def review(now: Optional[datetime] = None):
+    now = now or datetime.utcnow()
     now_ts = now.timestamp()
-    with GetDB() as db:
+    with GetDB(queued=True) as db:
+        reminders = get_notification_reminder_keys(db, now) if WEBHOOK_ADDRESS else set()
+
         for user in get_users(db, status=UserStatus.active):
 
             limited = user.data_limit and user.used_traffic >= user.data_limit
@@ -77,7 +84,7 @@ def review():
                 status = UserStatus.expired
             else:
                 if WEBHOOK_ADDRESS:
-                    add_notification_reminders(db, user, now)
+                    add_notification_reminders(db, user, reminders, now)
                 continue
 
             xray.operations.remove_user(user)
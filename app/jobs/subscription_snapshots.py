@@ -0,0 +1,19 @@
+import os
+
+from app import logger, scheduler
+from app.subscription import snapshot
+from app.utils import workers
+from config import JOB_SUB_SNAPSHOTS_INTERVAL, SUB_SNAPSHOT_DIR
+
+
+if SUB_SNAPSHOT_DIR:
+    @workers.on_elected
+    def build_missing_snapshots():
+        # a fresh snapshot directory, render everyone on the first run
+        if not os.path.isdir(snapshot.store.users_path):
+            snapshot.mark_all()
+
+    logger.info("Subscription snapshots job started")
+    scheduler.add_job(snapshot.regenerate_pending, 'interval',
+                      seconds=JOB_SUB_SNAPSHOTS_INTERVAL,
+                      coalesce=True, max_instances=1)
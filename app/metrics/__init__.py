@@ -0,0 +1,73 @@
+"""
+Prometheus metrics, served at /metrics when METRICS_ENABLED is set.
+
+What happens is recorded as it happens: subscription requests here, job runs and calls to
+the Xray APIs by the panel (see app/metrics/panel.py). The rest is read when scraped: the
+database connection pools, the compressed responses cache and, in the panel, the queued
+notifications and the system stats of the Xray cores.
+
+Every worker process has its own metrics and only the leader runs the jobs and the cores
+(see app/utils/workers.py), so with several workers scrape each of them.
+"""
+
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, SummaryMetricFamily
+from prometheus_client.registry import Collector
+
+from app.db.base import TimedQueuePool, engine, read_engine
+from app.utils.response_cache import cache
+
+SUBSCRIPTION_DURATION = Histogram(
+    "marzban_subscription_duration_seconds", "Time to serve a subscription, by format", ["format"]
+)
+SUBSCRIPTION_RESPONSES = Counter(
+    "marzban_subscription_responses",
+    "Subscriptions served by format and source, a snapshot, rendered or not modified since the client's copy",
+    ["format", "source"],
+)
+
+
+class DatabaseCollector(Collector):
+    def collect(self):
+        engines = {"default": engine}
+        if read_engine is not engine:
+            engines["read_only"] = read_engine
+
+        wait = SummaryMetricFamily(
+            "marzban_db_pool_checkout_seconds", "Time to check out a connection, waiting for a free one", labels=["engine"]
+        )
+        timeouts = CounterMetricFamily(
+            "marzban_db_pool_checkout_timeouts", "Checkouts that found no free connection in time", labels=["engine"]
+        )
+        checked_out = GaugeMetricFamily(
+            "marzban_db_pool_checked_out", "Connections in use", labels=["engine"]
+        )
+        size = GaugeMetricFamily(
+            "marzban_db_pool_size", "Connections kept open by the pool, overflow excluded", labels=["engine"]
+        )
+        for name, db_engine in engines.items():
+            pool = db_engine.pool
+            if not isinstance(pool, TimedQueuePool):
+                continue
+            wait.add_metric([name], count_value=pool.checkouts, sum_value=pool.checkout_time)
+            timeouts.add_metric([name], pool.timeouts)
+            checked_out.add_metric([name], pool.checkedout())
+            size.add_metric([name], pool.size())
+        yield from (wait, timeouts, checked_out, size)
+
+
+class ResponseCacheCollector(Collector):
+    def collect(self):
+        yield CounterMetricFamily(
+            "marzban_response_cache_hits", "Compressed responses found in the cache", value=cache.hits
+        )
+        yield CounterMetricFamily(
+            "marzban_response_cache_misses", "Responses compressed for the cache", value=cache.misses
+        )
+        yield GaugeMetricFamily(
+            "marzban_response_cache_size_bytes", "Size of the cached compressed responses", value=cache.size
+        )
+
+
+REGISTRY.register(DatabaseCollector())
+REGISTRY.register(ResponseCacheCollector())
@@ -0,0 +1,215 @@
+"""
+Metrics of the panel: scheduler jobs, Xray API calls and cores, notification queues.
+
+Job durations are measured from the submission of a run to its end, so a run waiting for
+a free thread of the scheduler counts its wait too. A run submitted while another run of
+the same job is going counts as an overlap, and a run skipped because `max_instances`
+runs are going counts as a skip.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict
+
+import grpc
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+)
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from app import logger
+from app.db import GetDB, profile
+from app.db.models import Node
+from app.utils import dispatcher, webhook, workers
+from xray_api import base as xray_api_base
+from xray_api.stats import SysStatsResponse
+
+JOB_DURATION = Histogram(
+    "marzban_job_duration_seconds", "Duration of the runs of scheduler jobs", ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+JOB_RUNNING = Gauge("marzban_job_running", "Runs of the job going on", ["job"])
+JOB_OVERLAPS = Counter("marzban_job_overlaps", "Runs submitted while another run of the job was going", ["job"])
+JOB_SKIPS = Counter(
+    "marzban_job_skips", "Runs not done, because of max_instances or missed by more than the grace time",
+    ["job", "reason"],
+)
+JOB_ERRORS = Counter("marzban_job_errors", "Runs that raised an exception", ["job"])
+
+RPC_DURATION = Histogram(
+    "marzban_xray_rpc_duration_seconds", "Duration of the calls to the Xray APIs, by target and method",
+    ["target", "method"],
+)
+RPC_ERRORS = Counter(
+    "marzban_xray_rpc_errors", "Failed calls to the Xray APIs, by target, method and status code",
+    ["target", "method", "code"],
+)
+
+# system stats of the nodes' cores, as last fetched by the health check (app/jobs/0_xray_core.py)
+nodes_sys_stats: Dict[int, SysStatsResponse] = {}
+
+_job_names: Dict[str, str] = {}
+_job_starts: Dict[str, Deque[float]] = defaultdict(deque)
+_jobs_lock = threading.Lock()
+
+
+def _on_job_event(scheduler, event):
+    if event.code in (EVENT_JOB_SUBMITTED, EVENT_JOB_MAX_INSTANCES):
+        # dispatched by the scheduler's thread, which can look up the job without waiting
+        if job := scheduler.get_job(event.job_id):
+            _job_names[event.job_id] = job.name
+    name = _job_names.get(event.job_id, event.job_id)
+
+    if event.code == EVENT_JOB_SUBMITTED:
+        with _jobs_lock:
+            starts = _job_starts[event.job_id]
+            if starts:
+                JOB_OVERLAPS.labels(name).inc()
+            starts.append(time.perf_counter())
+            JOB_RUNNING.labels(name).set(len(starts))
+
+    elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+        with _jobs_lock:
+            starts = _job_starts[event.job_id]
+            if starts:
+                JOB_DURATION.labels(name).observe(time.perf_counter() - starts.popleft())
+            JOB_RUNNING.labels(name).set(len(starts))
+        if event.code == EVENT_JOB_ERROR:
+            JOB_ERRORS.labels(name).inc()
+
+    elif event.code == EVENT_JOB_MAX_INSTANCES:
+        JOB_SKIPS.labels(name, "max_instances").inc()
+
+    elif event.code == EVENT_JOB_MISSED:
+        JOB_SKIPS.labels(name, "missed").inc()
+
+
+class RPCInterceptor(grpc.UnaryUnaryClientInterceptor):
+    def __init__(self, target: str):
+        self.target = target
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        method = client_call_details.method.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        outcome = continuation(client_call_details, request)
+        RPC_DURATION.labels(self.target, method).observe(time.perf_counter() - started)
+        if outcome.exception() is not None:
+            RPC_ERRORS.labels(self.target, method, outcome.code().name).inc()
+        return outcome
+
+
+class PanelCollector(Collector):
+    def describe(self):
+        # otherwise the registry collects once on registration, before the panel has started
+        return []
+
+    def collect(self):
+        yield GaugeMetricFamily(
+            "marzban_worker_leader", "Whether this worker is the leader, running the jobs and cores",
+            value=int(workers.is_leader),
+        )
+        yield from self.collect_notifications()
+        if workers.is_leader:
+            yield from self.collect_sys_stats()
+        if profile.enabled:
+            yield from self.collect_query_profile()
+
+    def collect_notifications(self):
+        queued = GaugeMetricFamily(
+            "marzban_webhook_queued", "Notifications waiting in the outbox, by address", labels=["address"]
+        )
+        lag = GaugeMetricFamily(
+            "marzban_webhook_lag_seconds", "Age of the oldest undelivered notification, by address", labels=["address"]
+        )
+        dead_lettered = CounterMetricFamily(
+            "marzban_webhook_dead_lettered", "Notifications given up on by this worker, by address", labels=["address"]
+        )
+        for stats in webhook.stats():
+            queued.add_metric([stats["address"]], stats["queued"])
+            lag.add_metric([stats["address"]], stats["lag"])
+            dead_lettered.add_metric([stats["address"]], stats["dead_lettered"])
+        yield from (queued, lag, dead_lettered)
+        yield CounterMetricFamily(
+            "marzban_webhook_dropped", "Notifications dropped by this worker as the outbox couldn't be written",
+            value=webhook.dropped,
+        )
+
+        # destinations are named after their chat or webhook url, which are secret
+        depths = defaultdict(int)
+        for name, destination in list(dispatcher.destinations.items()):
+            depths[name.split(" ", 1)[0]] += len(destination.queue)
+        reports = GaugeMetricFamily(
+            "marzban_report_queued", "Telegram and Discord reports waiting to be sent", labels=["kind"]
+        )
+        for kind, depth in depths.items():
+            reports.add_metric([kind], depth)
+        yield reports
+
+    def collect_sys_stats(self):
+        from app import xray
+
+        stats = {}
+        if xray.core.started:
+            try:
+                stats["main"] = xray.api.get_sys_stats(timeout=2)
+            except Exception as err:
+                logger.debug(f"Failed to get the system stats of the main core: {err}")
+        if nodes_sys_stats:
+            with GetDB(read_only=True) as db:
+                names = dict(db.query(Node.id, Node.name).all())
+            for node_id, node_stats in list(nodes_sys_stats.items()):
+                if node_id in names:
+                    stats[names[node_id]] = node_stats
+
+        metrics = [
+            (GaugeMetricFamily, "goroutines", "Goroutines of the core", lambda s: s.num_goroutine),
+            (GaugeMetricFamily, "memory_alloc_bytes", "Heap allocated by the core", lambda s: s.alloc),
+            (GaugeMetricFamily, "memory_sys_bytes", "Memory obtained from the system by the core", lambda s: s.sys),
+            (GaugeMetricFamily, "live_objects", "Objects alive in the heap of the core", lambda s: s.live_objects),
+            (CounterMetricFamily, "gc", "Garbage collections of the core", lambda s: s.num_gc),
+            (CounterMetricFamily, "gc_pause_seconds", "Time the core was paused for garbage collections",
+             lambda s: s.pause_total_ns / 1e9),
+            (GaugeMetricFamily, "uptime_seconds", "Uptime of the core", lambda s: s.uptime),
+        ]
+        for family, name, description, value in metrics:
+            metric = family(f"marzban_xray_{name}", description, labels=["node"])
+            for node, node_stats in stats.items():
+                metric.add_metric([node], value(node_stats))
+            yield metric
+
+    def collect_query_profile(self):
+        metrics = [
+            (CounterMetricFamily, "runs", "Traced requests or job runs", lambda s: s.runs),
+            (CounterMetricFamily, "statements", "SQL statements sent", lambda s: s.statements),
+            (CounterMetricFamily, "seconds", "Time spent in the database", lambda s: s.time),
+            (GaugeMetricFamily, "max_statements", "Most statements sent by a single run", lambda s: s.max_statements),
+            (GaugeMetricFamily, "max_seconds", "Most time spent in the database by a single run", lambda s: s.max_time),
+        ]
+        stats = profile.stats()
+        for family, name, description, value in metrics:
+            metric = family(f"marzban_query_profile_{name}", description, labels=["name"])
+            for trace_name, entry in stats.items():
+                metric.add_metric([trace_name], value(entry))
+            yield metric
+
+
+def instrument(scheduler):
+    """
+    Starts recording the runs of the scheduler's jobs and the calls to the Xray APIs.
+
+    Calls are measured by wrapping the channels of the API clients, so only the clients
+    created after, of the main core and of the nodes, are measured.
+    """
+    scheduler.add_listener(
+        lambda event: _on_job_event(scheduler, event),
+        EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED,
+    )
+    xray_api_base.interceptor_factories.append(RPCInterceptor)
+    REGISTRY.register(PanelCollector())
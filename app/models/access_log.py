@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class AccessLogEntry(BaseModel):
+    time: datetime
+    source: str
+    action: str
+    network: str
+    host: str
+    port: int
+    inbound: str
+    outbound: str
+    username: Optional[str] = None
+
+
+class AccessLogsResponse(BaseModel):
+    start: datetime
+    end: datetime
+    entries: List[AccessLogEntry]
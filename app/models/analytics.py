@@ -0,0 +1,65 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.models.node import UsagePeriod
+
+
+class TopUser(BaseModel):
+    username: str
+    admin: Optional[str] = None
+    used_traffic: int
+
+
+class TopUsersResponse(BaseModel):
+    start: datetime
+    end: datetime
+    users: List[TopUser]
+
+
+class AdminUsagePercentiles(BaseModel):
+    admin: Optional[str] = None
+    users: int
+    used_traffic: int
+    mean: float
+    percentiles: Dict[str, float]
+
+
+class UsagePercentilesResponse(BaseModel):
+    start: datetime
+    end: datetime
+    period: UsagePeriod
+    admins: List[AdminUsagePercentiles]
+
+
+class UsageSpike(BaseModel):
+    username: str
+    admin: Optional[str] = None
+    period_start: datetime
+    used_traffic: int
+    baseline: float
+    ratio: float
+    z_score: float
+
+
+class UsageSpikesResponse(BaseModel):
+    start: datetime
+    end: datetime
+    period: UsagePeriod
+    window: int
+    spikes: List[UsageSpike]
+
+
+class TrafficBucket(BaseModel):
+    period_start: datetime
+    used_traffic: int
+    moving_average: Optional[float] = None
+
+
+class TrafficResponse(BaseModel):
+    start: datetime
+    end: datetime
+    period: UsagePeriod
+    window: int
+    buckets: List[TrafficBucket]
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -5,3 +7,10 @@ class CoreStats(BaseModel):
     version: str
     started: bool
     logs_websocket: str
+    pid: Optional[int] = None
+    uptime: int = 0
+    restarts: int = 0
+    last_exit_code: Optional[int] = None
+    memory_rss: Optional[int] = None
+    cpu_percent: Optional[float] = None
+    open_fds: Optional[int] = None
@@ -1,3 +1,4 @@
+from datetime import datetime
 from enum import Enum
 from typing import List, Optional
 
@@ -65,11 +66,17 @@ class NodeResponse(Node):
     model_config = ConfigDict(from_attributes=True)
 
 
+class UsagePeriod(str, Enum):
+    hour = "hour"
+    day = "day"
+
+
 class NodeUsageResponse(BaseModel):
     node_id: Optional[int] = None
     node_name: str
     uplink: int
     downlink: int
+    period_start: Optional[datetime] = None
 
 
 class NodesUsageResponse(BaseModel):
@@ -0,0 +1,33 @@
+from enum import Enum
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+
+class QueryProfileSort(str, Enum):
+    time = "time"
+    statements = "statements"
+    runs = "runs"
+    max_time = "max_time"
+    max_statements = "max_statements"
+
+
+class QueryProfileStatement(BaseModel):
+    time: float  # in milliseconds
+    statement: str
+
+
+class QueryProfileEntry(BaseModel):
+    name: str
+    runs: int
+    statements: int
+    time: float  # in milliseconds
+    max_statements: int
+    max_time: float
+    slowest: List[QueryProfileStatement]
+    # statements sent QUERY_PROFILE_WARN_REPEATS times or more by a single run, by their most repeats
+    repeated: Dict[str, int]
+
+
+class QueryProfileResponse(BaseModel):
+    entries: List[QueryProfileEntry]
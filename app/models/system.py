@@ -18,3 +18,14 @@ class SystemStats(BaseModel):
     outgoing_bandwidth: int
     incoming_bandwidth_speed: int
     outgoing_bandwidth_speed: int
+
+
+class WebhookStats(BaseModel):
+    address: str
+    queued: int
+    retrying: int
+    sent: int
+    failed_attempts: int
+    dead_lettered: int
+    lag: float
+    last_delivery_lag: float
@@ -285,6 +285,7 @@ class UserResponse(User):
     used_traffic: int
     lifetime_used_traffic: int = 0
     created_at: datetime
+    revision: int = 0
     links: List[str] = []
     subscription_url: str = ""
     proxies: dict
@@ -341,10 +342,31 @@ class UsersResponse(BaseModel):
     total: int
 
 
+class DeletedUserResponse(BaseModel):
+    username: str
+    revision: int
+    deleted_at: datetime
+    model_config = ConfigDict(from_attributes=True)
+
+
+class UserChangesCursor(BaseModel):
+    since_revision: int
+    since_id: int
+
+
+class UserChangesResponse(BaseModel):
+    users: List[UserResponse]
+    deleted: List[DeletedUserResponse]
+    revision: int
+    hosts_revision: int
+    next_cursor: UserChangesCursor
+
+
 class UserUsageResponse(BaseModel):
     node_id: Union[int, None] = None
     node_name: str
     used_traffic: int
+    period_start: Optional[datetime] = None
 
     @field_validator("used_traffic",  mode='before')
     def cast_to_int(cls, v):
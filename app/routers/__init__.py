@@ -1,29 +1,46 @@
 from fastapi import APIRouter
-from . import (
-    admin, 
-    core, 
-    node, 
-    subscription, 
-    system, 
-    user_template, 
-    user,
-    home,
-    tunnel,
-)
+
+from config import SUBSCRIPTION_ONLY
 
 api_router = APIRouter()
 
-routers = [
-    admin.router,
-    core.router,
-    node.router,
-    subscription.router,
-    system.router,
-    user_template.router,
-    user.router,
-    home.router,
-    tunnel.router,
-]
+if SUBSCRIPTION_ONLY:
+    # standalone subscription servers (sub.py) include the subscription router by themselves
+    routers = []
+else:
+    from . import (
+        access_log,
+        admin, 
+        analytics,
+        core, 
+        debug,
+        events,
+        metrics,
+        node, 
+        subscription, 
+        system, 
+        user_template, 
+        user,
+        home,
+        tunnel,
+    )
+
+    routers = [
+        access_log.router,
+        admin.router,
+        analytics.router,
+        core.router,
+        debug.router,
+        events.router,
+        metrics.router,
+        node.router,
+        subscription.router,
+        system.router,
+        user_template.router,
+        user.router,
+        home.router,
+        tunnel.router,
+    ]
 
 for router in routers:
     api_router.include_router(router)
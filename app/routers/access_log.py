@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.dependencies import validate_dates
+from app.models.access_log import AccessLogEntry, AccessLogsResponse
+from app.models.admin import Admin
+from app.utils import responses
+from app.xray import access_log
+
+router = APIRouter(tags=["Access Logs"], prefix="/api", responses={401: responses._401, 403: responses._403})
+
+
+@router.get("/access-logs", response_model=AccessLogsResponse)
+def get_access_logs(
+    start: str = "",
+    end: str = "",
+    username: Optional[str] = None,
+    destination: Optional[str] = Query(None, description="Part of the destination host, e.g. example.com"),
+    limit: int = Query(1000, ge=1, le=10000),
+    _: Admin = Depends(Admin.check_sudo_admin),
+):
+    """
+    Search the access logs of the main core, newest first
+
+    Only available when ACCESS_LOG_DIR is set. Logs of the last 30 days are searched by default.
+    """
+    if not access_log.enabled:
+        raise HTTPException(status_code=404, detail="Access logs are disabled")
+
+    start, end = validate_dates(start, end)
+    records = access_log.query(start, end, username=username, destination=destination, limit=limit)
+    return AccessLogsResponse(start=start, end=end, entries=[
+        AccessLogEntry(
+            time=datetime.fromtimestamp(record.timestamp, timezone.utc),
+            source=record.source,
+            action=record.action,
+            network=record.network,
+            host=record.host,
+            port=record.port,
+            inbound=record.inbound,
+            outbound=record.outbound,
+            username=record.username,
+        )
+        for record in records
+    ])
@@ -0,0 +1,195 @@
+from typing import Callable, List, Union
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel
+
+from app.db import Session, get_read_db
+from app.dependencies import validate_dates
+from app.models.admin import Admin
+from app.models.analytics import (
+    AdminUsagePercentiles,
+    TopUser,
+    TopUsersResponse,
+    TrafficBucket,
+    TrafficResponse,
+    UsagePercentilesResponse,
+    UsageSpike,
+    UsageSpikesResponse,
+)
+from app.models.node import UsagePeriod
+from app.utils import analytics, responses
+from app.utils.response_cache import cached_response
+from config import ANALYTICS_CACHE_TTL
+
+router = APIRouter(tags=["Analytics"], prefix="/api/analytics", responses={401: responses._401})
+
+
+def analytics_response(request: Request, key: tuple, build: Callable[[], BaseModel]):
+    content = analytics.results.get_or_set(key, lambda: build().model_dump_json().encode())
+    return cached_response(
+        request, content, media_type="application/json", cache_control=f"private, max-age={ANALYTICS_CACHE_TTL}"
+    )
+
+
+def get_scope(
+    owner: Union[List[str], None] = Query(None, alias="admin"),
+    admin: Admin = Depends(Admin.get_current),
+) -> Union[List[str], None]:
+    """Admins whose users are analyzed, non-sudo admins only see their own users."""
+    if not admin.is_sudo:
+        return [admin.username]
+    return owner
+
+
+def parse_percentiles(q: str) -> List[float]:
+    try:
+        values = [float(v) for v in q.split(",") if v.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid percentiles")
+    if not values or any(v < 0 or v > 100 for v in values):
+        raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+    return values
+
+
+@router.get("/top-users", response_model=TopUsersResponse)
+def get_top_users(
+    request: Request,
+    start: str = "",
+    end: str = "",
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db),
+    admins: Union[List[str], None] = Depends(get_scope),
+):
+    """Get the users with the most traffic within the range, heaviest first"""
+    start, end = validate_dates(start, end)
+
+    def build():
+        matrix = analytics.get_matrix(db, start, end, UsagePeriod.hour, admins)
+        rows, totals = analytics.top_users(matrix, limit)
+        usernames = analytics.get_usernames(db, matrix.user_ids[rows])
+        admin_names = analytics.get_admin_usernames(db)
+        return TopUsersResponse(start=start, end=end, users=[
+            TopUser(
+                username=usernames.get(int(matrix.user_ids[row]), ""),
+                admin=admin_names.get(int(matrix.admin_ids[row])),
+                used_traffic=int(total),
+            )
+            for row, total in zip(rows, totals)
+        ])
+
+    key = ("top-users", analytics.cache_slot(start), analytics.cache_slot(end), limit, tuple(sorted(admins or ())))
+    return analytics_response(request, key, build)
+
+
+@router.get("/percentiles", response_model=UsagePercentilesResponse)
+def get_usage_percentiles(
+    request: Request,
+    start: str = "",
+    end: str = "",
+    period: UsagePeriod = UsagePeriod.day,
+    q: str = Query("50,90,95,99", description="Comma separated percentiles"),
+    db: Session = Depends(get_read_db),
+    admins: Union[List[str], None] = Depends(get_scope),
+):
+    """
+    Get percentiles of the hourly or daily usage of users per admin
+
+    Every bucket of every user with any usage within the range counts, including empty buckets.
+    """
+    start, end = validate_dates(start, end)
+    q = parse_percentiles(q)
+
+    def build():
+        matrix = analytics.get_matrix(db, start, end, period, admins)
+        admin_names = analytics.get_admin_usernames(db)
+        result = []
+        for admin_id, rows in matrix.admin_slices():
+            values = matrix.values[rows]
+            total = float(values.sum(dtype=np.float64))
+            result.append(AdminUsagePercentiles(
+                admin=admin_names.get(admin_id),
+                users=values.shape[0],
+                used_traffic=int(total),
+                mean=total / values.size if values.size else 0,
+                percentiles={f"p{v:g}": float(p) for v, p in zip(q, analytics.percentiles(values, q))},
+            ))
+        return UsagePercentilesResponse(start=start, end=end, period=period, admins=result)
+
+    key = ("percentiles", analytics.cache_slot(start), analytics.cache_slot(end), period, tuple(q),
+           tuple(sorted(admins or ())))
+    return analytics_response(request, key, build)
+
+
+@router.get("/spikes", response_model=UsageSpikesResponse)
+def get_usage_spikes(
+    request: Request,
+    start: str = "",
+    end: str = "",
+    period: UsagePeriod = UsagePeriod.hour,
+    window: int = Query(24, ge=2, le=720, description="Number of previous buckets the baseline is averaged over"),
+    z_score: float = Query(3.0, ge=0, description="Minimum standard deviations above the baseline"),
+    ratio: float = Query(10.0, ge=1, description="Minimum multiple of the baseline"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db),
+    admins: Union[List[str], None] = Depends(get_scope),
+):
+    """
+    Get users whose traffic in a bucket spiked above the moving average of their previous buckets
+
+    Only the strongest spike of every user is returned, strongest first.
+    """
+    start, end = validate_dates(start, end)
+
+    def build():
+        matrix = analytics.get_matrix(db, start, end, period, admins)
+        found = analytics.spikes(matrix, window, z_score, ratio, limit)
+        usernames = analytics.get_usernames(db, [matrix.user_ids[row] for row, *_ in found])
+        admin_names = analytics.get_admin_usernames(db)
+        return UsageSpikesResponse(start=start, end=end, period=period, window=window, spikes=[
+            UsageSpike(
+                username=usernames.get(int(matrix.user_ids[row]), ""),
+                admin=admin_names.get(int(matrix.admin_ids[row])),
+                period_start=matrix.bucket_start(bucket),
+                used_traffic=int(used_traffic),
+                baseline=baseline,
+                ratio=used_traffic / baseline,
+                z_score=min(z, 1e9),
+            )
+            for row, bucket, used_traffic, baseline, z in found
+        ])
+
+    key = ("spikes", analytics.cache_slot(start), analytics.cache_slot(end), period, window, z_score, ratio, limit,
+           tuple(sorted(admins or ())))
+    return analytics_response(request, key, build)
+
+
+@router.get("/traffic", response_model=TrafficResponse)
+def get_traffic(
+    request: Request,
+    start: str = "",
+    end: str = "",
+    period: UsagePeriod = UsagePeriod.hour,
+    window: int = Query(24, ge=1, le=720, description="Number of buckets the moving average is taken over"),
+    db: Session = Depends(get_read_db),
+    admins: Union[List[str], None] = Depends(get_scope),
+):
+    """Get the total traffic of users per bucket along with its moving average"""
+    start, end = validate_dates(start, end)
+
+    def build():
+        matrix = analytics.get_matrix(db, start, end, period, admins)
+        totals = matrix.values.sum(axis=0, dtype=np.float64)
+        averages = analytics.moving_average(totals, window)
+        return TrafficResponse(start=start, end=end, period=period, window=window, buckets=[
+            TrafficBucket(
+                period_start=matrix.bucket_start(i),
+                used_traffic=int(total),
+                moving_average=None if np.isnan(average) else float(average),
+            )
+            for i, (total, average) in enumerate(zip(totals, averages))
+        ])
+
+    key = ("traffic", analytics.cache_slot(start), analytics.cache_slot(end), period, window,
+           tuple(sorted(admins or ())))
+    return analytics_response(request, key, build)
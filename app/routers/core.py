@@ -1,16 +1,15 @@
-import asyncio
 import json
-import time
 
 import commentjson
 from fastapi import APIRouter, Depends, HTTPException, WebSocket
-from starlette.websockets import WebSocketDisconnect
 
 from app import xray
-from app.db import Session, get_db
+from app.db import Session, crud, get_db
 from app.models.admin import Admin
 from app.models.core import CoreStats
-from app.utils import responses
+from app.subscription import snapshot
+from app.utils import responses, workers
+from app.utils.logs import stream_logs
 from app.xray import XRayConfig
 from config import XRAY_JSON
 
@@ -29,6 +28,12 @@ async def core_logs(websocket: WebSocket, db: Session = Depends(get_db)):
     if not admin.is_sudo:
         return await websocket.close(reason="You're not allowed", code=4403)
 
+    if workers.enabled and not workers.is_leader:
+        return await websocket.close(
+            reason="Served by a follower worker, the logs are only streamed by the leader, reconnect",
+            code=4409,
+        )
+
     interval = websocket.query_params.get("interval")
     if interval:
         try:
@@ -42,58 +47,32 @@ async def core_logs(websocket: WebSocket, db: Session = Depends(get_db)):
 
     await websocket.accept()
 
-    cache = ""
-    last_sent_ts = 0
     with xray.core.get_logs() as logs:
-        while True:
-            if interval and time.time() - last_sent_ts >= interval and cache:
-                try:
-                    await websocket.send_text(cache)
-                except (WebSocketDisconnect, RuntimeError):
-                    break
-                cache = ""
-                last_sent_ts = time.time()
-
-            if not logs:
-                try:
-                    await asyncio.wait_for(websocket.receive(), timeout=0.2)
-                    continue
-                except asyncio.TimeoutError:
-                    continue
-                except (WebSocketDisconnect, RuntimeError):
-                    break
-
-            log = logs.popleft()
-
-            if interval:
-                cache += f"{log}\n"
-                continue
-
-            try:
-                await websocket.send_text(log)
-            except (WebSocketDisconnect, RuntimeError):
-                break
+        await stream_logs(websocket, logs, interval)
+
+
+@workers.shared("core")
+def core_state():
+    return {"version": xray.core.version, "started": xray.core.started, **xray.core.stats()}
 
 
 @router.get("/core", response_model=CoreStats)
 def get_core_stats(admin: Admin = Depends(Admin.get_current)):
-    """Retrieve core statistics such as version and uptime."""
-    return CoreStats(
-        version=xray.core.version,
-        started=xray.core.started,
-        logs_websocket=router.url_path_for("core_logs"),
-    )
+    """
+    Retrieve core statistics such as version, uptime, restarts and resource usage.
+    With several workers, those of the leader's core, as of its last poll.
+    """
+    if workers.enabled and not workers.is_leader:
+        state = workers.leader_state().get("core") or {"version": xray.core.version, "started": False}
+    else:
+        state = core_state()
+    return CoreStats(logs_websocket=router.url_path_for("core_logs"), **state)
 
 
 @router.post("/core/restart", responses={403: responses._403})
 def restart_core(admin: Admin = Depends(Admin.check_sudo_admin)):
     """Restart the core and all connected nodes."""
-    startup_config = xray.config.include_db_users()
-    xray.core.restart(startup_config)
-
-    for node_id, node in list(xray.nodes.items()):
-        if node.connected:
-            xray.operations.restart_node(node_id, startup_config)
+    xray.operations.restart_core()
 
     return {}
 
@@ -109,7 +88,7 @@ def get_core_config(admin: Admin = Depends(Admin.check_sudo_admin)) -> dict:
 
 @router.put("/core/config", responses={403: responses._403})
 def modify_core_config(
-    payload: dict, admin: Admin = Depends(Admin.check_sudo_admin)
+    payload: dict, db: Session = Depends(get_db), admin: Admin = Depends(Admin.check_sudo_admin)
 ) -> dict:
     """Modify the core configuration and restart the core."""
     try:
@@ -120,13 +99,13 @@ def modify_core_config(
     xray.config = config
     with open(XRAY_JSON, "w") as f:
         f.write(json.dumps(payload, indent=4))
+    xray.operations.reload_config()
 
-    startup_config = xray.config.include_db_users()
-    xray.core.restart(startup_config)
-    for node_id, node in list(xray.nodes.items()):
-        if node.connected:
-            xray.operations.restart_node(node_id, startup_config)
+    xray.operations.restart_core()
 
-    xray.hosts.update()
+    crud.bump_hosts_revision(db)
+    db.commit()
+    xray.operations.update_hosts()
+    snapshot.mark_all()
 
     return payload
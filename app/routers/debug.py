@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.db import profile
+from app.models.admin import Admin
+from app.models.profile import QueryProfileEntry, QueryProfileResponse, QueryProfileSort, QueryProfileStatement
+from app.utils import responses
+
+router = APIRouter(
+    tags=["Debug"], prefix="/api/debug", responses={401: responses._401, 403: responses._403}
+)
+
+
+def check_profile_enabled():
+    if not profile.enabled:
+        raise HTTPException(status_code=404, detail="Query profiling is disabled")
+
+
+@router.get("/profile", response_model=QueryProfileResponse, dependencies=[Depends(check_profile_enabled)])
+def get_query_profile(
+    sort: QueryProfileSort = QueryProfileSort.time,
+    limit: int = Query(50, ge=1, le=1000),
+    _: Admin = Depends(Admin.check_sudo_admin),
+):
+    """
+    Get the SQL statements sent per request route and scheduler job, the most expensive first
+
+    Only available when QUERY_PROFILE is set. Times are in milliseconds, stats are of the worker
+    serving the request since its start or the last reset.
+    """
+    entries = sorted(profile.stats().items(), key=lambda item: getattr(item[1], sort.value), reverse=True)
+    return QueryProfileResponse(entries=[
+        QueryProfileEntry(
+            name=name,
+            runs=stats.runs,
+            statements=stats.statements,
+            time=stats.time * 1000,
+            max_statements=stats.max_statements,
+            max_time=stats.max_time * 1000,
+            slowest=[
+                QueryProfileStatement(time=seconds * 1000, statement=statement)
+                for seconds, statement in stats.slowest
+            ],
+            repeated=stats.repeated,
+        )
+        for name, stats in entries[:limit]
+    ])
+
+
+@router.delete("/profile", dependencies=[Depends(check_profile_enabled)])
+def reset_query_profile(_: Admin = Depends(Admin.check_sudo_admin)):
+    """Clear the collected stats of the worker serving the request."""
+    profile.reset()
+    return {"detail": "Query profile cleared"}
+
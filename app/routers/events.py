@@ -0,0 +1,63 @@
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from app.models.admin import Admin
+from app.utils import responses
+from app.utils.events import Event, EventsLost, bus
+
+router = APIRouter(tags=["Events"], prefix="/api", responses={401: responses._401})
+
+KEEPALIVE_INTERVAL = 15
+
+
+def format_event(event: Event) -> str:
+    data = jsonable_encoder({"type": event.type, "created_at": event.created_at, **event.data})
+    return f"id: {bus.format_id(event)}\nevent: {event.type}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.get("/events", response_class=StreamingResponse)
+async def stream_events(
+    types: Optional[str] = Query(None, description="Comma separated event type prefixes, e.g. `user,node.status`"),
+    last_event_id: Optional[str] = Header(None),
+    since: Optional[str] = Query(None, description="Event id to resume after, same as the `Last-Event-ID` header"),
+    admin: Admin = Depends(Admin.get_current),
+):
+    """
+    Stream changes of users, nodes, hosts and usage as server-sent events
+
+    Every event has an `id`; reconnect with it in `Last-Event-ID` (or `since`) to receive what
+    was missed. When that isn't possible, e.g. the panel restarted or the id is too old, a `reset`
+    event is sent and the stream closes; resync from `/api/users/changes` then.
+
+    Non-sudo admins receive the events of their own users, bulk changes and usage of their
+    users, and hosts changes. `usage.recorded` events sum up each usage flush per admin, with
+    the number of users who used traffic and the traffic, and aren't replayed on reconnect.
+    """
+    type_filter = [t.strip() for t in types.split(",") if t.strip()] if types else None
+    owner = None if admin.is_sudo else admin.username
+    resume_id = last_event_id or since
+
+    async def stream():
+        seq = bus.parse_id(resume_id)
+        if resume_id and seq is None:
+            yield "event: reset\ndata: {}\n\n"
+            return
+
+        try:
+            async for event in bus.subscribe(seq, keepalive=KEEPALIVE_INTERVAL):
+                if event is None:
+                    yield ": keepalive\n\n"
+                elif event.matches(type_filter, owner):
+                    yield format_event(event)
+        except EventsLost:
+            yield "event: reset\ndata: {}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
@@ -0,0 +1,29 @@
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+
+from config import METRICS_ENABLED, METRICS_TOKEN
+
+router = APIRouter(tags=["Metrics"])
+
+
+def check_metrics_token(authorization: str = Header(default="")):
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    if not METRICS_TOKEN:
+        return
+
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@router.get("/metrics", dependencies=[Depends(check_metrics_token)], include_in_schema=False)
+def get_metrics():
+    """Prometheus metrics of the worker serving the request, see app/metrics."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -1,13 +1,10 @@
-import asyncio
-import time
 from typing import List
 
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, WebSocket
 from sqlalchemy.exc import IntegrityError
-from starlette.websockets import WebSocketDisconnect
 
 from app import logger, xray
-from app.db import Session, crud, get_db
+from app.db import Session, crud, get_db, get_read_db
 from app.dependencies import get_dbnode, validate_dates
 from app.models.admin import Admin
 from app.models.node import (
@@ -17,9 +14,11 @@ from app.models.node import (
     NodeSettings,
     NodeStatus,
     NodesUsageResponse,
+    UsagePeriod,
 )
 from app.models.proxy import ProxyHost
-from app.utils import responses
+from app.utils import responses, workers
+from app.utils.logs import stream_logs
 
 router = APIRouter(
     tags=["Node"], prefix="/api", responses={401: responses._401, 403: responses._403}
@@ -35,7 +34,7 @@ def add_host_if_needed(new_node: NodeCreate, db: Session):
         )
         for inbound_tag in xray.config.inbounds_by_tag:
             crud.add_host(db, inbound_tag, host)
-        xray.hosts.update()
+        xray.operations.update_hosts()
 
 
 @router.get("/node/settings", response_model=NodeSettings)
@@ -91,6 +90,12 @@ async def node_logs(node_id: int, websocket: WebSocket, db: Session = Depends(ge
     if not admin.is_sudo:
         return await websocket.close(reason="You're not allowed", code=4403)
 
+    if workers.enabled and not workers.is_leader:
+        return await websocket.close(
+            reason="Served by a follower worker, the logs are only streamed by the leader, reconnect",
+            code=4409,
+        )
+
     if not xray.nodes.get(node_id):
         return await websocket.close(reason="Node not found", code=4404)
 
@@ -110,41 +115,9 @@ async def node_logs(node_id: int, websocket: WebSocket, db: Session = Depends(ge
 
     await websocket.accept()
 
-    cache = ""
-    last_sent_ts = 0
     node = xray.nodes[node_id]
     with node.get_logs() as logs:
-        while True:
-            if not node == xray.nodes[node_id]:
-                break
-
-            if interval and time.time() - last_sent_ts >= interval and cache:
-                try:
-                    await websocket.send_text(cache)
-                except (WebSocketDisconnect, RuntimeError):
-                    break
-                cache = ""
-                last_sent_ts = time.time()
-
-            if not logs:
-                try:
-                    await asyncio.wait_for(websocket.receive(), timeout=0.2)
-                    continue
-                except asyncio.TimeoutError:
-                    continue
-                except (WebSocketDisconnect, RuntimeError):
-                    break
-
-            log = logs.popleft()
-
-            if interval:
-                cache += f"{log}\n"
-                continue
-
-            try:
-                await websocket.send_text(log)
-            except (WebSocketDisconnect, RuntimeError):
-                break
+        await stream_logs(websocket, logs, interval, alive=lambda: node == xray.nodes.get(node_id))
 
 
 @router.get("/nodes", response_model=List[NodeResponse])
@@ -200,14 +173,19 @@ def remove_node(
 
 @router.get("/nodes/usage", response_model=NodesUsageResponse)
 def get_usage(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     start: str = "",
     end: str = "",
+    period: UsagePeriod = None,
     _: Admin = Depends(Admin.check_sudo_admin),
 ):
-    """Retrieve usage statistics for nodes within a specified date range."""
+    """
+    Retrieve usage statistics for nodes within a specified date range.
+
+    Usages are split into hourly or daily buckets when `period` is given.
+    """
     start, end = validate_dates(start, end)
 
-    usages = crud.get_nodes_usage(db, start, end)
+    usages = crud.get_nodes_usage(db, start, end, period)
 
     return {"usages": usages}
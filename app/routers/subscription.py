@@ -1,16 +1,44 @@
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from distutils.version import LooseVersion
+from typing import NamedTuple, Optional, Tuple, Union
 
-from fastapi import APIRouter, Depends, Header, Path, Request, Response
-from fastapi.responses import HTMLResponse
+import anyio
+from fastapi import APIRouter, Header, Path, Request, Response
+from fastapi.responses import FileResponse, HTMLResponse
 
-from app.db import Session, crud, get_db
+from app import __version__, xray
+from app.db import GetDB, crud
 from app.dependencies import get_validated_sub, validate_dates
+from app.metrics import SUBSCRIPTION_DURATION, SUBSCRIPTION_RESPONSES
 from app.models.user import SubscriptionUserResponse, UserResponse
-from app.subscription.share import encode_title, generate_subscription
-from app.templates import render_template
+from app.subscription import snapshot
+from app.subscription.share import client_config, encode_title, generate_subscription
+from app.templates import render_template, template_versions
+from app.utils.concurrency import ConcurrencyLimiter, run_in_executor, run_in_threadpool
+from app.utils.response_cache import cached_response, encoded_etag, etag_matches, make_etag, not_modified
 from config import (
+    ACTIVE_STATUS_TEXT,
+    CLASH_SETTINGS_TEMPLATE,
+    CLASH_SUBSCRIPTION_TEMPLATE,
+    DISABLED_STATUS_TEXT,
+    EXPIRED_STATUS_TEXT,
+    EXTERNAL_CONFIG,
+    GRPC_USER_AGENT_TEMPLATE,
+    LIMITED_STATUS_TEXT,
+    MUX_TEMPLATE,
+    ONHOLD_STATUS_TEXT,
+    SINGBOX_SETTINGS_TEMPLATE,
+    SINGBOX_SUBSCRIPTION_TEMPLATE,
+    SUB_CACHE_MAX_AGE,
+    SUB_DB_WORKERS,
+    SUB_MAX_CONCURRENT_REQUESTS,
+    SUB_MAX_QUEUED_REQUESTS,
     SUB_PROFILE_TITLE,
+    SUB_QUEUE_TIMEOUT,
+    SUB_RENDER_WORKERS,
+    SUB_SNAPSHOT_MAX_AGE,
     SUB_SUPPORT_URL,
     SUB_UPDATE_INTERVAL,
     SUBSCRIPTION_PAGE_TEMPLATE,
@@ -19,21 +47,34 @@ from config import (
     USE_CUSTOM_JSON_FOR_STREISAND,
     USE_CUSTOM_JSON_FOR_V2RAYN,
     USE_CUSTOM_JSON_FOR_V2RAYNG,
+    USER_AGENT_TEMPLATE,
+    V2RAY_SETTINGS_TEMPLATE,
+    V2RAY_SUBSCRIPTION_TEMPLATE,
     XRAY_SUBSCRIPTION_PATH,
 )
 
-client_config = {
-    "clash-meta": {"config_format": "clash-meta", "media_type": "text/yaml", "as_base64": False, "reverse": False},
-    "sing-box": {"config_format": "sing-box", "media_type": "application/json", "as_base64": False, "reverse": False},
-    "clash": {"config_format": "clash", "media_type": "text/yaml", "as_base64": False, "reverse": False},
-    "v2ray": {"config_format": "v2ray", "media_type": "text/plain", "as_base64": True, "reverse": False},
-    "outline": {"config_format": "outline", "media_type": "application/json", "as_base64": False, "reverse": False},
-    "v2ray-json": {"config_format": "v2ray-json", "media_type": "application/json", "as_base64": False,
-                   "reverse": False}
-}
-
 router = APIRouter(tags=['Subscription'], prefix=f'/{XRAY_SUBSCRIPTION_PATH}')
 
+# Subscriptions don't share starlette's default threadpool with the rest of the API,
+# db calls and rendering have their own bounded pools and every endpoint its own queue.
+db_limiter = anyio.CapacityLimiter(SUB_DB_WORKERS)
+render_executor = ThreadPoolExecutor(max_workers=SUB_RENDER_WORKERS, thread_name_prefix="sub-render")
+
+subscription_limiter = ConcurrencyLimiter(SUB_MAX_CONCURRENT_REQUESTS, SUB_MAX_QUEUED_REQUESTS, SUB_QUEUE_TIMEOUT)
+info_limiter = ConcurrencyLimiter(SUB_MAX_CONCURRENT_REQUESTS, SUB_MAX_QUEUED_REQUESTS, SUB_QUEUE_TIMEOUT)
+usage_limiter = ConcurrencyLimiter(SUB_MAX_CONCURRENT_REQUESTS, SUB_MAX_QUEUED_REQUESTS, SUB_QUEUE_TIMEOUT)
+
+# subscriptions carry user credentials, shared caches must not keep them
+CACHE_CONTROL = f"private, max-age={SUB_CACHE_MAX_AGE}"
+
+
+class SnapshotUser(NamedTuple):
+    """The few user fields the response headers need when the subscription isn't rendered."""
+    username: str
+    used_traffic: int
+    data_limit: Optional[int]
+    expire: Optional[int]
+
 
 def get_subscription_user_info(user: UserResponse) -> dict:
     """Retrieve user subscription information including upload, download, total data, and expiry."""
@@ -45,150 +86,251 @@ def get_subscription_user_info(user: UserResponse) -> dict:
     }
 
 
-@router.get("/{token}/")
-@router.get("/{token}", include_in_schema=False)
-def user_subscription(
-    request: Request,
-    db: Session = Depends(get_db),
-    dbuser: UserResponse = Depends(get_validated_sub),
-    user_agent: str = Header(default="")
-):
-    """Provides a subscription link based on the user agent (Clash, V2Ray, etc.)."""
-    user: UserResponse = UserResponse.model_validate(dbuser)
-
-    accept_header = request.headers.get("Accept", "")
-    if "text/html" in accept_header:
-        return HTMLResponse(
-            render_template(
-                SUBSCRIPTION_PAGE_TEMPLATE,
-                {"user": user}
-            )
-        )
-
-    crud.update_user_sub(db, dbuser, user_agent)
-    response_headers = {
-        "content-disposition": f'attachment; filename="{user.username}"',
-        "profile-web-page-url": str(request.url),
-        "support-url": SUB_SUPPORT_URL,
-        "profile-title": encode_title(SUB_PROFILE_TITLE),
-        "profile-update-interval": SUB_UPDATE_INTERVAL,
-        "subscription-userinfo": "; ".join(
-            f"{key}={val}"
-            for key, val in get_subscription_user_info(user).items()
-        )
-    }
-
+def get_client_type(user_agent: str) -> str:
+    """Picks the subscription format (a `client_config` key) that suits the given user agent."""
     if re.match(r'^([Cc]lash-verge|[Cc]lash[-\.]?[Mm]eta|[Ff][Ll][Cc]lash|[Mm]ihomo)', user_agent):
-        conf = generate_subscription(user=user, config_format="clash-meta", as_base64=False, reverse=False)
-        return Response(content=conf, media_type="text/yaml", headers=response_headers)
+        return "clash-meta"
 
     elif re.match(r'^([Cc]lash|[Ss]tash)', user_agent):
-        conf = generate_subscription(user=user, config_format="clash", as_base64=False, reverse=False)
-        return Response(content=conf, media_type="text/yaml", headers=response_headers)
+        return "clash"
 
     elif re.match(r'^(SFA|SFI|SFM|SFT|[Kk]aring|[Hh]iddify[Nn]ext)', user_agent):
-        conf = generate_subscription(user=user, config_format="sing-box", as_base64=False, reverse=False)
-        return Response(content=conf, media_type="application/json", headers=response_headers)
+        return "sing-box"
 
     elif re.match(r'^(SS|SSR|SSD|SSS|Outline|Shadowsocks|SSconf)', user_agent):
-        conf = generate_subscription(user=user, config_format="outline", as_base64=False, reverse=False)
-        return Response(content=conf, media_type="application/json", headers=response_headers)
+        return "outline"
 
     elif (USE_CUSTOM_JSON_DEFAULT or USE_CUSTOM_JSON_FOR_V2RAYN) and re.match(r'^v2rayN/(\d+\.\d+)', user_agent):
         version_str = re.match(r'^v2rayN/(\d+\.\d+)', user_agent).group(1)
         if LooseVersion(version_str) >= LooseVersion("6.40"):
-            conf = generate_subscription(user=user, config_format="v2ray-json", as_base64=False, reverse=False)
-            return Response(content=conf, media_type="application/json", headers=response_headers)
+            return "v2ray-json"
         else:
-            conf = generate_subscription(user=user, config_format="v2ray", as_base64=True, reverse=False)
-            return Response(content=conf, media_type="text/plain", headers=response_headers)
+            return "v2ray"
 
     elif (USE_CUSTOM_JSON_DEFAULT or USE_CUSTOM_JSON_FOR_V2RAYNG) and re.match(r'^v2rayNG/(\d+\.\d+\.\d+)', user_agent):
         version_str = re.match(r'^v2rayNG/(\d+\.\d+\.\d+)', user_agent).group(1)
         if LooseVersion(version_str) >= LooseVersion("1.8.29"):
-            conf = generate_subscription(user=user, config_format="v2ray-json", as_base64=False, reverse=False)
-            return Response(content=conf, media_type="application/json", headers=response_headers)
+            return "v2ray-json"
         elif LooseVersion(version_str) >= LooseVersion("1.8.18"):
-            conf = generate_subscription(user=user, config_format="v2ray-json", as_base64=False, reverse=True)
-            return Response(content=conf, media_type="application/json", headers=response_headers)
+            return "v2ray-json-reverse"
         else:
-            conf = generate_subscription(user=user, config_format="v2ray", as_base64=True, reverse=False)
-            return Response(content=conf, media_type="text/plain", headers=response_headers)
+            return "v2ray"
 
     elif re.match(r'^[Ss]treisand', user_agent):
         if USE_CUSTOM_JSON_DEFAULT or USE_CUSTOM_JSON_FOR_STREISAND:
-            conf = generate_subscription(user=user, config_format="v2ray-json", as_base64=False, reverse=False)
-            return Response(content=conf, media_type="application/json", headers=response_headers)
+            return "v2ray-json"
         else:
-            conf = generate_subscription(user=user, config_format="v2ray", as_base64=True, reverse=False)
-            return Response(content=conf, media_type="text/plain", headers=response_headers)
+            return "v2ray"
 
     elif (USE_CUSTOM_JSON_DEFAULT or USE_CUSTOM_JSON_FOR_HAPP) and re.match(r'^Happ/(\d+\.\d+\.\d+)', user_agent):
         version_str = re.match(r'^Happ/(\d+\.\d+\.\d+)', user_agent).group(1)
         if LooseVersion(version_str) >= LooseVersion("1.63.1"):
-            conf = generate_subscription(user=user, config_format="v2ray-json", as_base64=False, reverse=False)
-            return Response(content=conf, media_type="application/json", headers=response_headers)
+            return "v2ray-json"
         else:
-            conf = generate_subscription(user=user, config_format="v2ray", as_base64=True, reverse=False)
-            return Response(content=conf, media_type="text/plain", headers=response_headers)
+            return "v2ray"
 
+    else:
+        return "v2ray"
 
 
-    else:
-        conf = generate_subscription(user=user, config_format="v2ray", as_base64=True, reverse=False)
-        return Response(content=conf, media_type="text/plain", headers=response_headers)
+def get_response_headers(request: Request, user: Union[UserResponse, SnapshotUser]) -> dict:
+    return {
+        "content-disposition": f'attachment; filename="{user.username}"',
+        "profile-web-page-url": str(request.url),
+        "support-url": SUB_SUPPORT_URL,
+        "profile-title": encode_title(SUB_PROFILE_TITLE),
+        "profile-update-interval": SUB_UPDATE_INTERVAL,
+        "subscription-userinfo": "; ".join(
+            f"{key}={val}"
+            for key, val in get_subscription_user_info(user).items()
+        )
+    }
 
 
-@router.get("/{token}/info", response_model=SubscriptionUserResponse)
-def user_subscription_info(
-    dbuser: UserResponse = Depends(get_validated_sub),
+def load_subscription_user(token: str, user_agent: str = None) -> UserResponse:
+    """
+    Validates the token and loads the user, runs on the subscription db pool.
+
+    The sub update time and user agent are recorded when `user_agent` is given.
+    """
+    with GetDB() as db:
+        dbuser = get_validated_sub(token, db)
+        user = UserResponse.model_validate(dbuser)
+        if user_agent is not None:
+            crud.update_user_sub(db, dbuser, user_agent)
+        return user
+
+
+# besides the user and the hosts, subscriptions are rendered from these settings and templates,
+# which change without a revision
+RENDER_SETTINGS = (
+    __version__, EXTERNAL_CONFIG,
+    ACTIVE_STATUS_TEXT, EXPIRED_STATUS_TEXT, LIMITED_STATUS_TEXT, DISABLED_STATUS_TEXT, ONHOLD_STATUS_TEXT,
+)
+RENDER_TEMPLATES = (
+    CLASH_SUBSCRIPTION_TEMPLATE, CLASH_SETTINGS_TEMPLATE, SINGBOX_SUBSCRIPTION_TEMPLATE, SINGBOX_SETTINGS_TEMPLATE,
+    V2RAY_SUBSCRIPTION_TEMPLATE, V2RAY_SETTINGS_TEMPLATE, MUX_TEMPLATE, USER_AGENT_TEMPLATE, GRPC_USER_AGENT_TEMPLATE,
+)
+
+
+def subscription_etag(dbuser, hosts_revision: Optional[int], client_type: str) -> str:
+    """
+    The ETag of a user's subscription in `client_type`, known without rendering it.
+
+    The links change with the user or the inbounds and hosts, which bump their
+    revisions. The hosts revision is the one this process loaded its inbounds and hosts
+    from, not the database's, which may be ahead until they're reloaded. The ETag also
+    changes with `RENDER_SETTINGS` and `RENDER_TEMPLATES`, and as remarks may show the
+    usage and the time left, with the usage and every SUB_SNAPSHOT_MAX_AGE seconds.
+    """
+    period = int(time.time()) // max(SUB_SNAPSHOT_MAX_AGE, 1)
+    return make_etag(
+        dbuser.revision, hosts_revision, client_type, dbuser.used_traffic, period,
+        RENDER_SETTINGS, template_versions(*RENDER_TEMPLATES),
+    )
+
+
+def load_subscription(
+    request: Request, token: str, client_type: str, user_agent: str = None
+) -> Tuple[Union[UserResponse, SnapshotUser], Optional[str], Optional[dict]]:
+    """
+    Like `load_subscription_user`, but skips building the user's links when a snapshot
+    of `client_type` exists or the client has the subscription already.
+
+    Returns the user, the ETag of the subscription and the snapshot entry, either the
+    ETag or the entry.
+    """
+    with GetDB() as db:
+        dbuser = get_validated_sub(token, db)
+        entry = snapshot.store.get(dbuser.username, client_type) if snapshot.store else None
+        etag = None if entry else subscription_etag(dbuser, xray.hosts_revision, client_type)
+        if entry or not_modified(request, etag):
+            user = SnapshotUser(dbuser.username, dbuser.used_traffic, dbuser.data_limit, dbuser.expire)
+        else:
+            user = UserResponse.model_validate(dbuser)
+            if snapshot.store:
+                snapshot.mark_user(dbuser.id)
+        if user_agent is not None:
+            crud.update_user_sub(db, dbuser, user_agent)
+        return user, etag, entry
+
+
+def load_subscription_info(token: str) -> SubscriptionUserResponse:
+    with GetDB() as db:
+        return SubscriptionUserResponse.model_validate(get_validated_sub(token, db))
+
+
+def load_subscription_usage(token: str, start: str, end: str) -> dict:
+    start, end = validate_dates(start, end)
+    with GetDB() as db:
+        dbuser = get_validated_sub(token, db)
+        usages = crud.get_user_usages(db, dbuser, start, end)
+        return {"usages": usages, "username": dbuser.username}
+
+
+def build_subscription_response(request: Request, user: UserResponse, client_type: str, etag: str) -> Response:
+    config = client_config[client_type]
+    conf = generate_subscription(
+        user=user,
+        config_format=config["config_format"],
+        as_base64=config["as_base64"],
+        reverse=config["reverse"]
+    )
+    return cached_response(
+        request,
+        conf.encode(),
+        media_type=config["media_type"],
+        headers=get_response_headers(request, user),
+        etag=etag,
+        cache_control=CACHE_CONTROL,
+    )
+
+
+async def render_subscription(request: Request, user: UserResponse, client_type: str, etag: str) -> Response:
+    # compression happens along with rendering, off the event loop
+    return await run_in_executor(render_executor, build_subscription_response, request, user, client_type, etag)
+
+
+def snapshot_response(request: Request, user: SnapshotUser, entry: dict) -> Response:
+    compressed = "gzip" in request.headers.get("accept-encoding", "")
+    etag = encoded_etag(f'"{entry["digest"]}"', "gzip" if compressed else None)
+    headers = get_response_headers(request, user)
+    headers.update({"etag": etag, "cache-control": CACHE_CONTROL, "vary": "accept-encoding"})
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if compressed:
+        headers["content-encoding"] = "gzip"
+    path = snapshot.store.blob_path(entry["digest"], compressed=compressed)
+    return FileResponse(path, media_type=entry["media_type"], headers=headers)
+
+
+async def load_and_serve_subscription(
+    request: Request, token: str, client_type: str, user_agent: str = None
+) -> Tuple[Response, str]:
+    """The response and its source, a snapshot or rendered."""
+    user, etag, entry = await run_in_threadpool(
+        db_limiter, load_subscription, request, token, client_type, user_agent
+    )
+    if entry:
+        return snapshot_response(request, user, entry), "snapshot"
+    if response := not_modified(request, etag, get_response_headers(request, user), CACHE_CONTROL):
+        return response, "rendered"
+    return await render_subscription(request, user, client_type, etag), "rendered"
+
+
+async def serve_subscription(request: Request, token: str, client_type: str, user_agent: str = None) -> Response:
+    started = time.perf_counter()
+    response, source = await load_and_serve_subscription(request, token, client_type, user_agent)
+    SUBSCRIPTION_DURATION.labels(client_type).observe(time.perf_counter() - started)
+    SUBSCRIPTION_RESPONSES.labels(client_type, "not_modified" if response.status_code == 304 else source).inc()
+    return response
+
+
+@router.get("/{token}/")
+@router.get("/{token}", include_in_schema=False)
+async def user_subscription(
+    request: Request,
+    token: str,
+    user_agent: str = Header(default="")
 ):
+    """Provides a subscription link based on the user agent (Clash, V2Ray, etc.)."""
+    async with subscription_limiter:
+        accept_header = request.headers.get("Accept", "")
+        if "text/html" in accept_header:
+            user = await run_in_threadpool(db_limiter, load_subscription_user, token)
+            return HTMLResponse(
+                await run_in_executor(render_executor, render_template, SUBSCRIPTION_PAGE_TEMPLATE, {"user": user})
+            )
+
+        return await serve_subscription(request, token, get_client_type(user_agent), user_agent)
+
+
+@router.get("/{token}/info", response_model=SubscriptionUserResponse)
+async def user_subscription_info(token: str):
     """Retrieves detailed information about the user's subscription."""
-    return dbuser
+    async with info_limiter:
+        return await run_in_threadpool(db_limiter, load_subscription_info, token)
 
 
 @router.get("/{token}/usage")
-def user_get_usage(
-    dbuser: UserResponse = Depends(get_validated_sub),
+async def user_get_usage(
+    token: str,
     start: str = "",
     end: str = "",
-    db: Session = Depends(get_db)
 ):
     """Fetches the usage statistics for the user within a specified date range."""
-    start, end = validate_dates(start, end)
-
-    usages = crud.get_user_usages(db, dbuser, start, end)
-
-    return {"usages": usages, "username": dbuser.username}
+    async with usage_limiter:
+        return await run_in_threadpool(db_limiter, load_subscription_usage, token, start, end)
 
 
 @router.get("/{token}/{client_type}")
-def user_subscription_with_client_type(
+async def user_subscription_with_client_type(
     request: Request,
-    dbuser: UserResponse = Depends(get_validated_sub),
+    token: str,
     client_type: str = Path(..., regex="sing-box|clash-meta|clash|outline|v2ray|v2ray-json"),
-    db: Session = Depends(get_db),
-    user_agent: str = Header(default="")
 ):
     """Provides a subscription link based on the specified client type (e.g., Clash, V2Ray)."""
-    user: UserResponse = UserResponse.model_validate(dbuser)
-
-    response_headers = {
-        "content-disposition": f'attachment; filename="{user.username}"',
-        "profile-web-page-url": str(request.url),
-        "support-url": SUB_SUPPORT_URL,
-        "profile-title": encode_title(SUB_PROFILE_TITLE),
-        "profile-update-interval": SUB_UPDATE_INTERVAL,
-        "subscription-userinfo": "; ".join(
-            f"{key}={val}"
-            for key, val in get_subscription_user_info(user).items()
-        )
-    }
-
-    config = client_config.get(client_type)
-    conf = generate_subscription(user=user,
-                                 config_format=config["config_format"],
-                                 as_base64=config["as_base64"],
-                                 reverse=config["reverse"])
-
-    return Response(content=conf, media_type=config["media_type"], headers=response_headers)
+    async with subscription_limiter:
+        return await serve_subscription(request, token, client_type)
@@ -3,12 +3,12 @@ from typing import Dict, List, Union
 from fastapi import APIRouter, Depends, HTTPException
 
 from app import __version__, xray
-from app.db import Session, crud, get_db
+from app.db import Session, crud, get_db, get_read_db
 from app.models.admin import Admin
 from app.models.proxy import ProxyHost, ProxyInbound, ProxyTypes
-from app.models.system import SystemStats
+from app.models.system import SystemStats, WebhookStats
 from app.models.user import UserStatus
-from app.utils import responses
+from app.utils import responses, webhook
 from app.utils.system import cpu_usage, memory_usage, realtime_bandwidth
 
 router = APIRouter(tags=["System"], prefix="/api", responses={401: responses._401})
@@ -16,7 +16,7 @@ router = APIRouter(tags=["System"], prefix="/api", responses={401: responses._40
 
 @router.get("/system", response_model=SystemStats)
 def get_system_stats(
-    db: Session = Depends(get_db), admin: Admin = Depends(Admin.get_current)
+    db: Session = Depends(get_read_db), admin: Admin = Depends(Admin.get_current)
 ):
     """Fetch system stats including memory, CPU, and user metrics."""
     mem = memory_usage()
@@ -63,6 +63,16 @@ def get_system_stats(
     )
 
 
+@router.get("/system/webhooks", response_model=List[WebhookStats])
+def get_webhook_stats(admin: Admin = Depends(Admin.check_sudo_admin)):
+    """
+    Fetch delivery stats of every webhook address.
+
+    `lag` is the age in seconds of the oldest undelivered notification.
+    """
+    return webhook.stats()
+
+
 @router.get("/inbounds", response_model=Dict[ProxyTypes, List[ProxyInbound]])
 def get_inbounds(admin: Admin = Depends(Admin.get_current)):
     """Retrieve inbound configurations grouped by protocol."""
@@ -98,6 +108,6 @@ def modify_hosts(
     for inbound_tag, hosts in modified_hosts.items():
         crud.update_hosts(db, inbound_tag, hosts)
 
-    xray.hosts.update()
+    xray.operations.update_hosts()
 
     return {tag: crud.get_hosts(db, tag) for tag in xray.config.inbounds_by_tag}
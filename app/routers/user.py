@@ -1,16 +1,18 @@
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Union
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
 from sqlalchemy.exc import IntegrityError
 
 from app import logger, xray
-from app.db import Session, crud, get_db
+from app.db import Session, crud, get_db, get_read_db
 from app.dependencies import get_expired_users_list, get_validated_user, validate_dates
 from app.models.admin import Admin
+from app.models.node import UsagePeriod
 from app.models.user import (
     UserCreate,
     UserModify,
+    UserChangesResponse,
     UserResponse,
     UsersResponse,
     UserStatus,
@@ -18,6 +20,7 @@ from app.models.user import (
     UserUsagesResponse,
 )
 from app.utils import report, responses
+from app.utils.response_cache import cached_response
 
 router = APIRouter(tags=["User"], prefix="/api", responses={401: responses._401})
 
@@ -201,6 +204,7 @@ def revoke_user_subscription(
 
 @router.get("/users", response_model=UsersResponse, responses={400: responses._400, 403: responses._403, 404: responses._404})
 def get_users(
+    request: Request,
     offset: int = None,
     limit: int = None,
     username: List[str] = Query(None),
@@ -208,7 +212,7 @@ def get_users(
     owner: Union[List[str], None] = Query(None, alias="admin"),
     status: UserStatus = None,
     sort: str = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     admin: Admin = Depends(Admin.get_current),
 ):
     """Get all users"""
@@ -235,7 +239,50 @@ def get_users(
         return_with_count=True,
     )
 
-    return {"users": users, "total": count}
+    response = UsersResponse.model_validate({"users": users, "total": count}, from_attributes=True)
+    return cached_response(request, response.model_dump_json().encode(), media_type="application/json")
+
+
+@router.get("/users/changes", response_model=UserChangesResponse)
+def get_user_changes(
+    since_revision: int = Query(0, ge=0),
+    since_id: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1),
+    db: Session = Depends(get_read_db),
+    admin: Admin = Depends(Admin.get_current),
+):
+    """
+    Get users changed or deleted after the given cursor
+
+    - **since_revision**, **since_id**: The `next_cursor` of the client's last call, `0` returns every user.
+    - **limit**: Max number of changes to return, continue from `next_cursor`.
+
+    Users are listed in `users` and deleted users in `deleted`, which are kept for
+    USER_TOMBSTONE_RETENTION_DAYS: a client that last synced earlier resyncs from `0` and
+    drops the users it has that aren't returned. When nothing is returned the client is up
+    to date. `revision` is the latest revision; usage counters don't advance revisions.
+    A changed `hosts_revision` means every user's links changed.
+    """
+    revision, hosts_revision = crud.get_revisions(db)
+    users, deleted = crud.get_user_changes(
+        db=db,
+        since_revision=since_revision,
+        since_id=since_id,
+        limit=limit,
+        admins=None if admin.is_sudo else [admin.username],
+    )
+    cursor = max(
+        [(since_revision, since_id)]
+        + [(user.revision, user.id) for user in users]
+        + [(tombstone.revision, tombstone.user_id) for tombstone in deleted]
+    )
+    return {
+        "users": users,
+        "deleted": deleted,
+        "revision": revision,
+        "hosts_revision": hosts_revision,
+        "next_cursor": {"since_revision": cursor[0], "since_id": cursor[1]},
+    }
 
 
 @router.post("/users/reset", responses={403: responses._403, 404: responses._404})
@@ -245,11 +292,7 @@ def reset_users_data_usage(
     """Reset all users data usage"""
     dbadmin = crud.get_admin(db, admin.username)
     crud.reset_all_users_data_usage(db=db, admin=dbadmin)
-    startup_config = xray.config.include_db_users()
-    xray.core.restart(startup_config)
-    for node_id, node in list(xray.nodes.items()):
-        if node.connected:
-            xray.operations.restart_node(node_id, startup_config)
+    xray.operations.restart_core()
     return {"detail": "Users successfully reset."}
 
 
@@ -258,12 +301,19 @@ def get_user_usage(
     dbuser: UserResponse = Depends(get_validated_user),
     start: str = "",
     end: str = "",
-    db: Session = Depends(get_db),
+    period: UsagePeriod = None,
+    db: Session = Depends(get_read_db),
 ):
-    """Get users usage"""
+    """
+    Get users usage, split into hourly or daily buckets when `period` is given
+
+    Usages are stored per hour, and per day or month once rolled up after
+    USAGE_HOURLY_RETENTION_DAYS and USAGE_DAILY_RETENTION_DAYS. The range is widened to the
+    stored hours, days or months it overlaps, which are dated at their start.
+    """
     start, end = validate_dates(start, end)
 
-    usages = crud.get_user_usages(db, dbuser, start, end)
+    usages = crud.get_user_usages(db, dbuser, start, end, period)
 
     return {"usages": usages, "username": dbuser.username}
 
@@ -299,15 +349,20 @@ def active_next_plan(
 def get_users_usage(
     start: str = "",
     end: str = "",
-    db: Session = Depends(get_db),
+    period: UsagePeriod = None,
+    db: Session = Depends(get_read_db),
     owner: Union[List[str], None] = Query(None, alias="admin"),
     admin: Admin = Depends(Admin.get_current),
 ):
-    """Get all users usage"""
+    """
+    Get all users usage, split into hourly or daily buckets when `period` is given
+
+    The range is widened to the stored hours, days or months it overlaps, as for a user's usage.
+    """
     start, end = validate_dates(start, end)
 
     usages = crud.get_all_users_usages(
-        db=db, start=start, end=end, admin=owner if admin.is_sudo else [admin.username]
+        db=db, start=start, end=end, admin=owner if admin.is_sudo else [admin.username], period=period
     )
 
     return {"usages": usages}
@@ -337,7 +392,7 @@ def set_owner(
 def get_expired_users(
     expired_after: Optional[datetime] = Query(None, example="2024-01-01T00:00:00"),
     expired_before: Optional[datetime] = Query(None, example="2024-01-31T23:59:59"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     admin: Admin = Depends(Admin.get_current),
 ):
     """
@@ -360,6 +415,7 @@ def delete_expired_users(
     bg: BackgroundTasks,
     expired_after: Optional[datetime] = Query(None, example="2024-01-01T00:00:00"),
     expired_before: Optional[datetime] = Query(None, example="2024-01-31T23:59:59"),
+    dry_run: bool = False,
     db: Session = Depends(get_db),
     admin: Admin = Depends(Admin.get_current),
 ):
@@ -368,29 +424,31 @@ def delete_expired_users(
 
     - **expired_after** UTC datetime (optional)
     - **expired_before** UTC datetime (optional)
+    - **dry_run** only return the users that would be deleted
     - At least one of expired_after or expired_before must be provided
     """
     expired_after, expired_before = validate_dates(expired_after, expired_before)
 
     expired_users = get_expired_users_list(db, admin, expired_after, expired_before)
-    removed_users = [u.username for u in expired_users]
+    removed_users = [
+        (u.id, u.username, Admin.model_validate(u.admin) if u.admin else None) for u in expired_users
+    ]
 
     if not removed_users:
         raise HTTPException(
             status_code=404, detail="No expired users found in the specified date range"
         )
 
-    crud.remove_users(db, expired_users)
+    if dry_run:
+        return [username for _, username, _ in removed_users]
 
-    for removed_user in removed_users:
-        logger.info(f'User "{removed_user}" deleted')
-        bg.add_task(
-            report.user_deleted,
-            username=removed_user,
-            user_admin=next(
-                (u.admin for u in expired_users if u.username == removed_user), None
-            ),
-            by=admin,
-        )
+    stats = crud.bulk_remove_users(db, expired_users)
+    bg.add_task(xray.operations.remove_users, [(user_id, username) for user_id, username, _ in removed_users])
+
+    for _, username, user_admin in removed_users:
+        logger.info(f'User "{username}" deleted')
+        bg.add_task(report.user_deleted, username=username, user_admin=user_admin, by=admin)
 
-    return removed_users
+    logger.info(f"Deleted {len(removed_users)} expired users: "
+                + ", ".join(f"{count} {table}" for table, count in stats.items()))
+    return [username for _, username, _ in removed_users]
@@ -1,7 +1,24 @@
-from .v2ray import V2rayJsonConfig, V2rayShareLink
-from .singbox import SingBoxConfiguration
-from .outline import OutlineConfiguration
-from .clash import ClashConfiguration, ClashMetaConfiguration
+import importlib
+
+# the formats are imported on first use, they load jinja2 and yaml which most
+# importers of app.subscription (e.g. app.subscription.snapshot) don't need
+_formats = {
+    "V2rayJsonConfig": "v2ray",
+    "V2rayShareLink": "v2ray",
+    "SingBoxConfiguration": "singbox",
+    "OutlineConfiguration": "outline",
+    "ClashConfiguration": "clash",
+    "ClashMetaConfiguration": "clash",
+}
+
+
+def __getattr__(name: str):
+    if name not in _formats:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_formats[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
 
 __all__ = [
     "V2rayJsonConfig",
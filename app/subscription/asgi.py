@@ -0,0 +1,35 @@
+"""
+ASGI application that serves only the subscription endpoints, run by sub.py.
+
+It shares the database with the panel but doesn't start the scheduler, the telegram bot
+or the Xray core, and doesn't need the Xray config: the inbounds and hosts are the ones
+the panel publishes (see app/xray/published.py). It can be scaled on its own, any number
+of them behind a load balancer.
+"""
+
+from fastapi import FastAPI
+
+from app import __version__
+from app.routers import metrics, subscription
+from app.xray import published
+
+app = FastAPI(
+    title="MarzbanSubscription",
+    version=__version__,
+    docs_url=None,
+    redoc_url=None,
+    openapi_url=None,
+)
+app.include_router(subscription.router)
+app.include_router(metrics.router)
+
+
+@app.on_event("startup")
+def on_startup():
+    published.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    published.stop()
+    subscription.render_executor.shutdown(wait=False)
@@ -9,13 +9,14 @@ from typing import TYPE_CHECKING, List, Literal, Union
 from jdatetime import date as jd
 
 from app import xray
-from app.utils.system import get_public_ip, get_public_ipv6, readable_size
-
-from . import *
+from app.utils.system import public_ips, readable_size
 
 if TYPE_CHECKING:
     from app.models.user import UserResponse
 
+    from . import (ClashConfiguration, ClashMetaConfiguration, OutlineConfiguration,
+                   SingBoxConfiguration, V2rayJsonConfig, V2rayShareLink)
+
 from config import (
     ACTIVE_STATUS_TEXT,
     DISABLED_STATUS_TEXT,
@@ -24,8 +25,18 @@ from config import (
     ONHOLD_STATUS_TEXT,
 )
 
-SERVER_IP = get_public_ip()
-SERVER_IPV6 = get_public_ipv6()
+# subscription formats served to clients, keyed by client type
+client_config = {
+    "clash-meta": {"config_format": "clash-meta", "media_type": "text/yaml", "as_base64": False, "reverse": False},
+    "sing-box": {"config_format": "sing-box", "media_type": "application/json", "as_base64": False, "reverse": False},
+    "clash": {"config_format": "clash", "media_type": "text/yaml", "as_base64": False, "reverse": False},
+    "v2ray": {"config_format": "v2ray", "media_type": "text/plain", "as_base64": True, "reverse": False},
+    "outline": {"config_format": "outline", "media_type": "application/json", "as_base64": False, "reverse": False},
+    "v2ray-json": {"config_format": "v2ray-json", "media_type": "application/json", "as_base64": False,
+                   "reverse": False},
+    "v2ray-json-reverse": {"config_format": "v2ray-json", "media_type": "application/json", "as_base64": False,
+                           "reverse": True},
+}
 
 STATUS_EMOJIS = {
     "active": "✅",
@@ -46,6 +57,8 @@ STATUS_TEXTS = {
 
 def generate_v2ray_links(proxies: dict, inbounds: dict, extra_data: dict, reverse: bool) -> list:
     format_variables = setup_format_variables(extra_data)
+    from . import V2rayShareLink
+
     conf = V2rayShareLink()
     return process_inbounds_and_tags(inbounds, proxies, format_variables, conf=conf, reverse=reverse)
 
@@ -53,6 +66,8 @@ def generate_v2ray_links(proxies: dict, inbounds: dict, extra_data: dict, revers
 def generate_clash_subscription(
         proxies: dict, inbounds: dict, extra_data: dict, reverse: bool, is_meta: bool = False
 ) -> str:
+    from . import ClashConfiguration, ClashMetaConfiguration
+
     if is_meta is True:
         conf = ClashMetaConfiguration()
     else:
@@ -67,6 +82,8 @@ def generate_clash_subscription(
 def generate_singbox_subscription(
         proxies: dict, inbounds: dict, extra_data: dict, reverse: bool
 ) -> str:
+    from . import SingBoxConfiguration
+
     conf = SingBoxConfiguration()
 
     format_variables = setup_format_variables(extra_data)
@@ -78,6 +95,8 @@ def generate_singbox_subscription(
 def generate_outline_subscription(
         proxies: dict, inbounds: dict, extra_data: dict, reverse: bool,
 ) -> str:
+    from . import OutlineConfiguration
+
     conf = OutlineConfiguration()
 
     format_variables = setup_format_variables(extra_data)
@@ -89,6 +108,8 @@ def generate_outline_subscription(
 def generate_v2ray_json_subscription(
         proxies: dict, inbounds: dict, extra_data: dict, reverse: bool,
 ) -> str:
+    from . import V2rayJsonConfig
+
     conf = V2rayJsonConfig()
 
     format_variables = setup_format_variables(extra_data)
@@ -208,11 +229,12 @@ def setup_format_variables(extra_data: dict) -> dict:
     status_emoji = STATUS_EMOJIS.get(extra_data.get("status")) or ""
     status_text = STATUS_TEXTS.get(extra_data.get("status")) or ""
 
+    server_ips = public_ips()
     format_variables = defaultdict(
         lambda: "<missing>",
         {
-            "SERVER_IP": SERVER_IP,
-            "SERVER_IPV6": SERVER_IPV6,
+            "SERVER_IP": server_ips["ipv4"],
+            "SERVER_IPV6": server_ips["ipv6"],
             "USERNAME": extra_data.get("username", "{USERNAME}"),
             "DATA_USAGE": readable_size(extra_data.get("used_traffic")),
             "DATA_LIMIT": data_limit,
@@ -234,12 +256,12 @@ def process_inbounds_and_tags(
         proxies: dict,
         format_variables: dict,
         conf: Union[
-            V2rayShareLink,
-            V2rayJsonConfig,
-            SingBoxConfiguration,
-            ClashConfiguration,
-            ClashMetaConfiguration,
-            OutlineConfiguration
+            "V2rayShareLink",
+            "V2rayJsonConfig",
+            "SingBoxConfiguration",
+            "ClashConfiguration",
+            "ClashMetaConfiguration",
+            "OutlineConfiguration"
         ],
         reverse=False,
 ) -> Union[List, str]:
@@ -0,0 +1,254 @@
+"""
+Pre-rendered subscription snapshots.
+
+When `SUB_SNAPSHOT_DIR` is set, every subscription format of a user is rendered ahead
+of time into a content-addressed store on local disk, so `/sub/{token}` only has to
+verify the token and stream a file:
+
+    <SUB_SNAPSHOT_DIR>/blobs/<ab>/<sha256>       rendered config, named by its content hash
+    <SUB_SNAPSHOT_DIR>/blobs/<ab>/<sha256>.gz    gzip pre-compressed copy
+    <SUB_SNAPSHOT_DIR>/users/<ab>/<key>.json     manifest: client type -> blob
+
+`<key>` is the sha256 of the username. Subscription tokens can't be used as the key since
+every issued token of a user is different while they all resolve to the same configs.
+
+crud marks users as pending on every mutation, and a scheduler job re-renders them. With
+several workers, the job of the leader also picks up the users changed by the others, by
+the global revisions.
+
+Remarks and paths may use variables such as DATA_LEFT or DAYS_LEFT, which change without
+any mutation. The usage job marks the users it recorded traffic for, they are re-rendered
+at most every SUB_SNAPSHOT_USAGE_INTERVAL seconds, and a snapshot older than
+SUB_SNAPSHOT_MAX_AGE isn't served, the subscription is rendered on request and marked.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Set, Tuple
+
+from app import logger
+from app.utils import workers
+from config import SUB_SNAPSHOT_DIR, SUB_SNAPSHOT_MAX_AGE, SUB_SNAPSHOT_USAGE_INTERVAL
+
+if TYPE_CHECKING:
+    from app.db import Session
+    from app.models.user import UserResponse
+
+
+class SnapshotStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.blobs_path = os.path.join(path, "blobs")
+        self.users_path = os.path.join(path, "users")
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def blob_path(self, digest: str, compressed: bool = False) -> str:
+        path = os.path.join(self.blobs_path, digest[:2], digest)
+        return path + ".gz" if compressed else path
+
+    def manifest_path(self, username: str) -> str:
+        key = hashlib.sha256(username.encode()).hexdigest()
+        return os.path.join(self.users_path, key[:2], f"{key}.json")
+
+    def put_blob(self, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            # compressed copy first, a blob is only visible once both files exist
+            self._write_atomic(self.blob_path(digest, compressed=True), gzip.compress(content, 9))
+            self._write_atomic(path, content)
+        return digest
+
+    def write(self, username: str, renders: Dict[str, Tuple[str, bytes]]):
+        rendered_at = time.time()
+        manifest = {
+            client_type: {"digest": self.put_blob(content), "media_type": media_type, "rendered_at": rendered_at}
+            for client_type, (media_type, content) in renders.items()
+        }
+        self._write_atomic(self.manifest_path(username), json.dumps(manifest).encode())
+
+    def get(self, username: str, client_type: str) -> Optional[dict]:
+        """The entry of the client type, unless it's older than SUB_SNAPSHOT_MAX_AGE."""
+        try:
+            with open(self.manifest_path(username), "rb") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        entry = manifest.get(client_type)
+        if entry and time.time() - entry.get("rendered_at", 0) > SUB_SNAPSHOT_MAX_AGE:
+            return None
+        return entry
+
+    def remove(self, username: str):
+        try:
+            os.unlink(self.manifest_path(username))
+        except FileNotFoundError:
+            pass
+
+    def prune(self) -> int:
+        """Deletes blobs that no manifest refers to, returns the number of deleted blobs."""
+        referenced = set()
+        for root, _, files in os.walk(self.users_path):
+            for name in files:
+                try:
+                    with open(os.path.join(root, name), "rb") as f:
+                        referenced.update(entry["digest"] for entry in json.load(f).values())
+                except (OSError, ValueError):
+                    continue
+
+        removed = 0
+        for root, _, files in os.walk(self.blobs_path):
+            for name in files:
+                if name.startswith(".tmp-") or name.removesuffix(".gz") in referenced:
+                    continue
+                os.unlink(os.path.join(root, name))
+                if not name.endswith(".gz"):
+                    removed += 1
+        return removed
+
+
+store = SnapshotStore(SUB_SNAPSHOT_DIR) if SUB_SNAPSHOT_DIR else None
+
+_pending_users: Set[int] = set()
+_pending_all = False
+# users whose usage changed, taken every SUB_SNAPSHOT_USAGE_INTERVAL seconds
+_usage_users: Set[int] = set()
+_usage_taken_at = 0.0
+_lock = threading.Lock()
+# user and hosts revisions the leader has picked up changes until
+_revisions: Optional[Tuple[int, int]] = None
+
+
+def mark_user(user_id: int):
+    """Schedules re-rendering of a user's snapshot."""
+    if store and workers.is_leader:
+        with _lock:
+            _pending_users.add(user_id)
+
+
+def mark_usage(user_ids: Iterable[int]):
+    """Schedules re-rendering of users whose usage changed, at most every SUB_SNAPSHOT_USAGE_INTERVAL."""
+    if store and workers.is_leader:
+        with _lock:
+            _usage_users.update(user_ids)
+
+
+def mark_all():
+    """Schedules re-rendering of every snapshot, e.g. after hosts or inbounds change."""
+    global _pending_all
+    if store and workers.is_leader:
+        with _lock:
+            _pending_all = True
+
+
+def remove_user(username: str):
+    if store:
+        store.remove(username)
+
+
+def render_user(user: "UserResponse") -> Dict[str, Tuple[str, bytes]]:
+    from app.subscription.share import client_config, generate_subscription
+
+    return {
+        client_type: (
+            config["media_type"],
+            generate_subscription(
+                user=user,
+                config_format=config["config_format"],
+                as_base64=config["as_base64"],
+                reverse=config["reverse"],
+            ).encode(),
+        )
+        for client_type, config in client_config.items()
+    }
+
+
+def regenerate(db: "Session", user_ids: Optional[Iterable[int]] = None, batch_size: int = 500) -> int:
+    """
+    Renders the snapshots of the given users (all users if not given).
+
+    Returns:
+        int: Number of rendered users.
+    """
+    from app.db.crud import get_user_queryset
+    from app.db.models import User
+    from app.models.user import UserResponse
+
+    if user_ids is None:
+        user_ids = [uid for uid, in db.query(User.id).order_by(User.id)]
+    else:
+        user_ids = sorted(user_ids)
+
+    count = 0
+    for i in range(0, len(user_ids), batch_size):
+        for dbuser in get_user_queryset(db).filter(User.id.in_(user_ids[i:i + batch_size])):
+            store.write(dbuser.username, render_user(UserResponse.model_validate(dbuser)))
+            count += 1
+        db.expunge_all()
+
+    return count
+
+
+def mark_changed(db: "Session"):
+    """Marks the users changed since the last call, by any worker."""
+    global _revisions
+    from app.db.crud import get_revisions
+    from app.db.models import User
+
+    revisions = get_revisions(db)
+    if _revisions is not None:
+        if revisions[1] != _revisions[1]:
+            mark_all()
+        elif revisions[0] != _revisions[0]:
+            user_ids = [uid for uid, in db.query(User.id).filter(User.revision > _revisions[0])]
+            with _lock:
+                _pending_users.update(user_ids)
+    _revisions = revisions
+
+
+def regenerate_pending():
+    global _pending_all, _usage_taken_at
+    from app.db import GetDB
+
+    if workers.enabled:
+        with GetDB(read_only=True) as db:
+            mark_changed(db)
+
+    with _lock:
+        rebuild_all, user_ids = _pending_all, set(_pending_users)
+        _pending_all = False
+        _pending_users.clear()
+        if _usage_users and time.monotonic() - _usage_taken_at >= SUB_SNAPSHOT_USAGE_INTERVAL:
+            user_ids.update(_usage_users)
+            _usage_users.clear()
+            _usage_taken_at = time.monotonic()
+
+    if not (rebuild_all or user_ids):
+        return
+
+    try:
+        with GetDB(read_only=True) as db:
+            count = regenerate(db, None if rebuild_all else user_ids)
+        logger.debug(f"Subscription snapshots of {count} users rendered")
+    except Exception as exc:
+        logger.error(f"Failed to render subscription snapshots: {exc}")
+        with _lock:
+            _pending_all = _pending_all or rebuild_all
+            _pending_users.update(user_ids)
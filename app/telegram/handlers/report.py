@@ -6,25 +6,47 @@ from app.telegram import bot
 from telebot.apihelper import ApiTelegramException
 from datetime import datetime
 from app.telegram.utils.keyboard import BotKeyboard
+from app.utils import dispatcher
+from app.utils.dispatcher import Digest, RetryAfter
 from app.utils.system import readable_size
-from config import TELEGRAM_ADMIN_ID, TELEGRAM_LOGGER_CHANNEL_ID
+from config import REPORT_TIMEOUT, TELEGRAM_ADMIN_ID, TELEGRAM_LOGGER_CHANNEL_ID, TELEGRAM_RATE_LIMIT
 from telebot.formatting import escape_html
 from app.models.admin import Admin
 from app.models.user import UserDataLimitResetStrategy
 
 
-def report(text: str, chat_id: int = None, parse_mode="html", keyboard=None):
+def send_message(payload):
+    chat_id, text, parse_mode, keyboard = payload
+    try:
+        bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=keyboard, timeout=REPORT_TIMEOUT)
+    except ApiTelegramException as e:
+        if e.error_code == 429:
+            raise RetryAfter((e.result_json.get("parameters") or {}).get("retry_after", 1))
+        logger.error(e)
+
+
+def report(text: str, chat_id: int = None, parse_mode="html", keyboard=None, digest: Digest = None):
+    """
+    Queues the report for the admins, or the logger channel, and the given chat.
+
+    `digest.render` gets the listed items and their count and returns the text of the merged reports.
+    """
     if bot and (TELEGRAM_ADMIN_ID or TELEGRAM_LOGGER_CHANNEL_ID):
-        try:
-            if TELEGRAM_LOGGER_CHANNEL_ID:
-                bot.send_message(TELEGRAM_LOGGER_CHANNEL_ID, text, parse_mode=parse_mode)
-            else:
-                for admin in TELEGRAM_ADMIN_ID:
-                    bot.send_message(admin, text, parse_mode=parse_mode, reply_markup=keyboard)
-            if chat_id:
-                bot.send_message(chat_id, text, parse_mode=parse_mode)
-        except ApiTelegramException as e:
-            logger.error(e)
+        if TELEGRAM_LOGGER_CHANNEL_ID:
+            chats = [(TELEGRAM_LOGGER_CHANNEL_ID, None)]
+        else:
+            chats = [(admin, keyboard) for admin in TELEGRAM_ADMIN_ID]
+        if chat_id:
+            chats.append((chat_id, None))
+
+        for chat, markup in chats:
+            chat_digest = digest and Digest(
+                key=digest.key,
+                item=digest.item,
+                render=lambda items, count, chat=chat: (chat, digest.render(items, count), parse_mode, None),
+            )
+            dispatcher.submit(f"telegram {chat}", send_message, (chat, text, parse_mode, markup),
+                              rate=TELEGRAM_RATE_LIMIT, digest=chat_digest)
 
 
 def report_new_user(
@@ -123,7 +145,26 @@ def report_user_deletion(username: str, by: str, admin: Admin = None):
         by=escape_html(by),
         username=escape_html(username)
     )
-    return report(chat_id=admin.telegram_id if admin and admin.telegram_id else None, text=text)
+
+    def digest(usernames, count):
+        return '''\
+🗑 <b>#Deleted</b>
+➖➖➖➖➖➖➖➖➖
+<b>{count} Users</b> : {usernames}
+➖➖➖➖➖➖➖➖➖
+<b>Belongs To :</b> <code>{belong_to}</code>
+<b>By</b> : <b>#{by}</b>'''.format(
+            count=count,
+            usernames=dispatcher.list_items([f"<code>{escape_html(u)}</code>" for u in usernames], count),
+            belong_to=escape_html(admin.username) if admin else None,
+            by=escape_html(by),
+        )
+
+    return report(
+        chat_id=admin.telegram_id if admin and admin.telegram_id else None,
+        text=text,
+        digest=Digest(key=("deleted", by, admin.username if admin else None), item=username, render=digest),
+    )
 
 
 def report_status_change(username: str, status: str, admin: Admin = None):
@@ -143,7 +184,24 @@ def report_status_change(username: str, status: str, admin: Admin = None):
         username=escape_html(username),
         status=_status[status]
     )
-    return report(chat_id=admin.telegram_id if admin and admin.telegram_id else None, text=text)
+
+    def digest(usernames, count):
+        return '''\
+{status}
+➖➖➖➖➖➖➖➖➖
+<b>{count} Users</b> : {usernames}
+<b>Belongs To :</b> <code>{belong_to}</code>'''.format(
+            status=_status[status],
+            count=count,
+            usernames=dispatcher.list_items([f"<code>{escape_html(u)}</code>" for u in usernames], count),
+            belong_to=escape_html(admin.username) if admin else None,
+        )
+
+    return report(
+        chat_id=admin.telegram_id if admin and admin.telegram_id else None,
+        text=text,
+        digest=Digest(key=("status", status, admin.username if admin else None), item=username, render=digest),
+    )
 
 
 def report_user_usage_reset(username: str, by: str, admin: Admin = None):
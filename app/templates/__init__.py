@@ -1,5 +1,6 @@
+import os
 from datetime import datetime
-from typing import Union
+from typing import Tuple, Union
 
 import jinja2
 
@@ -19,3 +20,21 @@ env.globals['now'] = datetime.utcnow
 
 def render_template(template: str, context: Union[dict, None] = None) -> str:
     return env.get_template(template).render(context or {})
+
+
+def template_versions(*templates: str) -> Tuple[Tuple[str, int, int], ...]:
+    """
+    The file, modification time and size of each template, as found by `render_template`,
+    which reloads a template once its modification time changes.
+    """
+    versions = []
+    for template in templates:
+        for directory in template_directories:
+            path = os.path.join(directory, template)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            versions.append((path, stat.st_mtime_ns, stat.st_size))
+            break
+    return tuple(versions)
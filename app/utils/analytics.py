@@ -0,0 +1,288 @@
+"""
+Usage analytics over a users × time buckets matrix.
+
+`load_matrix` aggregates the usages of a range into one row per user and one column per
+hour or day with a single grouped query, whose rows are read in chunks straight into
+preallocated arrays. Rankings, percentiles, moving averages and spikes
+are then computed with numpy over the whole matrix, in chunks of users where temporaries
+would otherwise be as large as the matrix itself.
+
+Values are float32 to halve the memory, 100k users × 720 hours take ~290MB; sums are
+computed in float64. Rolled up usages count in the first hour of their day or month
+and archived usages aren't included.
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.db.models import Admin, User
+from app.models.node import UsagePeriod
+from config import ANALYTICS_CACHE_TTL
+
+PERIOD_SECONDS = {UsagePeriod.hour: 3600, UsagePeriod.day: 86400}
+CHUNK_ROWS = 4096
+# rows of the usage query converted to arrays at once
+LOAD_CHUNK_ROWS = 65536
+# a row of the usage query, with the column of its bucket
+ROW_DTYPE = np.dtype([("user_id", np.int64), ("admin_id", np.int64), ("col", np.int64), ("used", np.int64)])
+
+
+class TTLCache:
+    """Small LRU whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_set(self, key, factory: Callable):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = factory()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+@dataclass
+class UsageMatrix:
+    user_ids: np.ndarray  # (users,) int64
+    admin_ids: np.ndarray  # (users,) int64, sorted, 0 for users without an admin
+    values: np.ndarray  # (users, buckets) float32, used traffic in bytes
+    start: datetime  # start of the first bucket
+    step: timedelta
+
+    def bucket_start(self, index: int) -> datetime:
+        return self.start + self.step * int(index)
+
+    def admin_slices(self) -> Iterator[Tuple[int, slice]]:
+        """Rows of every admin, which are contiguous as users are ordered by admin."""
+        admin_ids, first = np.unique(self.admin_ids, return_index=True)
+        bounds = list(first) + [len(self.admin_ids)]
+        for i, admin_id in enumerate(admin_ids):
+            yield int(admin_id), slice(int(bounds[i]), int(bounds[i + 1]))
+
+
+# matrices are large, only the most recent ones are kept
+matrices = TTLCache(2, ANALYTICS_CACHE_TTL)
+results = TTLCache(256, ANALYTICS_CACHE_TTL)
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    if dt.tzinfo:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _truncate(dt: datetime, period: UsagePeriod) -> datetime:
+    dt = dt.replace(minute=0, second=0, microsecond=0)
+    if period == UsagePeriod.day:
+        dt = dt.replace(hour=0)
+    return dt
+
+
+def build_matrix(rows: Iterable[Tuple[int, int, datetime, int]], start: datetime, end: datetime,
+                 period: UsagePeriod = UsagePeriod.hour, capacity: int = 0) -> UsageMatrix:
+    """
+    Builds the matrix from usage rows ordered by admin and user, as `get_user_usage_buckets`
+    yields them. `capacity` is the expected number of users, rows are allocated for it.
+    """
+    first = _truncate(_naive_utc(start), period)
+    step = timedelta(seconds=PERIOD_SECONDS[period])
+    n_buckets = int((_naive_utc(end) - first) // step) + 1
+
+    # zeroed lazily by the OS, the rows of users without usage take no memory
+    values = np.zeros((capacity, n_buckets), dtype=np.float32)
+    user_ids = np.zeros(capacity, dtype=np.int64)
+    admin_ids = np.zeros(capacity, dtype=np.int64)
+    n_users, last_user = 0, None
+
+    # there are few distinct buckets, each is mapped to its column once
+    columns: Dict[datetime, int] = {}
+
+    def column(bucket: datetime) -> int:
+        col = columns.get(bucket)
+        if col is None:
+            # rolled up usages from before the range land in the first bucket
+            col = columns[bucket] = min(max(int((_truncate(bucket, period) - first) // step), 0), n_buckets - 1)
+        return col
+
+    rows = ((user_id, admin_id, column(bucket), used) for user_id, admin_id, bucket, used in rows)
+    while len(chunk := np.fromiter(itertools.islice(rows, LOAD_CHUNK_ROWS), dtype=ROW_DTYPE)):
+        # the rows of a user are contiguous, a new row starts at every change of user
+        new = np.empty(len(chunk), dtype=bool)
+        new[0] = chunk["user_id"][0] != last_user
+        new[1:] = chunk["user_id"][1:] != chunk["user_id"][:-1]
+        row = n_users - 1 + np.cumsum(new)
+        added = int(np.count_nonzero(new))
+
+        if n_users + added > len(values):  # users created since the capacity was counted
+            grown = max(2 * len(values), n_users + added)
+            values = np.concatenate([values, np.zeros((grown - len(values), n_buckets), dtype=np.float32)])
+            user_ids = np.concatenate([user_ids, np.zeros(grown - len(user_ids), dtype=np.int64)])
+            admin_ids = np.concatenate([admin_ids, np.zeros(grown - len(admin_ids), dtype=np.int64)])
+
+        user_ids[row[new]] = chunk["user_id"][new]
+        admin_ids[row[new]] = chunk["admin_id"][new]
+        # added up, as a rolled up usage may share the first bucket with others
+        np.add.at(values, (row, chunk["col"]), chunk["used"].astype(np.float32))
+        n_users += added
+        last_user = chunk["user_id"][-1]
+
+    return UsageMatrix(
+        user_ids=user_ids[:n_users],
+        admin_ids=admin_ids[:n_users],
+        values=values[:n_users],
+        start=first,
+        step=step,
+    )
+
+
+def load_matrix(db: Session, start: datetime, end: datetime,
+                period: UsagePeriod = UsagePeriod.hour,
+                admins: Optional[List[str]] = None) -> UsageMatrix:
+    """Builds the matrix of the users with any usage within the range, in one query."""
+    start, end = _naive_utc(start), _naive_utc(end)
+    users = db.query(func.count(User.id))
+    if admins:
+        users = users.filter(User.admin.has(Admin.username.in_(admins)))
+    rows = crud.get_user_usage_buckets(db, start, end, period, admins)
+    return build_matrix(rows, start, end, period, capacity=users.scalar())
+
+
+def cache_slot(dt: datetime) -> int:
+    """Dates within the same cache period share cached results, e.g. the default "until now"."""
+    return int(_naive_utc(dt).replace(tzinfo=timezone.utc).timestamp() // max(ANALYTICS_CACHE_TTL, 1))
+
+
+def get_matrix(db: Session, start: datetime, end: datetime, period: UsagePeriod,
+               admins: Optional[List[str]] = None) -> UsageMatrix:
+    key = (cache_slot(start), cache_slot(end), period, tuple(sorted(admins or ())))
+    return matrices.get_or_set(key, lambda: load_matrix(db, start, end, period, admins))
+
+
+def _chunks(n: int, size: int = CHUNK_ROWS) -> Iterator[slice]:
+    for lower in range(0, n, size):
+        yield slice(lower, min(lower + size, n))
+
+
+def top_users(matrix: UsageMatrix, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows and total traffic of the `limit` heaviest users, heaviest first."""
+    totals = matrix.values.sum(axis=1, dtype=np.float64)
+    limit = min(limit, len(totals))
+    if limit <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    rows = np.argpartition(-totals, limit - 1)[:limit]
+    rows = rows[np.argsort(-totals[rows], kind="stable")]
+    return rows, totals[rows]
+
+
+def percentiles(values: np.ndarray, q: Sequence[float]) -> np.ndarray:
+    """Percentiles of all the cells of `values`, zeros (buckets without usage) included."""
+    if not values.size:
+        return np.zeros(len(q))
+    return np.percentile(values, q)
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing mean of the last `window` buckets along the last axis, NaN until
+    there are `window` buckets.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    cumsum = np.cumsum(values, axis=-1)
+    averages = np.full(values.shape, np.nan)
+    if window <= 0 or values.shape[-1] < window:
+        return averages
+
+    averages[..., window - 1] = cumsum[..., window - 1]
+    averages[..., window:] = cumsum[..., window:] - cumsum[..., :-window]
+    averages[..., window - 1:] /= window
+    return averages
+
+
+def _trailing_stats(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean and standard deviation of the `window` buckets before each bucket from `window` on."""
+    padded = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=padded[:, 1:])
+    sums = padded[:, window:-1] - padded[:, :-window - 1]
+
+    np.cumsum(values * values, axis=1, out=padded[:, 1:])
+    squares = padded[:, window:-1] - padded[:, :-window - 1]
+
+    mean = sums / window
+    std = np.sqrt(np.maximum(squares / window - mean * mean, 0))
+    return mean, std
+
+
+def spikes(matrix: UsageMatrix, window: int, z_score: float, ratio: float,
+           limit: int) -> List[Tuple[int, int, float, float, float]]:
+    """
+    Finds users whose traffic in a bucket is at least `z_score` standard deviations and
+    `ratio` times above the mean of their previous `window` buckets. Users without usage
+    in that window have no baseline and never spike.
+
+    Returns:
+        List[Tuple[int, int, float, float, float]]: Row, bucket, used traffic, baseline and z-score
+            of the strongest spike of each user, strongest first.
+    """
+    n_users, n_buckets = matrix.values.shape
+    if window <= 0 or n_buckets <= window:
+        return []
+
+    found = []
+    for rows in _chunks(n_users):
+        values = matrix.values[rows].astype(np.float64)
+        mean, std = _trailing_stats(values, window)
+        current = values[:, window:]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.where(std > 0, (current - mean) / std, np.inf)
+        mask = (mean > 0) & (current >= mean * ratio) & (z >= z_score)
+        if not mask.any():
+            continue
+
+        z = np.where(mask, z, -np.inf)
+        spiked = np.flatnonzero(mask.any(axis=1))
+        best = z[spiked].argmax(axis=1)
+        for row, col in zip(spiked, best):
+            found.append((
+                rows.start + int(row),
+                window + int(col),
+                float(current[row, col]),
+                float(mean[row, col]),
+                float(z[row, col]),
+            ))
+
+    found.sort(key=lambda spike: (spike[4], spike[2] / spike[3]), reverse=True)
+    return found[:limit]
+
+
+def get_usernames(db: Session, user_ids: Sequence[int]) -> Dict[int, str]:
+    if not len(user_ids):
+        return {}
+    return dict(db.query(User.id, User.username).filter(User.id.in_([int(uid) for uid in user_ids])))
+
+
+def get_admin_usernames(db: Session) -> Dict[int, str]:
+    return dict(db.query(Admin.id, Admin.username))
@@ -1,7 +1,13 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
 from threading import Thread
+from typing import Callable, Optional, TypeVar
 
 import anyio
-from fastapi import BackgroundTasks
+from fastapi import BackgroundTasks, HTTPException
+
+T = TypeVar("T")
 
 
 def threaded_function(func):
@@ -30,3 +36,58 @@ class GetBG:
 
     async def __aexit__(self, exc_type, exc_value, traceback):
         await self.bg()
+
+
+class ConcurrencyLimiter:
+    """
+    Bounds the number of requests an async endpoint handles at once.
+
+    Requests above `limit` wait in a queue of at most `queue_size` entries for up to
+    `timeout` seconds; anything beyond that is rejected with 503 so a refresh storm
+    can't pile up unbounded work.
+    """
+
+    def __init__(self, limit: int, queue_size: int = 0, timeout: Optional[float] = None):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    def _reject(self):
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": str(int(self.timeout or 1))},
+        )
+
+    async def __aenter__(self):
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return self
+
+        if self.waiting >= self.queue_size:
+            self._reject()
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._reject()
+        finally:
+            self.waiting -= 1
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._semaphore.release()
+
+
+async def run_in_executor(executor: Executor, func: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a blocking function in the given executor and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+async def run_in_threadpool(limiter: anyio.CapacityLimiter, func: Callable[..., T], *args, **kwargs) -> T:
+    """Like starlette's `run_in_threadpool`, but bounded by a dedicated limiter instead of the shared one."""
+    return await anyio.to_thread.run_sync(partial(func, *args, **kwargs), limiter=limiter)
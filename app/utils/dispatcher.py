@@ -0,0 +1,211 @@
+"""
+Background delivery of Telegram and Discord reports.
+
+Reports are queued per destination, a chat or a webhook, and sent by the destination's
+worker thread, so callers return immediately and a slow destination doesn't hold up the
+others. Workers pace their sends with a token bucket, wait as long as a rate limited
+response asks for (`retry_after`) and retry failed sends a few times with a backoff.
+
+Reports with a digest, e.g. status changes, wait REPORT_DIGEST_WINDOW seconds and are
+merged with the reports of the same digest key queued meanwhile into one message such as
+"312 users expired". A full queue drops its oldest reports.
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from app import app, logger
+from config import REPORT_DIGEST_WINDOW, REPORT_MAX_RETRIES, REPORT_QUEUE_SIZE
+
+# usernames listed in a digest, the rest are only counted
+DIGEST_MAX_ITEMS = 50
+
+
+class RetryAfter(Exception):
+    """Raised by senders when the destination asks to wait before sending again."""
+
+    def __init__(self, seconds: float):
+        super().__init__(f"rate limited, retry after {seconds}s")
+        self.seconds = seconds
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Takes a token, returns how long to wait before using it if there wasn't one left."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+@dataclass
+class Digest:
+    key: Hashable
+    item: str
+    # builds the payload of the merged reports from the first items and their count
+    render: Callable[[List[str], int], Any]
+
+
+@dataclass
+class Report:
+    payload: Any
+    ready_at: float
+    digest: Optional[Digest] = None
+    items: List[str] = field(default_factory=list)
+    count: int = 1
+    tries: int = 0
+
+    def build(self) -> Any:
+        if self.count > 1:
+            return self.digest.render(self.items, self.count)
+        return self.payload
+
+
+class Destination:
+    def __init__(self, name: str, send: Callable[[Any], None], rate: float, burst: int):
+        self.name = name
+        self.send = send
+        self.bucket = TokenBucket(rate, burst)
+        self.queue: deque = deque()
+        self.digests: Dict[Hashable, Report] = {}
+        self.paused_until = 0.0
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self.run, name=f"report {name}", daemon=True)
+        self._thread.start()
+
+    def put(self, payload: Any, digest: Optional[Digest] = None):
+        with self._cond:
+            if digest and (pending := self.digests.get(digest.key)):
+                pending.count += 1
+                if len(pending.items) < DIGEST_MAX_ITEMS:
+                    pending.items.append(digest.item)
+                return
+
+            if len(self.queue) >= REPORT_QUEUE_SIZE:
+                self._forget(self.queue.popleft(), dropped=True)
+
+            ready_at = time.monotonic() + (REPORT_DIGEST_WINDOW if digest else 0)
+            report = Report(payload=payload, ready_at=ready_at, digest=digest, items=[digest.item] if digest else [])
+            self.queue.append(report)
+            if digest:
+                self.digests[digest.key] = report
+            self._cond.notify()
+
+    def _forget(self, report: Report, dropped: bool = False):
+        if report.digest and self.digests.get(report.digest.key) is report:
+            del self.digests[report.digest.key]
+        if dropped:
+            self.dropped += report.count
+            logger.warning(f"Report queue of {self.name} is full, dropped {report.count} reports")
+
+    def _next(self) -> Optional[Report]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                stopping = _stopping.is_set()
+                if stopping and not self.queue:
+                    return None
+
+                wait = 0 if stopping else self.paused_until - now
+                if wait <= 0:
+                    for i, report in enumerate(self.queue):
+                        if stopping or report.ready_at <= now:
+                            del self.queue[i]
+                            # later reports of the same key start a new digest
+                            self._forget(report)
+                            return report
+                    wait = min((report.ready_at for report in self.queue), default=now + 60) - now
+
+                self._cond.wait(max(wait, 0.01))
+
+    def run(self):
+        while (report := self._next()) is not None:
+            if (wait := self.bucket.take()) > 0:
+                time.sleep(wait)
+
+            try:
+                self.send(report.build())
+                self.sent += report.count
+                continue
+            except RetryAfter as err:
+                delay = err.seconds
+                with self._cond:
+                    self.paused_until = time.monotonic() + delay
+            except Exception as err:
+                delay = 2 ** report.tries
+                logger.error(f"Failed to send report to {self.name}: {err}")
+
+            report.tries += 1
+            if report.tries > REPORT_MAX_RETRIES or _stopping.is_set():
+                self.failed += report.count
+                continue
+
+            with self._cond:
+                report.ready_at = time.monotonic() + delay
+                self.queue.appendleft(report)
+
+    def join(self, timeout: float):
+        with self._cond:
+            self._cond.notify()
+        self._thread.join(timeout)
+
+
+destinations: Dict[str, Destination] = {}
+_lock = threading.Lock()
+_stopping = threading.Event()
+
+
+def submit(name: str, send: Callable[[Any], None], payload: Any, rate: float, burst: int = 5,
+           digest: Optional[Digest] = None):
+    """
+    Queues the payload to be sent to the destination and returns immediately.
+
+    Args:
+        name (str): Unique name of the destination, e.g. the chat id or webhook address.
+        send (Callable[[Any], None]): Sends a payload, raises `RetryAfter` when rate limited.
+        payload (Any): What to send.
+        rate (float): Max sends per second to this destination.
+        burst (int): Sends allowed at once before the rate applies.
+        digest (Optional[Digest]): Merges the report with others of the same key.
+    """
+    destination = destinations.get(name)
+    if destination is None:
+        with _lock:
+            destination = destinations.get(name)
+            if destination is None:
+                destination = destinations[name] = Destination(name, send, rate, burst)
+    destination.put(payload, digest)
+
+
+def stop(timeout: float = 10):
+    """Sends what's left, without waiting for digests or retries, until the timeout."""
+    _stopping.set()
+    deadline = time.monotonic() + timeout
+    for destination in list(destinations.values()):
+        destination.join(max(deadline - time.monotonic(), 0))
+
+
+@app.on_event("shutdown")
+def app_shutdown():
+    stop()
+
+
+def list_items(items: List[str], count: int) -> str:
+    """Joins the listed items of a digest, noting how many more there were."""
+    more = count - len(items)
+    return ", ".join(items) + (f" and {more} more" if more > 0 else "")
@@ -0,0 +1,179 @@
+"""
+In-process change-data-capture bus.
+
+crud mutations, node status changes and usage flushes publish small events here,
+each with a sequence number. The last `EVENTS_BUFFER_SIZE` events are kept so
+subscribers can resume after a reconnect, except usage summaries which are only sent
+live: the next flush brings a new one. Events are published from worker and
+scheduler threads and consumed by async subscribers on the event loop.
+
+Each event has an audience: the admin whose users it is about, every admin, or, when
+it has none, sudo admins only.
+
+Sequence numbers restart with the process; `epoch` identifies the current run so a
+client resuming with an id from another run knows it has to resync.
+"""
+
+import asyncio
+import secrets
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from config import EVENTS_BUFFER_SIZE, EVENTS_SUBSCRIBER_QUEUE_SIZE
+
+# audience of the events about every admin's users, e.g. hosts changes
+EVERYONE = "*"
+# type prefixes of the events not kept for replaying
+UNBUFFERED_TYPES = ("usage",)
+
+
+@dataclass
+class Event:
+    seq: int
+    type: str
+    data: Dict[str, Any]
+    audience: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+    def matches(self, types: Optional[Iterable[str]], admin: Optional[str]) -> bool:
+        """
+        `types` are prefixes of event types, e.g. `user` or `user.deleted`.
+        Events not meant for `admin` are dropped when it's given, i.e. for non-sudo admins.
+        """
+        if types and not any(self.type == t or self.type.startswith(f"{t}.") for t in types):
+            return False
+        if admin is not None and self.audience not in (admin, EVERYONE):
+            return False
+        return True
+
+
+class EventsLost(Exception):
+    """The subscriber missed events and has to resync, e.g. from `/api/users/changes`."""
+
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def put(self, event: Event):
+        # runs on the subscriber's loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventBus:
+    def __init__(self, buffer_size: int, queue_size: int):
+        self.epoch = secrets.token_hex(4)
+        self.seq = 0
+        self.queue_size = queue_size
+        self._buffer: deque = deque(maxlen=buffer_size)
+        # seq of the last event evicted from the buffer
+        self._evicted = 0
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def publish(self, type: str, data: Dict[str, Any], audience: Optional[str] = None) -> Event:
+        with self._lock:
+            self.seq += 1
+            event = Event(self.seq, type, data, audience)
+            if not type.startswith(UNBUFFERED_TYPES):
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._evicted = self._buffer[0].seq
+                self._buffer.append(event)
+            subscriptions = list(self._subscriptions)
+
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:  # loop closed
+                self._subscriptions.discard(subscription)
+        return event
+
+    def replay(self, since: int) -> Tuple[List[Event], bool]:
+        """
+        Returns the buffered events after `since` and whether they are complete,
+        i.e. no events were evicted from the buffer in between.
+        """
+        with self._lock:
+            events = [e for e in self._buffer if e.seq > since]
+            evicted = self._evicted
+        return events, since >= evicted
+
+    def parse_id(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Parses an `<epoch>-<seq>` id, returns None if it isn't from this run."""
+        if not last_event_id:
+            return None
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def format_id(self, event: Event) -> str:
+        return f"{self.epoch}-{event.seq}"
+
+    async def subscribe(
+        self, since: Optional[int] = None, keepalive: Optional[float] = None
+    ) -> AsyncIterator[Optional[Event]]:
+        """
+        Yields events after `since`, starting with the buffered ones, and None after
+        `keepalive` seconds without events.
+
+        Raises:
+            EventsLost: if events after `since` were evicted from the buffer, or the
+                subscriber fell behind by more than its queue size.
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            current = self.seq
+
+        try:
+            last = current
+            if since is not None and since < current:
+                events, complete = self.replay(since)
+                if not complete:
+                    raise EventsLost()
+                for event in events:
+                    if event.seq <= current:
+                        yield event
+                        last = event.seq
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if subscription.overflowed:
+                    raise EventsLost()
+                if event.seq <= last:
+                    continue
+                last = event.seq
+                yield event
+        finally:
+            self._subscriptions.discard(subscription)
+
+
+bus = EventBus(EVENTS_BUFFER_SIZE, EVENTS_SUBSCRIBER_QUEUE_SIZE)
+
+
+def publish(type: str, data: Dict[str, Any], audience: Optional[str] = None) -> Event:
+    return bus.publish(type, data, audience)
+
+
+def user_data(dbuser) -> Dict[str, Any]:
+    """Identifying fields of a db user, for `user.*` events."""
+    return {
+        "id": dbuser.id,
+        "username": dbuser.username,
+        "status": dbuser.status,
+        "revision": dbuser.revision,
+        "admin": dbuser.admin.username if dbuser.admin else None,
+    }
@@ -7,8 +7,8 @@ def calculate_usage_percent(used_traffic: int, data_limit: int) -> float:
     return (used_traffic * 100) / data_limit
 
 
-def calculate_expiration_days(expire: int) -> int:
-    return (dt.fromtimestamp(expire) - dt.utcnow()).days
+def calculate_expiration_days(expire: int, now: dt = None) -> int:
+    return (dt.fromtimestamp(expire) - (now or dt.utcnow())).days
 
 
 def yml_uuid_representer(dumper, data):
@@ -1,15 +1,14 @@
-from collections import deque
 from datetime import datetime as dt
 from enum import Enum
 from typing import Type
 
-from pydantic import BaseModel
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field
 
-from config import WEBHOOK_ADDRESS
+from config import WEBHOOK_ADDRESS, WEBHOOK_COMPACT_PAYLOAD
 from app.models.admin import Admin
 from app.models.user import UserResponse
-
-queue = deque()
+from app.utils import webhook
 
 
 class Notification(BaseModel):
@@ -28,8 +27,8 @@ class Notification(BaseModel):
         reached_usage_percent = "reached_usage_percent"
         reached_days_left = "reached_days_left"
 
-    enqueued_at: float = dt.utcnow().timestamp()
-    send_at: float = dt.utcnow().timestamp()
+    enqueued_at: float = Field(default_factory=lambda: dt.utcnow().timestamp())
+    send_at: float = Field(default_factory=lambda: dt.utcnow().timestamp())
     tries: int = 0
 
 
@@ -106,6 +105,25 @@ class UserSubscriptionRevoked(UserNotification):
     user: UserResponse
 
 
+# fields of the user sent with WEBHOOK_COMPACT_PAYLOAD, the rest can be fetched by its revision
+COMPACT_USER_FIELDS = {
+    "username", "status", "used_traffic", "lifetime_used_traffic", "data_limit",
+    "data_limit_reset_strategy", "expire", "on_hold_expire_duration", "on_hold_timeout", "revision",
+}
+
+
+def encode(message: Notification) -> dict:
+    if not WEBHOOK_COMPACT_PAYLOAD:
+        return jsonable_encoder(message)
+
+    payload = jsonable_encoder(message, exclude={"user", "by"})
+    if user := getattr(message, "user", None):
+        payload["user"] = jsonable_encoder(user, include=COMPACT_USER_FIELDS)
+    if by := getattr(message, "by", None):
+        payload["by"] = {"username": by.username}
+    return payload
+
+
 def notify(message: Type[Notification]) -> None:
     if WEBHOOK_ADDRESS:
-        queue.append(message)
+        webhook.enqueue(encode(message))
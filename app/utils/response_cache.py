@@ -0,0 +1,160 @@
+"""
+Content negotiation and conditional GET for large, mostly unchanged responses.
+
+Bodies get a strong ETag, `If-None-Match` is answered with 304, and compressed
+variants are kept in a small in-memory LRU keyed by ETag so a body that didn't
+change is compressed only once. A compressed body is a different representation,
+its ETag gets the encoding as a suffix, e.g. `"<digest>-gzip"`.
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+from config import RESPONSE_CACHE_SIZE
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# bodies smaller than this aren't worth compressing
+MINIMUM_SIZE = 1024
+
+
+def _compress(content: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(content, quality=5)
+    return gzip.compress(content, 6)
+
+
+class CompressedCache:
+    """LRU of compressed bodies, bounded by the total size of the stored bodies."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag: str, encoding: str, content: bytes) -> bytes:
+        key = (etag, encoding)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        compressed = _compress(content, encoding)
+        if len(compressed) > self.max_size:
+            return compressed
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = compressed
+                self.size += len(compressed)
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return compressed
+
+
+cache = CompressedCache(RESPONSE_CACHE_SIZE * 1024 * 1024)
+
+
+def make_etag(*parts) -> str:
+    """Builds a strong ETag from the given bytes or values."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """The ETag of the body compressed with `encoding`, the ETag itself if not compressed."""
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def pick_encoding(request: Request) -> Optional[str]:
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        accepted[coding.strip().lower()] = quality
+
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def not_modified(
+    request: Request,
+    etag: str,
+    headers: Optional[Dict[str, str]] = None,
+    cache_control: str = "private, no-cache",
+) -> Optional[Response]:
+    """
+    An empty 304 if the client has the body of `etag`, compressed as it accepts or not.
+
+    Lets callers that know the ETag of a body before building it skip building it.
+    """
+    for tag in (encoded_etag(etag, pick_encoding(request)), etag):
+        if etag_matches(request, tag):
+            headers = dict(headers or {})
+            headers.update({"etag": tag, "cache-control": cache_control, "vary": "accept-encoding"})
+            return Response(status_code=304, headers=headers)
+    return None
+
+
+def cached_response(
+    request: Request,
+    content: bytes,
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None,
+    etag: Optional[str] = None,
+    cache_control: str = "private, no-cache",
+) -> Response:
+    """
+    Returns `content` compressed as the client accepts, or an empty 304 if the client
+    already has it. The ETag is derived from the content unless given, a given ETag
+    must change whenever the content does.
+    """
+    headers = dict(headers or {})
+    etag = etag or make_etag(content)
+    encoding = pick_encoding(request) if len(content) >= MINIMUM_SIZE else None
+    headers.update({"etag": encoded_etag(etag, encoding), "cache-control": cache_control, "vary": "accept-encoding"})
+
+    if etag_matches(request, headers["etag"]):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["content-encoding"] = encoding
+        content = cache.get(etag, encoding, content)
+
+    return Response(content=content, media_type=media_type, headers=headers)
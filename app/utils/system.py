@@ -1,14 +1,18 @@
 import ipaddress
+import json
 import math
+import os
 import secrets
 import socket
+import threading
 import time
 from dataclasses import dataclass
+from typing import Dict, Optional
 
 import psutil
-import requests
 
-from app import scheduler
+from app import logger
+from config import PUBLIC_IP_CACHE_FILE, PUBLIC_IP_REFRESH_INTERVAL
 
 
 @dataclass
@@ -70,8 +74,6 @@ rt_bw = RealtimeBandwidth(
     incoming_bytes=0, outgoing_bytes=0, incoming_packets=0, outgoing_packets=0)
 
 
-# sample time is 2 seconds, values lower than this may not produce good results
-@scheduler.scheduled_job("interval", seconds=2, coalesce=True, max_instances=1)
 def record_realtime_bandwidth() -> None:
     global rt_bw
     last_perf_counter = rt_bw.last_perf_counter
@@ -109,6 +111,8 @@ def check_port(port: int) -> bool:
 
 
 def get_public_ip():
+    import requests
+
     try:
         resp = requests.get('http://api4.ipify.org/', timeout=5).text.strip()
         if ipaddress.IPv4Address(resp).is_global:
@@ -148,6 +152,8 @@ def get_public_ip():
 
 
 def get_public_ipv6():
+    import requests
+
     try:
         resp = requests.get('http://api6.ipify.org/', timeout=5).text.strip()
         if ipaddress.IPv6Address(resp).is_global:
@@ -165,6 +171,58 @@ def get_public_ipv6():
     return '[::1]'
 
 
+_public_ips: Optional[Dict[str, str]] = None
+_public_ips_checked_at = 0.0
+_public_ips_lock = threading.Lock()
+
+
+def _save_public_ips(ips: Dict[str, str]):
+    try:
+        with open(PUBLIC_IP_CACHE_FILE, "w") as f:
+            json.dump(ips, f)
+    except OSError as err:
+        logger.warning(f"Failed to cache the public IPs in {PUBLIC_IP_CACHE_FILE}: {err}")
+
+
+def _refresh_public_ips():
+    global _public_ips
+    ipv4, ipv6 = get_public_ip(), get_public_ipv6()
+    # a failed detection falls back to the loopback addresses, keep what was cached instead
+    _public_ips = {
+        "ipv4": ipv4 if ipv4 != "127.0.0.1" else _public_ips["ipv4"],
+        "ipv6": ipv6 if ipv6 != "[::1]" else _public_ips["ipv6"],
+    }
+    _save_public_ips(_public_ips)
+
+
+def public_ips() -> Dict[str, str]:
+    """
+    The server's public IPv4 and IPv6, as "ipv4" and "ipv6".
+
+    They're cached in PUBLIC_IP_CACHE_FILE, only the first run of the server waits for the
+    detection. A cache older than PUBLIC_IP_REFRESH_INTERVAL is refreshed in the background.
+    """
+    global _public_ips, _public_ips_checked_at
+
+    with _public_ips_lock:
+        if _public_ips is None:
+            try:
+                with open(PUBLIC_IP_CACHE_FILE) as f:
+                    cached = json.load(f)
+                _public_ips = {"ipv4": cached["ipv4"], "ipv6": cached["ipv6"]}
+                _public_ips_checked_at = os.path.getmtime(PUBLIC_IP_CACHE_FILE)
+            except (OSError, ValueError, KeyError, TypeError):
+                _public_ips = {"ipv4": get_public_ip(), "ipv6": get_public_ipv6()}
+                _public_ips_checked_at = time.time()
+                _save_public_ips(_public_ips)
+
+        if time.time() - _public_ips_checked_at > PUBLIC_IP_REFRESH_INTERVAL:
+            _public_ips_checked_at = time.time()
+            threading.Thread(target=_refresh_public_ips, name="public ip refresh", daemon=True).start()
+
+    return _public_ips
+
+
 def readable_size(size_bytes):
     if size_bytes <= 0:
         return "0 B"
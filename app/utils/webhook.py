@@ -0,0 +1,291 @@
+"""
+Delivery of notifications to the webhook addresses, through the `webhook_outbox` table.
+
+Notifications are buffered and inserted by the worker threads in batches, one row per
+address, so they survive restarts and callers never wait for the database. The buffer
+holds up to WEBHOOK_BUFFER_SIZE notifications, if the outbox can't be written for long
+the oldest are dropped and counted.
+
+Every address has its own worker thread, so a slow or unreachable endpoint only delays
+its own notifications. Workers claim the oldest due rows in chunks of WEBHOOK_BATCH_SIZE
+with a lease, post them over a keep-alive session with a timeout and delete them once
+accepted. A failed chunk is due again after an exponential backoff, and the endpoint
+holds everything else until then. Rows out of tries are moved to `webhook_dead_letters`.
+"""
+
+import hashlib
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import case, func, insert, or_
+from sqlalchemy.orm import Session
+
+from app import logger
+from app.db import GetDB
+from app.db.models import WebhookDeadLetter, WebhookOutbox
+from config import (
+    NUMBER_OF_RECURRENT_NOTIFICATIONS,
+    RECURRENT_NOTIFICATIONS_TIMEOUT,
+    WEBHOOK_ADDRESS,
+    WEBHOOK_BATCH_SIZE,
+    WEBHOOK_BUFFER_SIZE,
+    WEBHOOK_RETRY_BACKOFF,
+    WEBHOOK_SECRET,
+    WEBHOOK_TIMEOUT,
+)
+
+# claimed rows are left to other workers if not settled within this long
+CLAIM_LEASE = timedelta(seconds=WEBHOOK_TIMEOUT * 2 + 30)
+FLUSH_INTERVAL = 1
+
+_buffer: Deque[Dict[str, Any]] = deque()
+_buffer_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_stopping = threading.Event()
+# notifications dropped from the full buffer
+dropped = 0
+
+
+def endpoint_key(address: str) -> str:
+    return hashlib.sha256(address.encode()).hexdigest()[:16]
+
+
+def dead_letter(db: Session, address: str, payloads: List[Dict[str, Any]], tries: int, error: str):
+    db.add(WebhookDeadLetter(address=address, payload=payloads, tries=tries, error=error[:1024]))
+
+
+class Endpoint:
+    def __init__(self, address: str):
+        self.address = address
+        self.key = endpoint_key(address)
+        self.wake = threading.Event()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if WEBHOOK_SECRET:
+            self.session.headers["x-webhook-secret"] = WEBHOOK_SECRET
+
+        self.sent = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.last_lag = 0.0
+        self.resume_at = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=f"webhook {self.address}", daemon=True)
+        self._thread.start()
+
+    def join(self, timeout: float):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run(self):
+        while not _stopping.is_set():
+            busy = False
+            try:
+                flush()
+                # new notifications wait until the endpoint is retried
+                if time.time() >= self.resume_at:
+                    busy = self._deliver_next()
+            except Exception as err:
+                logger.error(f"Webhook delivery to {self.address} failed: {err}")
+
+            if not busy:
+                self.wake.wait(FLUSH_INTERVAL)
+                self.wake.clear()
+
+    def _deliver_next(self) -> bool:
+        """Delivers the next chunk of due rows, returns whether there was one."""
+        with GetDB() as db:
+            rows = self._claim(db)
+            if rows:
+                self.resume_at = time.time() + self._deliver(db, rows)
+        return bool(rows)
+
+    def _claim(self, db: Session) -> List[WebhookOutbox]:
+        now = datetime.utcnow()
+        claimable = or_(WebhookOutbox.claimed_until.is_(None), WebhookOutbox.claimed_until < now)
+        ids = [row_id for row_id, in db.query(WebhookOutbox.id)
+               .filter(WebhookOutbox.endpoint == self.key, WebhookOutbox.due_at <= now, claimable)
+               .order_by(WebhookOutbox.id)
+               .limit(WEBHOOK_BATCH_SIZE)]
+        if not ids:
+            return []
+
+        claim = secrets.token_hex(8)
+        db.query(WebhookOutbox) \
+            .filter(WebhookOutbox.id.in_(ids), claimable) \
+            .update({WebhookOutbox.claim: claim, WebhookOutbox.claimed_until: now + CLAIM_LEASE},
+                    synchronize_session=False)
+        db.commit()
+        return db.query(WebhookOutbox) \
+            .filter(WebhookOutbox.id.in_(ids), WebhookOutbox.claim == claim) \
+            .order_by(WebhookOutbox.id) \
+            .all()
+
+    def _post(self, payloads: List[Dict[str, Any]]) -> Optional[str]:
+        """Posts the payloads, returns the error if they weren't accepted."""
+        try:
+            logger.debug(f"Sending {len(payloads)} webhook updates to {self.address}")
+            r = self.session.post(self.address, json=payloads, timeout=WEBHOOK_TIMEOUT)
+            if r.ok:
+                return None
+            error = f"{r.status_code} {r.reason}"
+        except requests.RequestException as err:
+            error = str(err) or err.__class__.__name__
+        logger.error(f"Failed to send {len(payloads)} webhook updates to {self.address}: {error}")
+        return error
+
+    def _deliver(self, db: Session, rows: List[WebhookOutbox]) -> float:
+        """Delivers the claimed rows, returns the seconds to wait before the next claim."""
+        error = self._post([row.payload for row in rows])
+        now = datetime.utcnow()
+        ids = [row.id for row in rows]
+
+        if error is None:
+            self.last_lag = (now - min(row.created_at for row in rows)).total_seconds()
+            db.query(WebhookOutbox).filter(WebhookOutbox.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            self.sent += len(rows)
+            return 0
+
+        self.failed += 1
+        claim = rows[0].claim
+        tries = max(row.tries for row in rows) + 1
+        expired = [row for row in rows if row.tries + 1 > NUMBER_OF_RECURRENT_NOTIFICATIONS]
+        if expired:
+            dead_letter(db, self.address, [row.payload for row in expired], tries, error)
+            db.query(WebhookOutbox) \
+                .filter(WebhookOutbox.id.in_([row.id for row in expired])) \
+                .delete(synchronize_session=False)
+            self.dead_lettered += len(expired)
+
+        delay = min(WEBHOOK_RETRY_BACKOFF * 2 ** (tries - 1), RECURRENT_NOTIFICATIONS_TIMEOUT)
+        db.query(WebhookOutbox) \
+            .filter(WebhookOutbox.id.in_(ids), WebhookOutbox.claim == claim) \
+            .update({
+                WebhookOutbox.tries: WebhookOutbox.tries + 1,
+                WebhookOutbox.due_at: now + timedelta(seconds=delay),
+                WebhookOutbox.claim: None,
+                WebhookOutbox.claimed_until: None,
+            }, synchronize_session=False)
+        db.commit()
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        with GetDB() as db:
+            queued, retrying, oldest = db.query(
+                func.count(WebhookOutbox.id),
+                func.sum(case((WebhookOutbox.tries > 0, 1), else_=0)),
+                func.min(WebhookOutbox.created_at),
+            ).filter(WebhookOutbox.endpoint == self.key).one()
+
+        return {
+            "address": self.address,
+            "queued": queued,
+            "retrying": retrying or 0,
+            "sent": self.sent,
+            "failed_attempts": self.failed,
+            "dead_lettered": self.dead_lettered,
+            "lag": (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0,
+            "last_delivery_lag": self.last_lag,
+        }
+
+
+endpoints = [Endpoint(address) for address in WEBHOOK_ADDRESS]
+
+
+def _buffer_payloads(payloads: List[Dict[str, Any]], oldest: bool = False):
+    """Adds the payloads to the buffer, at its start if `oldest`, dropping the oldest when full."""
+    global dropped
+    with _buffer_lock:
+        if oldest:
+            _buffer.extendleft(reversed(payloads))
+        else:
+            _buffer.extend(payloads)
+        overflow = max(len(_buffer) - WEBHOOK_BUFFER_SIZE, 0)
+        for _ in range(overflow):
+            _buffer.popleft()
+        dropped += overflow
+
+
+def enqueue(payload: Dict[str, Any]):
+    """
+    Buffers the payload for every address, the worker threads insert it into the outbox
+    within a second, or right away once a batch is buffered.
+    """
+    if not endpoints:
+        return
+    _buffer_payloads([payload])
+    if len(_buffer) >= WEBHOOK_BATCH_SIZE:
+        for endpoint in endpoints:
+            endpoint.wake.set()
+
+
+def flush():
+    """Inserts the buffered payloads into the outbox, they're kept buffered if it fails."""
+    with _flush_lock:
+        with _buffer_lock:
+            payloads = list(_buffer)
+            _buffer.clear()
+        if not payloads:
+            return
+
+        now = datetime.utcnow()
+        rows = [
+            {"endpoint": endpoint.key, "payload": payload, "tries": 0, "due_at": now, "created_at": now}
+            for endpoint in endpoints
+            for payload in payloads
+        ]
+        try:
+            with GetDB() as db:
+                db.execute(insert(WebhookOutbox), rows)
+                db.commit()
+        except Exception as err:
+            _buffer_payloads(payloads, oldest=True)
+            logger.error(
+                f"Failed to store {len(payloads)} webhook notifications, kept in memory "
+                f"({dropped} dropped from the full buffer so far): {err}"
+            )
+            return
+
+    for endpoint in endpoints:
+        endpoint.wake.set()
+
+
+def start():
+    # rows of addresses that were removed from WEBHOOK_ADDRESS can't be delivered anymore
+    with GetDB() as db:
+        deleted = db.query(WebhookOutbox) \
+            .filter(WebhookOutbox.endpoint.notin_([endpoint.key for endpoint in endpoints])) \
+            .delete(synchronize_session=False)
+        db.commit()
+    if deleted:
+        logger.warning(f"Deleted {deleted} pending webhook notifications of removed addresses")
+
+    for endpoint in endpoints:
+        endpoint.start()
+
+
+def stop(timeout: float = WEBHOOK_TIMEOUT * 2):
+    """Stops the workers and stores buffered notifications, which are delivered after a restart."""
+    _stopping.set()
+    deadline = time.time() + timeout
+    for endpoint in endpoints:
+        endpoint.wake.set()
+    for endpoint in endpoints:
+        endpoint.join(max(deadline - time.time(), 0))
+    flush()
+
+
+def stats() -> List[Dict[str, Any]]:
+    return [endpoint.stats() for endpoint in endpoints]
@@ -0,0 +1,223 @@
+"""
+Coordination of the panel's workers, when UVICORN_WORKERS is more than one.
+
+The Xray core, the node connections, the scheduler jobs and the Telegram bot must only run
+in one process. Workers race for an exclusive lock on WORKERS_LOCK_FILE and the holder is
+the leader, which runs the functions registered with `on_elected`. The others keep trying,
+so one of them takes over when the leader dies, the lock is released along with its process.
+
+Followers serve the API and subscriptions. They forward xray operations to the leader and
+broadcast changes of in-memory state, such as the hosts, to the other workers through the
+`worker_messages` table, which every worker polls each WORKERS_POLL_INTERVAL seconds.
+Messages may commit out of id order, e.g. on MySQL, so the recent ones are read again and
+those already handled are skipped.
+
+The leader also shares values registered with `shared`, such as the state of the core,
+in a file next to WORKERS_LOCK_FILE that followers read with `leader_state`. What only
+the leader has, like the logs of the cores, isn't served by followers.
+
+A single worker is always the leader and never sends messages.
+"""
+
+import fcntl
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from app import logger
+from config import UVICORN_WORKERS, WORKERS_LOCK_FILE, WORKERS_POLL_INTERVAL
+
+# workers only read messages sent after they started, older ones are deleted by the leader
+MESSAGES_RETENTION = timedelta(minutes=10)
+PRUNE_INTERVAL = 60
+# messages created this recently are read again, in case they committed after newer ones
+RECHECK_WINDOW = timedelta(seconds=60)
+STATE_FILE = f"{WORKERS_LOCK_FILE}.state"
+
+enabled = UVICORN_WORKERS > 1
+worker_id = secrets.token_hex(8)
+is_leader = not enabled
+
+_on_elected: List[Callable[[], None]] = []
+_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+_shared: Dict[str, Callable[[], Any]] = {}
+_lock_file = None
+_last_id = 0
+# ids of the messages within the recheck window that were handled, with their creation time
+_handled: Dict[int, datetime] = {}
+_pruned_at = 0.0
+_stopping = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def on_elected(func: Callable[[], None]):
+    """Runs the function when this worker becomes the leader, at startup or on a takeover."""
+    _on_elected.append(func)
+    return func
+
+
+def handler(type: str):
+    """Registers the handler of a message type, it's called with the payload of the message."""
+    def decorator(func: Callable[[Dict[str, Any]], None]):
+        _handlers[type] = func
+        return func
+    return decorator
+
+
+def shared(name: str):
+    """Registers a function whose value the leader shares with the followers, see `leader_state`."""
+    def decorator(func: Callable[[], Any]):
+        _shared[name] = func
+        return func
+    return decorator
+
+
+def leader_state() -> Dict[str, Any]:
+    """
+    The values of the `shared` functions in the leader, as of its last poll, or computed
+    right away in the leader. Empty until a leader has shared them.
+    """
+    if is_leader:
+        return {name: func() for name, func in _shared.items()}
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _share_state():
+    state = {}
+    for name, func in _shared.items():
+        try:
+            state[name] = func()
+        except Exception as err:
+            logger.error(f"Failed to share {name} with the other workers: {err}")
+    path = f"{STATE_FILE}.{os.getpid()}"
+    with open(path, "w") as f:
+        json.dump(state, f, default=str)
+    os.replace(path, STATE_FILE)
+
+
+def send(type: str, payload: Dict[str, Any], leader_only: bool = True):
+    """Sends a message to the leader, or to every other worker if not `leader_only`."""
+    from app.db import GetDB
+    from app.db.models import WorkerMessage
+
+    with GetDB() as db:
+        db.add(WorkerMessage(sender=worker_id, leader_only=leader_only, type=type, payload=payload))
+        db.commit()
+
+
+def broadcast(type: str, payload: Optional[Dict[str, Any]] = None):
+    """Tells the other workers about a change already applied by this one."""
+    if enabled:
+        send(type, payload or {}, leader_only=False)
+
+
+def _try_lock() -> bool:
+    try:
+        fcntl.flock(_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _elected():
+    global is_leader
+    is_leader = True
+    logger.info(f"Worker {os.getpid()} is the leader")
+    for func in _on_elected:
+        func()
+
+
+def _poll():
+    global _last_id, _pruned_at
+    from sqlalchemy import or_
+
+    from app.db import GetDB
+    from app.db.models import WorkerMessage
+
+    recheck_since = datetime.utcnow() - RECHECK_WINDOW
+    with GetDB() as db:
+        if is_leader and time.monotonic() - _pruned_at > PRUNE_INTERVAL:
+            db.query(WorkerMessage) \
+                .filter(WorkerMessage.created_at < datetime.utcnow() - MESSAGES_RETENTION) \
+                .delete(synchronize_session=False)
+            db.commit()
+            _pruned_at = time.monotonic()
+        messages = db.query(WorkerMessage) \
+            .filter(or_(WorkerMessage.id > _last_id, WorkerMessage.created_at >= recheck_since)) \
+            .order_by(WorkerMessage.id) \
+            .all()
+
+    for handled_id in [i for i, created_at in _handled.items() if created_at < recheck_since]:
+        del _handled[handled_id]
+
+    for message in messages:
+        if message.id in _handled:
+            continue
+        _handled[message.id] = message.created_at
+        _last_id = max(_last_id, message.id)
+        if message.sender == worker_id or (message.leader_only and not is_leader):
+            continue
+
+        func = _handlers.get(message.type)
+        if func is None:
+            logger.warning(f"Unknown worker message {message.type}")
+            continue
+        try:
+            func(message.payload)
+        except Exception as err:
+            logger.error(f"Failed to handle worker message {message.type}: {err}")
+
+
+def _run():
+    while not _stopping.wait(WORKERS_POLL_INTERVAL):
+        try:
+            if not is_leader and _try_lock():
+                _elected()
+            _poll()
+            if is_leader:
+                _share_state()
+        except Exception as err:
+            logger.error(f"Worker coordination failed: {err}")
+
+
+def start():
+    """Elects the leader, called on the startup of every worker."""
+    global _lock_file, _last_id, _thread
+    if not enabled:
+        for func in _on_elected:
+            func()
+        return
+
+    from sqlalchemy import func
+
+    from app.db import GetDB
+    from app.db.models import WorkerMessage
+
+    with GetDB() as db:
+        _last_id = db.query(func.max(WorkerMessage.id)).scalar() or 0
+        # recent messages were sent before this worker started, they aren't for it
+        _handled.update(db.query(WorkerMessage.id, WorkerMessage.created_at)
+                        .filter(WorkerMessage.created_at >= datetime.utcnow() - RECHECK_WINDOW))
+
+    _lock_file = open(WORKERS_LOCK_FILE, "a")
+    if _try_lock():
+        _elected()
+    else:
+        logger.info(f"Worker {os.getpid()} is a follower")
+
+    _thread = threading.Thread(target=_run, name="workers", daemon=True)
+    _thread.start()
+
+
+def stop():
+    _stopping.set()
+    if _thread is not None:
+        _thread.join(WORKERS_POLL_INTERVAL * 2)
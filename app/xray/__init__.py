@@ -1,83 +1,157 @@
 from random import randint
-from typing import TYPE_CHECKING, Dict, Sequence
+from typing import TYPE_CHECKING, Dict, Optional, Sequence
 
-from app.models.proxy import ProxyHostSecurity
-from app.utils.store import DictStorage
-from app.utils.system import check_port
-from app.xray import operations
-from app.xray.config import XRayConfig
-from app.xray.core import XRayCore
-from app.xray.node import XRayNode
-from config import XRAY_ASSETS_PATH, XRAY_EXECUTABLE_PATH, XRAY_JSON
-from xray_api import XRay as XRayAPI
-from xray_api import exceptions, types
-from xray_api import exceptions as exc
+from config import SUBSCRIPTION_ONLY, XRAY_ASSETS_PATH, XRAY_EXECUTABLE_PATH, XRAY_JSON
 
-core = XRayCore(XRAY_EXECUTABLE_PATH, XRAY_ASSETS_PATH)
+if TYPE_CHECKING:
+    from app.db.models import ProxyHost
+    from app.xray.node import XRayNode
 
-# Search for a free API port
-try:
-    for api_port in range(randint(10000, 60000), 65536):
-        if not check_port(api_port):
-            break
-finally:
-    config = XRayConfig(XRAY_JSON, api_port=api_port)
-    del api_port
+if SUBSCRIPTION_ONLY:
+    # standalone subscription servers (sub.py) have no core, their inbounds and hosts
+    # are the ones published by the panel
+    from app.xray.published import PublishedConfig
 
-api = XRayAPI(config.api_host, config.api_port)
+    config = PublishedConfig([])
+    hosts: Dict[str, list] = {}
+    # the published revision they were loaded from
+    hosts_revision: Optional[int] = None
 
-nodes: Dict[int, XRayNode] = {}
+    __all__ = ["config", "hosts", "hosts_revision"]
 
+else:
+    import importlib
+    import sys
+    import threading
+    from types import ModuleType
 
-if TYPE_CHECKING:
-    from app.db.models import ProxyHost
+    from app.utils.store import DictStorage
+
+    # the core, the config and the API client are created on first use, so importing
+    # app.xray (the CLI, migrations...) doesn't run the xray binary, search for a free
+    # port or parse the config, and the modules below are only imported when used
+    _lazy_imports = {
+        "operations": ("app.xray.operations", None),
+        "XRayConfig": ("app.xray.config", "XRayConfig"),
+        "XRayCore": ("app.xray.core", "XRayCore"),
+        "XRayNode": ("app.xray.node", "XRayNode"),
+        "exceptions": ("xray_api", "exceptions"),
+        "exc": ("xray_api", "exceptions"),
+        "types": ("xray_api", "types"),
+    }
+    _objects = {}
+    _lock = threading.RLock()
+
+    def __getattr__(name: str):
+        try:
+            module, attr = _lazy_imports[name]
+        except KeyError:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+        value = importlib.import_module(module)
+        if attr:
+            value = getattr(value, attr)
+        globals()[name] = value
+        return value
+
+    def _create_core():
+        from app.xray.core import XRayCore
+
+        return XRayCore(
+            XRAY_EXECUTABLE_PATH, XRAY_ASSETS_PATH,
+            config_factory=lambda: _module.config.include_db_users(),
+        )
+
+    def _create_config():
+        from app.utils.system import check_port
+        from app.xray.config import XRayConfig
+
+        # Search for a free API port
+        for api_port in range(randint(10000, 60000), 65536):
+            if not check_port(api_port):
+                break
+        return XRayConfig(XRAY_JSON, api_port=api_port)
+
+    def _create_api():
+        from xray_api import XRay as XRayAPI
+
+        return XRayAPI(_module.config.api_host, _module.config.api_port)
+
+    def _lazy(name: str, create):
+        def get(module):
+            if name not in _objects:
+                with _lock:
+                    if name not in _objects:
+                        _objects[name] = create()
+            return _objects[name]
+
+        def set(module, value):
+            # importing app.xray.core or app.xray.config sets them as attributes of the
+            # package, the objects keep the names
+            if not isinstance(value, ModuleType):
+                _objects[name] = value
+
+        return property(get, set)
+
+    class _XRayModule(ModuleType):
+        core = _lazy("core", _create_core)
+        config = _lazy("config", _create_config)
+        api = _lazy("api", _create_api)
+
+    _module = sys.modules[__name__]
+    _module.__class__ = _XRayModule
+
+    nodes: Dict[int, "XRayNode"] = {}
+    # the hosts revision of the database when the hosts were loaded in this worker
+    hosts_revision: Optional[int] = None
+
+    @DictStorage
+    def hosts(storage: dict):
+        global hosts_revision
+        from app.db import GetDB, crud
+        from app.models.proxy import ProxyHostSecurity
+
+        storage.clear()
+        with GetDB() as db:
+            hosts_revision = crud.get_revisions(db)[1]
+            for inbound_tag in _module.config.inbounds_by_tag:
+                inbound_hosts: Sequence[ProxyHost] = crud.get_hosts(db, inbound_tag)
 
+                storage[inbound_tag] = [
+                    {
+                        "remark": host.remark,
+                        "address": [i.strip() for i in host.address.split(',')] if host.address else [],
+                        "port": host.port,
+                        "path": host.path if host.path else None,
+                        "sni": [i.strip() for i in host.sni.split(',')] if host.sni else [],
+                        "host": [i.strip() for i in host.host.split(',')] if host.host else [],
+                        "alpn": host.alpn.value,
+                        "fingerprint": host.fingerprint.value,
+                        # None means the tls is not specified by host itself and
+                        #  complies with its inbound's settings.
+                        "tls": None
+                        if host.security == ProxyHostSecurity.inbound_default
+                        else host.security.value,
+                        "allowinsecure": host.allowinsecure,
+                        "mux_enable": host.mux_enable,
+                        "fragment_setting": host.fragment_setting,
+                        "noise_setting": host.noise_setting,
+                        "random_user_agent": host.random_user_agent,
+                        "use_sni_as_host": host.use_sni_as_host,
+                    } for host in inbound_hosts if not host.is_disabled
+                ]
 
-@DictStorage
-def hosts(storage: dict):
-    from app.db import GetDB, crud
-
-    storage.clear()
-    with GetDB() as db:
-        for inbound_tag in config.inbounds_by_tag:
-            inbound_hosts: Sequence[ProxyHost] = crud.get_hosts(db, inbound_tag)
-
-            storage[inbound_tag] = [
-                {
-                    "remark": host.remark,
-                    "address": [i.strip() for i in host.address.split(',')] if host.address else [],
-                    "port": host.port,
-                    "path": host.path if host.path else None,
-                    "sni": [i.strip() for i in host.sni.split(',')] if host.sni else [],
-                    "host": [i.strip() for i in host.host.split(',')] if host.host else [],
-                    "alpn": host.alpn.value,
-                    "fingerprint": host.fingerprint.value,
-                    # None means the tls is not specified by host itself and
-                    #  complies with its inbound's settings.
-                    "tls": None
-                    if host.security == ProxyHostSecurity.inbound_default
-                    else host.security.value,
-                    "allowinsecure": host.allowinsecure,
-                    "mux_enable": host.mux_enable,
-                    "fragment_setting": host.fragment_setting,
-                    "noise_setting": host.noise_setting,
-                    "random_user_agent": host.random_user_agent,
-                    "use_sni_as_host": host.use_sni_as_host,
-                } for host in inbound_hosts if not host.is_disabled
-            ]
-
-
-__all__ = [
-    "config",
-    "hosts",
-    "core",
-    "api",
-    "nodes",
-    "operations",
-    "exceptions",
-    "exc",
-    "types",
-    "XRayConfig",
-    "XRayCore",
-    "XRayNode",
-]
+    __all__ = [
+        "config",
+        "hosts",
+        "hosts_revision",
+        "core",
+        "api",
+        "nodes",
+        "operations",
+        "exceptions",
+        "exc",
+        "types",
+        "XRayConfig",
+        "XRayCore",
+        "XRayNode",
+    ]
@@ -0,0 +1,262 @@
+"""
+Structured store of the main core's access logs, enabled with ACCESS_LOG_DIR.
+
+The capture thread only hands lines to a bounded queue, which drops (and counts) lines
+when full instead of blocking Xray's stdout pipe. A writer thread parses access lines,
+buffers them and every few seconds appends them as one gzip member to the file of their
+hour, in UTC:
+
+    <ACCESS_LOG_DIR>/<YYYY-MM-DD>/<HH>.tsv.gz
+
+Each record is a tab separated line of unix time, source, action, network, destination
+host and port, inbound, outbound, user ID and username. Days older than
+ACCESS_LOG_RETENTION_DAYS are removed. Xray only writes access logs to stdout when
+`log.access` isn't set to a file in its config.
+"""
+
+import gzip
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app import app, logger
+from config import ACCESS_LOG_DIR, ACCESS_LOG_QUEUE_SIZE, ACCESS_LOG_RETENTION_DAYS
+
+FLUSH_INTERVAL = 5
+FLUSH_RECORDS = 10000
+
+# 2024/01/01 12:00:00.123456 from 1.2.3.4:5678 accepted tcp:example.com:443 [vless-in >> direct] email: 1.user
+ACCESS_LINE = re.compile(
+    r"^(\d{4}/\d\d/\d\d \d\d:\d\d:\d\d)(?:\.\d+)? (?:from )?(?:(?:tcp|udp):)?(\S+) (accepted|rejected) "
+    r"(?:(tcp|udp):)?(\S+):(\d+) \[(\S+) (?:->|>>) (\S+)\](?: email: (\S+))?"
+)
+
+enabled = bool(ACCESS_LOG_DIR)
+dropped = 0
+_queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=ACCESS_LOG_QUEUE_SIZE)
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+
+
+@dataclass
+class AccessRecord:
+    timestamp: int
+    source: str
+    action: str
+    network: str
+    host: str
+    port: int
+    inbound: str
+    outbound: str
+    user_id: Optional[int]
+    username: Optional[str]
+
+    def to_line(self) -> str:
+        return "\t".join("" if v is None else str(v) for v in (
+            self.timestamp, self.source, self.action, self.network, self.host, self.port,
+            self.inbound, self.outbound, self.user_id, self.username,
+        )) + "\n"
+
+    @classmethod
+    def from_line(cls, line: str) -> "AccessRecord":
+        ts, source, action, network, host, port, inbound, outbound, user_id, username = line.rstrip("\n").split("\t")
+        return cls(int(ts), source, action, network, host, int(port), inbound, outbound,
+                   int(user_id) if user_id else None, username or None)
+
+
+class Parser:
+    def __init__(self):
+        # lines of the same second share the timestamp prefix, its conversion is cached
+        self._last_time: Tuple[str, int] = ("", 0)
+
+    def _timestamp(self, value: str) -> int:
+        if value != self._last_time[0]:
+            # Xray logs in the local time of the server
+            self._last_time = (value, int(time.mktime(time.strptime(value, "%Y/%m/%d %H:%M:%S"))))
+        return self._last_time[1]
+
+    def parse(self, line: str) -> Optional[AccessRecord]:
+        m = ACCESS_LINE.match(line)
+        if not m:
+            return None
+        logged_at, source, action, network, host, port, inbound, outbound, email = m.groups()
+        user_id = username = None
+        if email:
+            uid, _, username = email.partition(".")
+            user_id = int(uid) if uid.isdigit() else None
+        return AccessRecord(
+            timestamp=self._timestamp(logged_at),
+            source=source,
+            action=action,
+            network=network or "tcp",
+            host=host,
+            port=int(port),
+            inbound=inbound,
+            outbound=outbound,
+            user_id=user_id,
+            username=username or None,
+        )
+
+
+def partition_path(hour: datetime) -> str:
+    return os.path.join(ACCESS_LOG_DIR, hour.strftime("%Y-%m-%d"), f"{hour:%H}.tsv.gz")
+
+
+def write(records: List[AccessRecord]):
+    """Appends the records to their hour files, one gzip member per file."""
+    by_hour: Dict[int, List[str]] = defaultdict(list)
+    for record in records:
+        by_hour[record.timestamp // 3600].append(record.to_line())
+
+    for hour, lines in by_hour.items():
+        path = partition_path(datetime.fromtimestamp(hour * 3600, timezone.utc))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.write(gzip.compress("".join(lines).encode(), compresslevel=6))
+
+
+def remove_expired(now: datetime):
+    oldest = (now - timedelta(days=ACCESS_LOG_RETENTION_DAYS)).strftime("%Y-%m-%d")
+    for day in os.listdir(ACCESS_LOG_DIR):
+        if day < oldest and os.path.isdir(os.path.join(ACCESS_LOG_DIR, day)):
+            shutil.rmtree(os.path.join(ACCESS_LOG_DIR, day), ignore_errors=True)
+            logger.info(f"Removed access logs of {day}")
+
+
+def _run():
+    parser = Parser()
+    records: List[AccessRecord] = []
+    flush_at = time.monotonic() + FLUSH_INTERVAL
+    last_dropped = 0
+    cleaned_day = None
+    stopping = False
+
+    while not stopping:
+        try:
+            line = _queue.get(timeout=max(flush_at - time.monotonic(), 0.01))
+            if line is None:
+                stopping = True
+            elif (record := parser.parse(line)) is not None:
+                records.append(record)
+        except queue.Empty:
+            pass
+
+        if not stopping and len(records) < FLUSH_RECORDS and time.monotonic() < flush_at:
+            continue
+
+        try:
+            if records:
+                write(records)
+            now = datetime.now(timezone.utc)
+            if now.date() != cleaned_day:
+                remove_expired(now)
+                cleaned_day = now.date()
+        except OSError as err:
+            logger.error(f"Failed to write access logs: {err}")
+        records = []
+        flush_at = time.monotonic() + FLUSH_INTERVAL
+
+        if dropped != last_dropped:
+            logger.warning(f"Access log queue is full, dropped {dropped - last_dropped} lines")
+            last_dropped = dropped
+
+
+def submit(line: str):
+    """Queues a line of the core's output, called from the capture thread and never blocks."""
+    global _thread, dropped
+
+    if _thread is None:
+        with _thread_lock:
+            if _thread is None:
+                _thread = threading.Thread(target=_run, name="access log writer", daemon=True)
+                _thread.start()
+    try:
+        _queue.put_nowait(line)
+    except queue.Full:
+        dropped += 1
+
+
+@app.on_event("shutdown")
+def stop():
+    if _thread is not None:
+        try:
+            _queue.put(None, timeout=1)
+        except queue.Full:
+            return
+        _thread.join(FLUSH_INTERVAL)
+
+
+def _read_lines(path: str) -> Iterator[str]:
+    with gzip.open(path, "rt") as f:
+        try:
+            yield from f
+        except EOFError:
+            pass  # the last member is still being written
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc) if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _hours(start: datetime, end: datetime) -> Iterator[datetime]:
+    """Hours of the range, newest first."""
+    hour = end.replace(minute=0, second=0, microsecond=0)
+    while hour >= start.replace(minute=0, second=0, microsecond=0):
+        yield hour
+        hour -= timedelta(hours=1)
+
+
+def query(start: datetime, end: datetime, username: Optional[str] = None, destination: Optional[str] = None,
+          limit: int = 1000) -> List[AccessRecord]:
+    """
+    Searches the stored records of the range, newest first.
+
+    Args:
+        start (datetime): Start of the range, in UTC.
+        end (datetime): End of the range, in UTC.
+        username (Optional[str]): Only records of this user.
+        destination (Optional[str]): Only records whose destination host contains this.
+        limit (int): Maximum number of records.
+
+    Returns:
+        List[AccessRecord]: The matching records.
+    """
+    start, end = _utc(start), _utc(end)
+    start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+    username = username.lower() if username else None
+    found: List[AccessRecord] = []
+    for hour in _hours(start, end):
+        path = partition_path(hour)
+        if not os.path.exists(path):
+            continue
+
+        matches = []
+        try:
+            for line in _read_lines(path):
+                # cheap substring checks before splitting the line
+                if username and username not in line.lower():
+                    continue
+                if destination and destination not in line:
+                    continue
+                record = AccessRecord.from_line(line)
+                if not start_ts <= record.timestamp <= end_ts:
+                    continue
+                if username and (record.username or "").lower() != username:
+                    continue
+                if destination and destination not in record.host:
+                    continue
+                matches.append(record)
+        except (OSError, EOFError) as err:
+            logger.error(f"Failed to read access logs {path}: {err}")
+
+        found.extend(reversed(matches))
+        if len(found) >= limit:
+            break
+    return found[:limit]
@@ -1,34 +1,59 @@
+import asyncio
 import atexit
 import re
 import subprocess
 import threading
-from collections import deque
+import time
 from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import psutil
 
 from app import logger
+from app.utils.logs import BACKLOG, LogBroadcaster, LogSubscription
+from app.xray import access_log
 from app.xray.config import XRayConfig
 from config import DEBUG
 
+# restarts after unexpected exits are delayed 1, 2, 4... seconds up to this,
+# the delay starts over once the core has been up for STABLE_UPTIME
+RESTART_BACKOFF_MAX = 60
+STABLE_UPTIME = 60
+STOP_TIMEOUT = 5
+
 
 class XRayCore:
     def __init__(self,
                  executable_path: str = "/usr/bin/xray",
-                 assets_path: str = "/usr/share/xray"):
+                 assets_path: str = "/usr/share/xray",
+                 config_factory: Optional[Callable[[], XRayConfig]] = None):
         self.executable_path = executable_path
         self.assets_path = assets_path
+        # builds the config of restarts after unexpected exits, with the users as they are now
+        self.config_factory = config_factory
 
         self.version = self.get_version()
-        self.process = None
+        self.process: Optional[asyncio.subprocess.Process] = None
         self.restarting = False
 
-        self._logs_buffer = deque(maxlen=100)
-        self._temp_log_buffers = {}
+        self.logs = LogBroadcaster()
+        self.restarts = 0
+        self.started_at: Optional[float] = None
+        self.last_exit_code: Optional[int] = None
+        self._config: Optional[XRayConfig] = None
+        self._backoff = 0
+        self._restart_handle: Optional[asyncio.TimerHandle] = None
+        self._psutil_process: Optional[psutil.Process] = None
         self._on_start_funcs = []
         self._on_stop_funcs = []
         self._env = {
             "XRAY_LOCATION_ASSET": assets_path
         }
 
+        # the process is supervised by its own event loop, so its exit is noticed right away
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="xray supervisor", daemon=True).start()
+
         atexit.register(lambda: self.stop() if self.started else None)
 
     def get_version(self):
@@ -51,102 +76,151 @@ class XRayCore:
                 "public_key": public
             }
 
-    def __capture_process_logs(self):
-        def capture_and_debug_log():
-            while self.process:
-                output = self.process.stdout.readline()
-                if output:
-                    output = output.strip()
-                    self._logs_buffer.append(output)
-                    for buf in list(self._temp_log_buffers.values()):
-                        buf.append(output)
-                    logger.debug(output)
-
-                elif not self.process or self.process.poll() is not None:
-                    break
-
-        def capture_only():
-            while self.process:
-                output = self.process.stdout.readline()
-                if output:
-                    output = output.strip()
-                    self._logs_buffer.append(output)
-                    for buf in list(self._temp_log_buffers.values()):
-                        buf.append(output)
-
-                elif not self.process or self.process.poll() is not None:
-                    break
+    def _call(self, coro, timeout: Optional[float] = None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
 
+    def _on_output(self, line: str, stdout: bool = True):
+        self.logs.publish(line)
+        if stdout and access_log.enabled:
+            access_log.submit(line)
         if DEBUG:
-            threading.Thread(target=capture_and_debug_log).start()
-        else:
-            threading.Thread(target=capture_only).start()
+            logger.debug(line)
 
-    @contextmanager
-    def get_logs(self):
-        buf = deque(self._logs_buffer, maxlen=100)
-        buf_id = id(buf)
-        try:
-            self._temp_log_buffers[buf_id] = buf
-            yield buf
-        finally:
-            del self._temp_log_buffers[buf_id]
-            del buf
+    async def _drain(self, stream: asyncio.StreamReader, stdout: bool = True):
+        """Reads a pipe until it's closed, so a full pipe buffer never blocks the core."""
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:  # longer than the stream limit, skipped
+                continue
+            if not line:
+                break
+            if line := line.decode(errors="replace").strip():
+                self._on_output(line, stdout)
 
-    @property
-    def started(self):
-        if not self.process:
-            return False
+    async def _watch(self, process: asyncio.subprocess.Process):
+        code = await process.wait()
+        if process is not self.process:
+            return  # stopped on purpose
+
+        uptime = time.time() - self.started_at
+        self.process = None
+        self.started_at = None
+        self.last_exit_code = code
+        for func in self._on_stop_funcs:
+            threading.Thread(target=func).start()
 
-        if self.process.poll() is None:
-            return True
+        self._backoff = 0 if uptime >= STABLE_UPTIME else min(max(self._backoff * 2, 1), RESTART_BACKOFF_MAX)
+        logger.error(f"Xray core exited with code {code} after {uptime:.0f} seconds, "
+                     f"restarting in {self._backoff} seconds")
+        self._schedule_restart()
 
-        return False
+    def _schedule_restart(self):
+        self._restart_handle = self._loop.call_later(
+            self._backoff, lambda: self._loop.create_task(self._restart_after_exit())
+        )
 
-    def start(self, config: XRayConfig):
+    def _cancel_restart(self):
+        if self._restart_handle:
+            self._restart_handle.cancel()
+            self._restart_handle = None
+
+    async def _restart_after_exit(self):
+        self._restart_handle = None
+        if self.started or self._config is None:
+            return
+
+        self.restarts += 1
+        try:
+            config = self._config
+            if self.config_factory is not None:
+                # queries the database, kept off the loop draining the output
+                config = await self._loop.run_in_executor(None, self.config_factory)
+            await self._start(config)
+        except Exception as err:
+            self._backoff = min(max(self._backoff * 2, 1), RESTART_BACKOFF_MAX)
+            logger.error(f"Failed to restart Xray core: {err}, retrying in {self._backoff} seconds")
+            self._schedule_restart()
+
+    async def _start(self, config: XRayConfig):
         if self.started is True:
             raise RuntimeError("Xray is started already")
 
         if config.get('log', {}).get('logLevel') in ('none', 'error'):
             config['log']['logLevel'] = 'warning'
 
+        self._cancel_restart()
         cmd = [
             self.executable_path,
             "run",
             '-config',
             'stdin:'
         ]
-        self.process = subprocess.Popen(
-            cmd,
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
             env=self._env,
             stdin=subprocess.PIPE,
             stderr=subprocess.PIPE,
             stdout=subprocess.PIPE,
-            universal_newlines=True
+            limit=2 ** 20,
         )
-        self.process.stdin.write(config.to_json())
-        self.process.stdin.flush()
-        self.process.stdin.close()
+        process.stdin.write(config.to_json().encode())
+        await process.stdin.drain()
+        process.stdin.close()
+
+        self.process = process
+        self.started_at = time.time()
+        self._config = config
+        self._psutil_process = None
         logger.warning(f"Xray core {self.version} started")
 
-        self.__capture_process_logs()
+        self._loop.create_task(self._drain(process.stdout))
+        self._loop.create_task(self._drain(process.stderr, stdout=False))
+        self._loop.create_task(self._watch(process))
 
         # execute on start functions
         for func in self._on_start_funcs:
             threading.Thread(target=func).start()
 
-    def stop(self):
+    async def _stop(self):
+        self._cancel_restart()
         if not self.started:
             return
 
-        self.process.terminate()
-        self.process = None
+        process, self.process = self.process, None
+        self.started_at = None
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+        self.last_exit_code = process.returncode
         logger.warning("Xray core stopped")
 
         # execute on stop functions
         for func in self._on_stop_funcs:
             threading.Thread(target=func).start()
 
+    @contextmanager
+    def get_logs(self, backlog: int = BACKLOG) -> Iterator[LogSubscription]:
+        yield self.logs.subscribe(backlog)
+
+    @property
+    def started(self):
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def restart_pending(self) -> bool:
+        """Whether the core exited and is waiting for its backoff to be restarted."""
+        return self._restart_handle is not None
+
+    def start(self, config: XRayConfig):
+        self._call(self._start(config))
+
+    def stop(self):
+        self._call(self._stop(), STOP_TIMEOUT * 2)
+
     def restart(self, config: XRayConfig):
         if self.restarting is True:
             return
@@ -159,6 +233,37 @@ class XRayCore:
         finally:
             self.restarting = False
 
+    def stats(self) -> Dict[str, Any]:
+        """Uptime, restarts and resource usage of the core process."""
+        stats = {
+            "pid": None,
+            "uptime": int(time.time() - self.started_at) if self.started_at else 0,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+            "memory_rss": None,
+            "cpu_percent": None,
+            "open_fds": None,
+        }
+        process = self.process
+        if process is None or process.returncode is not None:
+            return stats
+
+        try:
+            # kept between calls, cpu_percent is measured since the previous call
+            if self._psutil_process is None or self._psutil_process.pid != process.pid:
+                self._psutil_process = psutil.Process(process.pid)
+            p = self._psutil_process
+            with p.oneshot():
+                stats.update(
+                    pid=process.pid,
+                    memory_rss=p.memory_info().rss,
+                    cpu_percent=p.cpu_percent(),
+                    open_fds=p.num_fds() if hasattr(p, "num_fds") else None,
+                )
+        except psutil.Error:
+            pass
+        return stats
+
     def on_start(self, func: callable):
         self._on_start_funcs.append(func)
         return func
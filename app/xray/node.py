@@ -4,9 +4,8 @@ import ssl
 import tempfile
 import threading
 import time
-from collections import deque
 from contextlib import contextmanager
-from typing import List
+from typing import Iterator, List
 
 import grpc
 import requests
@@ -15,6 +14,7 @@ from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.poolmanager import PoolManager
 from websocket import WebSocketConnectionClosedException, WebSocketTimeoutException, create_connection
 
+from app.utils.logs import LogBroadcaster, LogSubscription
 from app.xray.config import XRayConfig
 from xray_api import XRay as XRayAPI
 
@@ -71,7 +71,8 @@ class ReSTXRayNode:
         self._ssl_context.verify_mode = ssl.CERT_NONE
         self._ssl_context.load_cert_chain(certfile=self.session.cert[0], keyfile=self.session.cert[1])
         self._logs_ws_url = f"wss://{self.address.strip('/')}:{self.port}/logs"
-        self._logs_queues = []
+        self.logs = LogBroadcaster()
+        self._logs_viewers = 0
         self._logs_bg_thread = threading.Thread(target=self._bg_fetch_logs, daemon=True)
 
         self._api = None
@@ -228,16 +229,15 @@ class ReSTXRayNode:
         return res
 
     def _bg_fetch_logs(self):
-        while self._logs_queues:
+        while self._logs_viewers:
             try:
                 websocket_url = f"{self._logs_ws_url}?session_id={self._session_id}&interval=0.7"
                 self._ssl_context.load_verify_locations(self.session.verify)
                 ws = create_connection(websocket_url, sslopt={"context": self._ssl_context}, timeout=2)
-                while self._logs_queues:
+                while self._logs_viewers:
                     try:
                         logs = ws.recv()
-                        for buf in self._logs_queues:
-                            buf.append(logs)
+                        self.logs.publish_many(logs.splitlines())
                     except WebSocketConnectionClosedException:
                         break
                     except WebSocketTimeoutException:
@@ -249,10 +249,10 @@ class ReSTXRayNode:
             time.sleep(2)
 
     @contextmanager
-    def get_logs(self):
+    def get_logs(self, backlog: int = 0) -> Iterator[LogSubscription]:
+        """Logs of the node, fetched while anyone is viewing them."""
         try:
-            buf = deque(maxlen=100)
-            self._logs_queues.append(buf)
+            self._logs_viewers += 1
 
             if not self._logs_bg_thread.is_alive():
                 try:
@@ -261,14 +261,10 @@ class ReSTXRayNode:
                     self._logs_bg_thread = threading.Thread(target=self._bg_fetch_logs, daemon=True)
                     self._logs_bg_thread.start()
 
-            yield buf
+            yield self.logs.subscribe(backlog)
 
         finally:
-            try:
-                self._logs_queues.remove(buf)
-            except ValueError:
-                pass
-            del buf
+            self._logs_viewers -= 1
 
 
 class RPyCXRayNode:
@@ -322,6 +318,10 @@ class RPyCXRayNode:
         self._service = Service()
         self._api = None
 
+        self.logs = LogBroadcaster()
+        self._logs_viewers = 0
+        self._logs_lock = threading.Lock()
+
     def disconnect(self):
         try:
             self.connection.close()
@@ -425,9 +425,9 @@ class RPyCXRayNode:
             last_log = ''
             with self.get_logs() as logs:
                 while time.time() < end_time:
-                    if logs:
-                        last_log = logs[-1].strip().split('\n')[-1]
-                    time.sleep(0.1)
+                    if lines := logs.read():
+                        last_log = lines[-1].strip()
+                    logs.wait_sync(end_time - time.time())
 
             self.disconnect()
 
@@ -449,40 +449,31 @@ class RPyCXRayNode:
         self.started = True
 
     @contextmanager
-    def get_logs(self):
+    def get_logs(self, backlog: int = 0) -> Iterator[LogSubscription]:
+        """Logs of the node, fetched while anyone is viewing them."""
         if not self.connected:
             raise ConnectionError("Node is not connected")
 
-        try:
-            self.__curr_logs
-        except AttributeError:
-            self.__curr_logs = 0
-
-        try:
-            buf = deque(maxlen=100)
-
-            if self.__curr_logs <= 0:
-                self.__curr_logs = 1
+        with self._logs_lock:
+            if self._logs_viewers <= 0:
+                self._logs_viewers = 0
                 self.__bgsrv = rpyc.BgServingThread(self.connection)
-            else:
-                if not self.__bgsrv._active:
-                    self.__bgsrv = rpyc.BgServingThread(self.connection)
-                self.__curr_logs += 1
+                self.__logs = self.remote.fetch_logs(lambda logs: self.logs.publish_many(logs.splitlines()))
+            elif not self.__bgsrv._active:
+                self.__bgsrv = rpyc.BgServingThread(self.connection)
+            self._logs_viewers += 1
 
-            logs = self.remote.fetch_logs(buf.append)
-            yield buf
+        try:
+            yield self.logs.subscribe(backlog)
 
         finally:
-            if self.__curr_logs <= 1:
-                self.__curr_logs = 0
-                self.__bgsrv.stop()
-            else:
-                if not self.__bgsrv._active:
-                    self.__bgsrv = rpyc.BgServingThread(self.connection)
-                self.__curr_logs -= 1
+            with self._logs_lock:
+                self._logs_viewers -= 1
+                if self._logs_viewers <= 0:
+                    if self.__logs:
+                        self.__logs.stop()
+                    self.__bgsrv.stop()
 
-            if logs:
-                logs.stop()
 
     def on_start(self, func: callable):
         self._service.add_startup_func(func)
@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
 
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -7,8 +7,12 @@ from app import logger, xray
 from app.db import GetDB, crud
 from app.models.node import NodeStatus
 from app.models.user import UserResponse
+from app.utils import workers
 from app.utils.concurrency import threaded_function
+from app.xray import published
+from app.xray.config import XRayConfig
 from app.xray.node import XRayNode
+from config import XRAY_JSON
 from xray_api import XRay as XRayAPI
 from xray_api.types.account import Account, XTLSFlows
 
@@ -36,6 +40,17 @@ def _add_user_to_inbound(api: XRayAPI, inbound_tag: str, account: Account):
         pass
 
 
+@threaded_function
+def _add_users_to_inbounds(api: XRayAPI, accounts: List[Tuple[str, Account]]):
+    for inbound_tag, account in accounts:
+        try:
+            api.add_inbound_user(tag=inbound_tag, user=account, timeout=30)
+        except xray.exc.EmailExistsError:
+            pass
+        except xray.exc.ConnectionError:
+            return
+
+
 @threaded_function
 def _remove_user_from_inbound(api: XRayAPI, inbound_tag: str, email: str):
     try:
@@ -44,6 +59,18 @@ def _remove_user_from_inbound(api: XRayAPI, inbound_tag: str, email: str):
         pass
 
 
+@threaded_function
+def _remove_users_from_inbounds(api: XRayAPI, inbound_tags: List[str], emails: List[str]):
+    for inbound_tag in inbound_tags:
+        for email in emails:
+            try:
+                api.remove_inbound_user(tag=inbound_tag, email=email, timeout=30)
+            except xray.exc.EmailNotFoundError:
+                pass
+            except xray.exc.ConnectionError:
+                return
+
+
 @threaded_function
 def _alter_inbound_user(api: XRayAPI, inbound_tag: str, account: Account):
     try:
@@ -56,10 +83,12 @@ def _alter_inbound_user(api: XRayAPI, inbound_tag: str, account: Account):
         pass
 
 
-def add_user(dbuser: "DBUser"):
+def _user_accounts(dbuser: "DBUser") -> List[Tuple[str, Account]]:
+    """Inbound tags of the user along with the account to add to each."""
     user = UserResponse.model_validate(dbuser)
     email = f"{dbuser.id}.{dbuser.username}"
 
+    accounts = []
     for proxy_type, inbound_tags in user.inbounds.items():
         for inbound_tag in inbound_tags:
             inbound = xray.config.inbounds_by_tag.get(inbound_tag, {})
@@ -84,13 +113,40 @@ def add_user(dbuser: "DBUser"):
             ):
                 account.flow = XTLSFlows.NONE
 
-            _add_user_to_inbound(xray.api, inbound_tag, account)  # main core
-            for node in list(xray.nodes.values()):
-                if node.connected and node.started:
-                    _add_user_to_inbound(node.api, inbound_tag, account)
+            accounts.append((inbound_tag, account))
+    return accounts
+
+
+def add_user(dbuser: "DBUser"):
+    if not workers.is_leader:
+        return workers.send("xray.add_users", {"user_ids": [dbuser.id]})
+
+    for inbound_tag, account in _user_accounts(dbuser):
+        _add_user_to_inbound(xray.api, inbound_tag, account)  # main core
+        for node in list(xray.nodes.values()):
+            if node.connected and node.started:
+                _add_user_to_inbound(node.api, inbound_tag, account)
+
+
+def add_users(dbusers: List["DBUser"]):
+    """Adds the users with one thread per core instead of one per call."""
+    if not workers.is_leader:
+        return workers.send("xray.add_users", {"user_ids": [dbuser.id for dbuser in dbusers]})
+
+    accounts = [account for dbuser in dbusers for account in _user_accounts(dbuser)]
+    if not accounts:
+        return
+
+    _add_users_to_inbounds(xray.api, accounts)  # main core
+    for node in list(xray.nodes.values()):
+        if node.connected and node.started:
+            _add_users_to_inbounds(node.api, accounts)
 
 
 def remove_user(dbuser: "DBUser"):
+    if not workers.is_leader:
+        return workers.send("xray.remove_users", {"users": [(dbuser.id, dbuser.username)]})
+
     email = f"{dbuser.id}.{dbuser.username}"
 
     for inbound_tag in xray.config.inbounds_by_tag:
@@ -100,7 +156,26 @@ def remove_user(dbuser: "DBUser"):
                 _remove_user_from_inbound(node.api, inbound_tag, email)
 
 
+def remove_users(users: List[Tuple[int, str]]):
+    """Removes the users, given by ID and username, with one thread per core instead of one per call."""
+    if not workers.is_leader:
+        return workers.send("xray.remove_users", {"users": list(users)})
+
+    emails = [f"{user_id}.{username}" for user_id, username in users]
+    if not emails:
+        return
+
+    inbound_tags = list(xray.config.inbounds_by_tag)
+    _remove_users_from_inbounds(xray.api, inbound_tags, emails)
+    for node in list(xray.nodes.values()):
+        if node.connected and node.started:
+            _remove_users_from_inbounds(node.api, inbound_tags, emails)
+
+
 def update_user(dbuser: "DBUser"):
+    if not workers.is_leader:
+        return workers.send("xray.update_users", {"user_ids": [dbuser.id]})
+
     user = UserResponse.model_validate(dbuser)
     email = f"{dbuser.id}.{dbuser.username}"
 
@@ -146,6 +221,9 @@ def update_user(dbuser: "DBUser"):
 
 
 def remove_node(node_id: int):
+    if not workers.is_leader:
+        return workers.send("xray.remove_node", {"node_id": node_id})
+
     if node_id in xray.nodes:
         try:
             xray.nodes[node_id].disconnect()
@@ -196,6 +274,9 @@ _connecting_nodes = {}
 def connect_node(node_id, config=None):
     global _connecting_nodes
 
+    if not workers.is_leader:
+        return workers.send("xray.connect_node", {"node_id": node_id})
+
     if _connecting_nodes.get(node_id):
         return
 
@@ -269,6 +350,80 @@ def restart_node(node_id, config=None):
             pass
 
 
+def restart_core(config: XRayConfig = None):
+    """Restarts the main core and the connected nodes."""
+    if not workers.is_leader:
+        return workers.send("xray.restart_core", {})
+
+    if config is None:
+        config = xray.config.include_db_users()
+
+    xray.core.restart(config)
+    for node_id, node in list(xray.nodes.items()):
+        if node.connected:
+            restart_node(node_id, config)
+
+
+def update_hosts():
+    """Reloads the hosts from the database, in every worker, and publishes them to subscription servers."""
+    xray.hosts.update()
+    workers.broadcast("xray.hosts")
+    published.publish()
+
+
+def reload_config():
+    """Has the other workers reload the core config after it was written to XRAY_JSON."""
+    workers.broadcast("xray.config")
+
+
+@workers.handler("xray.add_users")
+def _handle_add_users(payload: Dict[str, Any]):
+    from app.db.models import User
+
+    with GetDB() as db:
+        add_users(crud.get_user_queryset(db).filter(User.id.in_(payload["user_ids"])).all())
+
+
+@workers.handler("xray.update_users")
+def _handle_update_users(payload: Dict[str, Any]):
+    from app.db.models import User
+
+    with GetDB() as db:
+        for dbuser in crud.get_user_queryset(db).filter(User.id.in_(payload["user_ids"])):
+            update_user(dbuser)
+
+
+@workers.handler("xray.remove_users")
+def _handle_remove_users(payload: Dict[str, Any]):
+    remove_users([tuple(user) for user in payload["users"]])
+
+
+@workers.handler("xray.connect_node")
+def _handle_connect_node(payload: Dict[str, Any]):
+    connect_node(payload["node_id"])
+
+
+@workers.handler("xray.remove_node")
+def _handle_remove_node(payload: Dict[str, Any]):
+    remove_node(payload["node_id"])
+
+
+@workers.handler("xray.restart_core")
+def _handle_restart_core(payload: Dict[str, Any]):
+    restart_core()
+
+
+@workers.handler("xray.hosts")
+def _handle_hosts(payload: Dict[str, Any]):
+    xray.hosts.update()
+
+
+@workers.handler("xray.config")
+def _handle_config(payload: Dict[str, Any]):
+    xray.config = XRayConfig(XRAY_JSON, api_port=xray.config.api_port)
+    xray.hosts.update()
+
+
 __all__ = [
     "add_user",
     "remove_user",
@@ -276,4 +431,7 @@ __all__ = [
     "remove_node",
     "connect_node",
     "restart_node",
+    "restart_core",
+    "update_hosts",
+    "reload_config",
 ]
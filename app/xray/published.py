@@ -0,0 +1,85 @@
+"""
+Inbounds and hosts of the panel, published in the database for standalone subscription
+servers (sub.py), which have neither the Xray config nor a core.
+
+The panel publishes them on startup and whenever the hosts or the config change. The
+subscription servers use them as `xray.config` and `xray.hosts`, and check for a newer
+revision every SUB_CONFIG_CHECK_INTERVAL seconds.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from app import logger
+from config import SUB_CONFIG_CHECK_INTERVAL
+
+revision: Optional[int] = None
+_stopping = threading.Event()
+
+
+class PublishedConfig:
+    """The parts of `XRayConfig` subscriptions use."""
+
+    def __init__(self, inbounds: List[Dict[str, Any]]):
+        self.inbounds_by_tag: Dict[str, Dict[str, Any]] = {}
+        self.inbounds_by_protocol: Dict[str, List[Dict[str, Any]]] = {}
+        for inbound in inbounds:
+            self.inbounds_by_tag[inbound["tag"]] = inbound
+            self.inbounds_by_protocol.setdefault(inbound["protocol"], []).append(inbound)
+
+
+def publish():
+    """Stores the current inbounds and hosts of the panel."""
+    from app import xray
+    from app.db import GetDB
+    from app.db.models import SubscriptionConfig
+
+    # a list, JSON objects don't keep their order in every database and links follow the config's
+    inbounds = list(xray.config.inbounds_by_tag.values())
+    hosts = {tag: xray.hosts.get(tag, []) for tag in xray.config.inbounds_by_tag}
+    with GetDB() as db:
+        published = db.get(SubscriptionConfig, 1, with_for_update=True)
+        if published is None:
+            published = SubscriptionConfig(id=1, revision=0)
+            db.add(published)
+        published.revision += 1
+        published.inbounds = inbounds
+        published.hosts = hosts
+        db.commit()
+
+
+def load() -> bool:
+    """Loads the published inbounds and hosts if they changed, returns whether they did."""
+    global revision
+    from app import xray
+    from app.db import GetDB
+    from app.db.models import SubscriptionConfig
+
+    with GetDB() as db:
+        current = db.query(SubscriptionConfig.revision).filter(SubscriptionConfig.id == 1).scalar()
+        if current is None or current == revision:
+            return False
+        published = db.get(SubscriptionConfig, 1)
+        xray.config = PublishedConfig(published.inbounds)
+        xray.hosts = published.hosts
+        xray.hosts_revision = revision = published.revision
+    return True
+
+
+def _run():
+    while not _stopping.wait(SUB_CONFIG_CHECK_INTERVAL):
+        try:
+            if load():
+                logger.info(f"Loaded the inbounds and hosts of revision {revision}")
+        except Exception as err:
+            logger.error(f"Failed to load the published inbounds and hosts: {err}")
+
+
+def start():
+    if not load():
+        logger.error("The panel hasn't published its inbounds and hosts yet, subscriptions are empty until it does")
+    threading.Thread(target=_run, name="published config", daemon=True).start()
+
+
+def stop():
+    _stopping.set()
@@ -0,0 +1,299 @@
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+import typer
+from rich.table import Table
+
+from . import utils
+
+app = typer.Typer(no_args_is_help=True)
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_import_times(output: str) -> List[Tuple[str, int, int, int]]:
+    """Module, self and cumulative microseconds and nesting depth of `python -X importtime` lines."""
+    modules = []
+    for line in output.splitlines():
+        if m := IMPORT_TIME_LINE.match(line):
+            self_us, cumulative_us, indent, module = m.groups()
+            modules.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return modules
+
+
+@app.command(name="startup")
+def startup(
+    module: str = typer.Argument("main", help="The module to import, e.g. main, sub or cli.user"),
+    limit: int = typer.Option(25, *utils.FLAGS["limit"], help="Number of modules listed"),
+    by_self: bool = typer.Option(False, "--self", help="Sort by the time spent in the module itself"),
+    by_package: bool = typer.Option(False, "--by-package", help="Sum the times of each top level package"),
+):
+    """
+    Profiles the startup, the time spent importing each module.
+
+    The module is imported by a new interpreter with `python -X importtime`,
+    so nothing is already imported by the CLI. Times are in milliseconds.
+    """
+    if not re.fullmatch(r"[\w.]+", module):
+        utils.error(f'Invalid module name "{module}"')
+
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - started
+
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        utils.error(f'Failed to import "{module}":\n' + "\n".join(errors[-10:]))
+
+    modules = parse_import_times(result.stderr)
+
+    if by_package:
+        packages = defaultdict(lambda: [0, 0])
+        for name, self_us, _, _ in modules:
+            package = packages[name.split(".")[0]]
+            package[0] += self_us
+            package[1] += 1
+        rows = sorted(packages.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        utils.print_table(
+            table=Table("Package", "Time", "Modules"),
+            rows=[(name, f"{self_us / 1000:.1f}", str(count)) for name, (self_us, count) in rows]
+        )
+    else:
+        rows = sorted(modules, key=lambda m: m[1] if by_self else m[2], reverse=True)[:limit]
+        utils.print_table(
+            table=Table("Module", "Self", "Cumulative", "Depth"),
+            rows=[
+                (name, f"{self_us / 1000:.1f}", f"{cumulative_us / 1000:.1f}", str(depth))
+                for name, self_us, cumulative_us, depth in rows
+            ]
+        )
+
+    total = sum(self_us for _, self_us, _, _ in modules)
+    utils.success(
+        f'{len(modules)} modules imported in {total / 1000:.0f} ms, '
+        f'{elapsed * 1000:.0f} ms with the interpreter startup.',
+        auto_exit=False
+    )
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+@app.command(name="sqlite-benchmark")
+def sqlite_benchmark(
+    readers: int = typer.Option(10, help="Subscription readers, SUB_DB_WORKERS by default in production"),
+    writers: int = typer.Option(2, help="Background jobs writing the usages of all users"),
+    users: int = typer.Option(10000, help="Number of users"),
+    seconds: float = typer.Option(10, help="Duration of the run"),
+    interval: float = typer.Option(1, help="Seconds between the runs of each job"),
+    wal: bool = typer.Option(True, help="WAL journal, as SQLITE_WAL"),
+    queue: bool = typer.Option(True, help="Jobs take turns in the write queue"),
+    write_back: bool = typer.Option(True, help="Readers record the subscription update, as the subscription endpoints do"),
+):
+    """
+    Simulates subscription readers and usage writers on a temporary SQLite database.
+
+    Readers load a random user through the read-only connections and record its
+    subscription update. Jobs add traffic to all users in one transaction, like the usage job.
+    Doesn't touch the panel's database.
+    """
+    from sqlalchemy import bindparam, insert, update
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import sessionmaker
+
+    from app.db.base import Base, create_sqlite_engine
+    from app.db.models import User
+    from app.db.write_queue import WriteQueue
+
+    directory = tempfile.mkdtemp(prefix="marzban-sqlite-benchmark-")
+    url = f"sqlite:///{os.path.join(directory, 'db.sqlite3')}"
+    engine = create_sqlite_engine(url, wal=wal)
+    Session = sessionmaker(bind=engine)
+    read_engine = create_sqlite_engine(url, wal=wal, read_only=True)
+    ReadSession = sessionmaker(bind=read_engine)
+
+    Base.metadata.create_all(engine)
+    with Session() as db:
+        db.execute(insert(User), [{"username": f"user{i}"} for i in range(users)])
+        db.commit()
+
+    write_queue = WriteQueue()
+    stopping = threading.Event()
+    read_times: List[float] = []
+    write_times: List[float] = []
+    errors = defaultdict(int)
+
+    def read():
+        while not stopping.is_set():
+            started = time.perf_counter()
+            try:
+                with ReadSession() as db:
+                    db.query(User).filter(User.username == f"user{random.randrange(users)}").one()
+                if write_back:
+                    with Session() as db:
+                        db.execute(
+                            update(User).where(User.username == f"user{random.randrange(users)}")
+                            .values(sub_updated_at=datetime.utcnow(), sub_last_user_agent="benchmark")
+                        )
+                        db.commit()
+                read_times.append(time.perf_counter() - started)
+            except OperationalError as err:
+                errors[str(err.orig)] += 1
+
+    def write():
+        params = [{"uid": i + 1, "value": 1024} for i in range(users)]
+        stmt = update(User).where(User.id == bindparam("uid")) \
+            .values(used_traffic=User.used_traffic + bindparam("value"), online_at=datetime.utcnow())
+        while not stopping.wait(random.uniform(0, interval)):
+            started = time.perf_counter()
+            try:
+                with write_queue if queue else nullcontext(), Session() as db:
+                    db.connection().execute(stmt, params)
+                    db.commit()
+                write_times.append(time.perf_counter() - started)
+            except OperationalError as err:
+                errors[str(err.orig)] += 1
+
+    threads = [threading.Thread(target=read, daemon=True) for _ in range(readers)]
+    threads += [threading.Thread(target=write, daemon=True) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stopping.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    read_engine.dispose()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    utils.print_table(
+        table=Table("", "Count", "Per second", "p50 ms", "p99 ms", "Max ms"),
+        rows=[
+            (name, str(len(times)), f"{len(times) / seconds:.0f}", f"{percentile(times, 50) * 1000:.1f}",
+             f"{percentile(times, 99) * 1000:.1f}", f"{max(times, default=0) * 1000:.1f}")
+            for name, times in (("Subscriptions", read_times), ("Usage writes", write_times))
+        ]
+    )
+    for error, count in errors.items():
+        utils.error(f"{count} × {error}", auto_exit=False)
+    utils.success(f"{readers} readers, {writers} writers, {users} users, {seconds:g} seconds", auto_exit=False)
+
+
+def hot_queries() -> Dict[str, Callable]:
+    """The frequent queries of the jobs, subscriptions and API, by name."""
+    from app.db import crud
+    from app.db.models import Admin, NotificationReminder, Proxy, User, UserUsageResetLogs
+    from app.models.user import ReminderType, UserStatus
+
+    # nothing matches these, plans don't depend on the rows found and nothing is changed
+    user = User(id=0, username="")
+    admin = Admin(id=0, username="")
+    now = datetime.utcnow()
+    return {
+        "get_user": lambda db: crud.get_user(db, ""),
+        "get_users by status (review)": lambda db: crud.get_users(db, status=UserStatus.active),
+        "get_users of an admin": lambda db: crud.get_users(db, admin=admin, limit=10),
+        "get_users_count by status": lambda db: crud.get_users_count(db, status=UserStatus.active),
+        "get_users_count of an admin": lambda db: crud.get_users_count(db, UserStatus.active, admin),
+        "get_expired_users": lambda db: crud.get_expired_users(db, now - timedelta(days=1), now),
+        "count_online_users": lambda db: crud.count_online_users(db, 24),
+        "get_user_usages": lambda db: crud.get_user_usages(db, user, now - timedelta(days=30), now),
+        "get_notification_reminder": lambda db: crud.get_notification_reminder(db, 0, ReminderType.data_usage, 80),
+        "user proxies": lambda db: db.query(Proxy).filter(Proxy.user_id == 0).all(),
+        "user usage reset logs": lambda db: db.query(UserUsageResetLogs).filter(UserUsageResetLogs.user_id == 0).all(),
+        "user reminders": lambda db: db.query(NotificationReminder).filter(NotificationReminder.user_id == 0).all(),
+    }
+
+
+def full_scans(dialect: str, plan: List[tuple], tables: set) -> List[str]:
+    """Tables read in full according to the plan."""
+    scans = []
+    for row in plan:
+        if dialect == "sqlite":
+            # SEARCH uses an index, SCAN ... USING INDEX walks one in order
+            m = re.match(r"SCAN (\w+)(?! USING (?:COVERING )?INDEX)", row[-1])
+            table = m and m.group(1)
+        elif dialect == "postgresql":
+            m = re.search(r"Seq Scan on (\w+)", row[0])
+            table = m and m.group(1)
+        else:
+            # id, select_type, table, partitions, type, ...
+            table = row[2] if row[4] == "ALL" else None
+        if table in tables:
+            scans.append(table)
+    return scans
+
+
+@app.command(name="explain")
+def explain(
+    verbose: bool = typer.Option(False, "--verbose", "-v", help="Print the plans of all queries"),
+):
+    """
+    Explains the frequent queries of app/db/crud.py on the configured database.
+
+    Each query is run once, matching nothing, and the plan of every statement it
+    sends is printed when it reads a whole table. Tables that stay small, such as
+    admins or nodes, are fine to scan.
+    """
+    from sqlalchemy import event
+
+    from app.db import GetDB
+    from app.db.base import Base, engine
+
+    statements: List[Tuple[str, str, tuple]] = []
+    name = ""
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((name, statement, parameters))
+
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    tables = set(Base.metadata.tables)
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with GetDB() as db:
+            for name, query in hot_queries().items():
+                query(db)
+            db.rollback()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    flagged = 0
+    with engine.connect() as conn:
+        for name, statement, parameters in statements:
+            cursor = conn.connection.cursor()
+            cursor.execute(prefix + statement, parameters)
+            plan = [tuple(row) for row in cursor.fetchall()]
+            cursor.close()
+
+            scans = full_scans(engine.dialect.name, plan, tables)
+            flagged += bool(scans)
+            if scans:
+                utils.error(f"{name}: full scan of {', '.join(scans)}", auto_exit=False)
+            elif verbose:
+                utils.success(f"{name}", auto_exit=False)
+            if scans or verbose:
+                typer.echo("    " + re.sub(r"^SELECT .*? FROM ", "SELECT ... FROM ", " ".join(statement.split())))
+                for row in plan:
+                    typer.echo("    > " + " | ".join(str(v) for v in row))
+
+    utils.success(f"{len(statements)} statements of {len(hot_queries())} queries, {flagged} with full scans.",
+                  auto_exit=False)
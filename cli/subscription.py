@@ -73,3 +73,24 @@ def get_config(
                 auto_exit=False
             )
             utils.paginate(conf)
+
+
+@app.command(name="rebuild-snapshots")
+def rebuild_snapshots(
+    prune: bool = typer.Option(True, help="Deletes snapshot files no user refers to anymore")
+):
+    """
+    Renders the subscription snapshots of all users.
+
+    NOTE: This command needs `SUB_SNAPSHOT_DIR` environment variable to be set.
+    """
+    from app.subscription import snapshot
+
+    if not snapshot.store:
+        utils.error("SUB_SNAPSHOT_DIR is not set.")
+
+    with GetDB() as db:
+        count = snapshot.regenerate(db)
+
+    removed = snapshot.store.prune() if prune else 0
+    utils.success(f"Subscription snapshots of {count} users rendered, {removed} unused snapshots removed.")
@@ -0,0 +1,127 @@
+import time
+from datetime import datetime, timedelta
+
+import typer
+from rich.table import Table
+
+from app.db import GetDB, archive
+from app.db.models import UsageArchive
+from config import USAGE_ARCHIVE_DIR
+
+from . import utils
+
+app = typer.Typer(no_args_is_help=True)
+
+
+@app.command(name="archive")
+def archive_usages(
+    before_days: int = typer.Option(90, "--before-days", "-d", help="Archives usages older than this many days"),
+    prune: bool = typer.Option(True, help="Deletes archived usages from the database"),
+    batch_size: int = typer.Option(10000, help="Rows fetched and deleted per batch"),
+):
+    """
+    Exports old usages to the columnar archive.
+
+    Hourly usages are exported along with their daily and monthly rollups, the days and
+    months that are over by then, so the archive is filled whatever the usage retention.
+    Only usages not exported by a previous run are exported.
+    Pruned usages are still included in the usage reports, read from the archive.
+
+    NOTE: This command needs `USAGE_ARCHIVE_DIR` environment variable to be set.
+    """
+    if not USAGE_ARCHIVE_DIR:
+        utils.error("USAGE_ARCHIVE_DIR is not set.")
+
+    before = datetime.utcnow() - timedelta(days=before_days)
+    with GetDB() as db:
+        for table_name in archive.TABLES:
+            parts = archive.export(db, table_name, before, prune=prune, batch_size=batch_size)
+            utils.success(
+                f'{sum(part.rows for part in parts)} rows of "{table_name}" archived in {len(parts)} parts.',
+                auto_exit=False
+            )
+
+
+@app.command(name="list-archives")
+def list_archives():
+    """Lists the archived usage parts."""
+    with GetDB() as db:
+        parts = db.query(UsageArchive).order_by(UsageArchive.id).all()
+
+    utils.print_table(
+        table=Table("Table", "Month", "Node", "Rows", "Path", "Pruned"),
+        rows=[
+            (part.table_name, part.month, str(part.node_id or "master"), str(part.rows), part.path,
+             "✔️" if part.pruned else "✖️")
+            for part in parts
+        ]
+    )
+
+
+@app.command(name="benchmark-analytics")
+def benchmark_analytics(
+    users: int = typer.Option(100000, help="Number of users"),
+    buckets: int = typer.Option(720, help="Number of hourly buckets"),
+    admins: int = typer.Option(20, help="Number of admins the users are spread over"),
+    seed: int = typer.Option(0),
+    database: bool = typer.Option(False, help="Loads the usages of the last `buckets` hours from the database"),
+):
+    """
+    Times loading a usage matrix and the analytics computations over it.
+
+    The matrix is random and its rows are fed to the matrix builder like the usage query's
+    cursor yields them, unless `--database` is given.
+    """
+    import numpy as np
+
+    from app.models.node import UsagePeriod
+    from app.utils import analytics
+
+    timings = []
+
+    def measure(name, func):
+        started = time.perf_counter()
+        result = func()
+        timings.append((name, time.perf_counter() - started))
+        return result
+
+    if database:
+        end = datetime.utcnow()
+        with GetDB() as db:
+            matrix = measure("load matrix", lambda: analytics.load_matrix(
+                db, end - timedelta(hours=buckets - 1), end, UsagePeriod.hour))
+        users = len(matrix.user_ids)
+    else:
+        rng = np.random.default_rng(seed)
+        start = datetime(2024, 1, 1)
+        values = measure("generate", lambda: rng.lognormal(16, 2, size=(users, buckets)).astype(np.float32))
+        values[rng.random((users, buckets)) < 0.6] = 0
+        admin_ids = np.sort(rng.integers(1, admins + 1, size=users))
+        bucket_starts = [start + timedelta(hours=i) for i in range(buckets)]
+
+        def rows():
+            for lower in range(0, users, 1024):
+                block_users, block_buckets = np.nonzero(values[lower:lower + 1024])
+                yield from zip(
+                    (block_users + lower + 1).tolist(),
+                    admin_ids[block_users + lower].tolist(),
+                    [bucket_starts[i] for i in block_buckets.tolist()],
+                    values[block_users + lower, block_buckets].astype(np.int64).tolist(),
+                )
+
+        matrix = measure("load matrix", lambda: analytics.build_matrix(
+            rows(), start, bucket_starts[-1], UsagePeriod.hour, capacity=users))
+
+    measure("top 100 users", lambda: analytics.top_users(matrix, 100))
+    measure("p50/p95/p99 per admin", lambda: [
+        analytics.percentiles(matrix.values[rows], [50, 95, 99]) for _, rows in matrix.admin_slices()
+    ])
+    measure("moving average of totals", lambda: analytics.moving_average(
+        matrix.values.sum(axis=0, dtype=np.float64), 24))
+    measure("spikes, 24 buckets window", lambda: analytics.spikes(matrix, 24, 3.0, 10.0, 100))
+
+    utils.print_table(
+        table=Table("Step", "Seconds"),
+        rows=[(name, f"{seconds:.3f}") for name, seconds in timings]
+    )
+    utils.success(f"{users} users × {buckets} buckets, {matrix.values.nbytes / 1024 ** 2:.0f}MB", auto_exit=False)
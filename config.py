@@ -7,6 +7,22 @@ load_dotenv()
 SQLALCHEMY_DATABASE_URL = config("SQLALCHEMY_DATABASE_URL", default="sqlite:///db.sqlite3")
 SQLALCHEMY_POOL_SIZE = config("SQLALCHEMY_POOL_SIZE", cast=int, default=10)
 SQLIALCHEMY_MAX_OVERFLOW = config("SQLIALCHEMY_MAX_OVERFLOW", cast=int, default=30)
+# sqlite tuning, see app/db/base.py. cache and mmap sizes are in megabytes, the timeout in milliseconds
+SQLITE_WAL = config("SQLITE_WAL", cast=bool, default=True)
+SQLITE_BUSY_TIMEOUT = config("SQLITE_BUSY_TIMEOUT", cast=int, default=10000)
+SQLITE_CACHE_SIZE = config("SQLITE_CACHE_SIZE", cast=int, default=64)
+SQLITE_MMAP_SIZE = config("SQLITE_MMAP_SIZE", cast=int, default=256)
+
+# count and time the sql statements of each request and job, see /api/debug/profile
+QUERY_PROFILE = config("QUERY_PROFILE", cast=bool, default=False)
+QUERY_PROFILE_SLOWEST = config("QUERY_PROFILE_SLOWEST", cast=int, default=5)
+# requests or jobs above these are logged, the total statements and the repeats of a single statement
+QUERY_PROFILE_WARN_STATEMENTS = config("QUERY_PROFILE_WARN_STATEMENTS", cast=int, default=50)
+QUERY_PROFILE_WARN_REPEATS = config("QUERY_PROFILE_WARN_REPEATS", cast=int, default=10)
+
+# prometheus metrics at /metrics, scrapers must send "Authorization: Bearer <METRICS_TOKEN>" if it's set
+METRICS_ENABLED = config("METRICS_ENABLED", cast=bool, default=False)
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
 
 UVICORN_HOST = config("UVICORN_HOST", default="0.0.0.0")
 UVICORN_PORT = config("UVICORN_PORT", cast=int, default=8000)
@@ -14,6 +30,10 @@ UVICORN_UDS = config("UVICORN_UDS", default=None)
 UVICORN_SSL_CERTFILE = config("UVICORN_SSL_CERTFILE", default=None)
 UVICORN_SSL_KEYFILE = config("UVICORN_SSL_KEYFILE", default=None)
 UVICORN_SSL_CA_TYPE = config("UVICORN_SSL_CA_TYPE", default="public").lower()
+# with more than one worker, the holder of the lock file runs the core, nodes and jobs
+UVICORN_WORKERS = config("UVICORN_WORKERS", cast=int, default=1)
+WORKERS_LOCK_FILE = config("WORKERS_LOCK_FILE", default="./marzban.lock")
+WORKERS_POLL_INTERVAL = config("WORKERS_POLL_INTERVAL", cast=float, default=1)
 DASHBOARD_PATH = config("DASHBOARD_PATH", default="/dashboard/")
 
 DEBUG = config("DEBUG", default=False, cast=bool)
@@ -34,6 +54,15 @@ XRAY_ASSETS_PATH = config("XRAY_ASSETS_PATH", default="/usr/local/share/xray")
 XRAY_EXCLUDE_INBOUND_TAGS = config("XRAY_EXCLUDE_INBOUND_TAGS", default='').split()
 XRAY_SUBSCRIPTION_URL_PREFIX = config("XRAY_SUBSCRIPTION_URL_PREFIX", default="").strip("/")
 XRAY_SUBSCRIPTION_PATH = config("XRAY_SUBSCRIPTION_PATH", default="sub").strip("/")
+# set by sub.py, which only loads what serving subscriptions needs
+SUBSCRIPTION_ONLY = config("SUBSCRIPTION_ONLY", cast=bool, default=False)
+# directory of the parsed access logs of the main core, disabled if empty
+ACCESS_LOG_DIR = config("ACCESS_LOG_DIR", default="")
+ACCESS_LOG_RETENTION_DAYS = config("ACCESS_LOG_RETENTION_DAYS", cast=int, default=7)
+# lines waiting to be parsed, more are dropped so a flood never blocks the core's output
+ACCESS_LOG_QUEUE_SIZE = config("ACCESS_LOG_QUEUE_SIZE", cast=int, default=100000)
+# deleted users are listed by /api/users/changes for this long
+USER_TOMBSTONE_RETENTION_DAYS = config("USER_TOMBSTONE_RETENTION_DAYS", cast=int, default=30)
 
 TELEGRAM_API_TOKEN = config("TELEGRAM_API_TOKEN", default="")
 TELEGRAM_ADMIN_ID = config(
@@ -107,10 +136,19 @@ WEBHOOK_ADDRESS = config(
     cast=lambda v: [address.strip() for address in v.split(',')] if v else []
 )
 WEBHOOK_SECRET = config("WEBHOOK_SECRET", default=None)
+# notifications are posted in batches of at most this many, with this timeout in seconds
+WEBHOOK_BATCH_SIZE = config("WEBHOOK_BATCH_SIZE", default=100, cast=int)
+WEBHOOK_TIMEOUT = config("WEBHOOK_TIMEOUT", default=10, cast=float)
+# notifications waiting in memory to be written to the outbox, the oldest are dropped beyond this
+WEBHOOK_BUFFER_SIZE = config("WEBHOOK_BUFFER_SIZE", default=10000, cast=int)
+# notifications carry a few fields of the user and its revision instead of the whole user with its links
+WEBHOOK_COMPACT_PAYLOAD = config("WEBHOOK_COMPACT_PAYLOAD", default=False, cast=bool)
+# first retry delay in seconds, doubled on every retry up to RECURRENT_NOTIFICATIONS_TIMEOUT
+WEBHOOK_RETRY_BACKOFF = config("WEBHOOK_RETRY_BACKOFF", default=5, cast=int)
 
 # recurrent notifications
 
-# timeout between each retry of sending a notification in seconds
+# max delay between retries of sending a notification in seconds
 RECURRENT_NOTIFICATIONS_TIMEOUT = config("RECURRENT_NOTIFICATIONS_TIMEOUT", default=180, cast=int)
 # how many times to try after ok response not recevied after sending a notifications
 NUMBER_OF_RECURRENT_NOTIFICATIONS = config("NUMBER_OF_RECURRENT_NOTIFICATIONS", default=3, cast=int)
@@ -131,18 +169,72 @@ NOTIFY_DAYS_LEFT = config(
 
 DISABLE_RECORDING_NODE_USAGE = config("DISABLE_RECORDING_NODE_USAGE", cast=bool, default=False)
 
+# per node user usages are kept hourly for this many days, then rolled up into daily rows,
+# which are rolled up into monthly rows after USAGE_DAILY_RETENTION_DAYS. 0 keeps them as they are,
+# and monthly rows are deleted after USAGE_MONTHLY_RETENTION_DAYS unless it's 0
+USAGE_HOURLY_RETENTION_DAYS = config("USAGE_HOURLY_RETENTION_DAYS", cast=int, default=30)
+USAGE_DAILY_RETENTION_DAYS = config("USAGE_DAILY_RETENTION_DAYS", cast=int, default=365)
+USAGE_MONTHLY_RETENTION_DAYS = config("USAGE_MONTHLY_RETENTION_DAYS", cast=int, default=0)
+# directory of the columnar usage archive written by `marzban-cli usage archive`, disabled if empty
+USAGE_ARCHIVE_DIR = config("USAGE_ARCHIVE_DIR", default="")
+
 # headers: profile-update-interval, support-url, profile-title
 SUB_UPDATE_INTERVAL = config("SUB_UPDATE_INTERVAL", default="12")
 SUB_SUPPORT_URL = config("SUB_SUPPORT_URL", default="https://t.me/")
 SUB_PROFILE_TITLE = config("SUB_PROFILE_TITLE", default="Subscription")
 
+# subscription serving, rendering and db access use dedicated pools so they can't starve the api
+SUB_RENDER_WORKERS = config("SUB_RENDER_WORKERS", cast=int, default=4)
+SUB_DB_WORKERS = config("SUB_DB_WORKERS", cast=int, default=10)
+# per endpoint limits, requests above the queue size or waiting longer than the timeout get a 503
+SUB_MAX_CONCURRENT_REQUESTS = config("SUB_MAX_CONCURRENT_REQUESTS", cast=int, default=32)
+SUB_MAX_QUEUED_REQUESTS = config("SUB_MAX_QUEUED_REQUESTS", cast=int, default=512)
+SUB_QUEUE_TIMEOUT = config("SUB_QUEUE_TIMEOUT", cast=float, default=15)
+# subscriptions are cacheable for this long, defaults to the profile update interval
+SUB_CACHE_MAX_AGE = config("SUB_CACHE_MAX_AGE", cast=int, default=int(float(SUB_UPDATE_INTERVAL) * 3600))
+# pre-render subscriptions into this directory and serve them as static files, disabled if empty
+SUB_SNAPSHOT_DIR = config("SUB_SNAPSHOT_DIR", default="")
+# remarks may show usage and time left, so users whose usage changed are re-rendered at most this often,
+# and snapshots older than the max age are rendered on request instead, both in seconds
+SUB_SNAPSHOT_USAGE_INTERVAL = config("SUB_SNAPSHOT_USAGE_INTERVAL", cast=int, default=300)
+SUB_SNAPSHOT_MAX_AGE = config("SUB_SNAPSHOT_MAX_AGE", cast=int, default=3600)
+# standalone subscription servers (sub.py), they check for changes of the panel's inbounds and hosts this often
+SUB_SERVER_HOST = config("SUB_SERVER_HOST", default="0.0.0.0")
+SUB_SERVER_PORT = config("SUB_SERVER_PORT", cast=int, default=8001)
+SUB_SERVER_WORKERS = config("SUB_SERVER_WORKERS", cast=int, default=1)
+SUB_CONFIG_CHECK_INTERVAL = config("SUB_CONFIG_CHECK_INTERVAL", cast=float, default=10)
+# the detected public ips ({SERVER_IP} of hosts) are cached here and refreshed in the background
+PUBLIC_IP_CACHE_FILE = config("PUBLIC_IP_CACHE_FILE", default="./public_ip.json")
+PUBLIC_IP_REFRESH_INTERVAL = config("PUBLIC_IP_REFRESH_INTERVAL", cast=int, default=21600)
+
+# max size of the in-memory cache of compressed responses, in megabytes
+RESPONSE_CACHE_SIZE = config("RESPONSE_CACHE_SIZE", cast=int, default=64)
+
+# results of /api/analytics are computed at most once per this many seconds for the same query
+ANALYTICS_CACHE_TTL = config("ANALYTICS_CACHE_TTL", cast=int, default=300)
+
+# number of recent events kept for resuming event streams, and per subscriber backlog
+EVENTS_BUFFER_SIZE = config("EVENTS_BUFFER_SIZE", cast=int, default=10000)
+EVENTS_SUBSCRIBER_QUEUE_SIZE = config("EVENTS_SUBSCRIBER_QUEUE_SIZE", cast=int, default=1000)
+
 # discord webhook log
 DISCORD_WEBHOOK_URL = config("DISCORD_WEBHOOK_URL", default="")
 
+# telegram and discord reports are sent in the background, at most this many per second per chat or webhook
+TELEGRAM_RATE_LIMIT = config("TELEGRAM_RATE_LIMIT", cast=float, default=1)
+DISCORD_RATE_LIMIT = config("DISCORD_RATE_LIMIT", cast=float, default=0.5)
+# status changes and deletions reported within this many seconds are merged into one message
+REPORT_DIGEST_WINDOW = config("REPORT_DIGEST_WINDOW", cast=float, default=5)
+# max reports waiting per chat or webhook, the oldest are dropped when it's full
+REPORT_QUEUE_SIZE = config("REPORT_QUEUE_SIZE", cast=int, default=1000)
+REPORT_MAX_RETRIES = config("REPORT_MAX_RETRIES", cast=int, default=5)
+REPORT_TIMEOUT = config("REPORT_TIMEOUT", cast=float, default=10)
+
 
 # Interval jobs, all values are in seconds
 JOB_CORE_HEALTH_CHECK_INTERVAL = config("JOB_CORE_HEALTH_CHECK_INTERVAL", cast=int, default=10)
 JOB_RECORD_NODE_USAGES_INTERVAL = config("JOB_RECORD_NODE_USAGES_INTERVAL", cast=int, default=30)
 JOB_RECORD_USER_USAGES_INTERVAL = config("JOB_RECORD_USER_USAGES_INTERVAL", cast=int, default=10)
 JOB_REVIEW_USERS_INTERVAL = config("JOB_REVIEW_USERS_INTERVAL", cast=int, default=10)
-JOB_SEND_NOTIFICATIONS_INTERVAL = config("JOB_SEND_NOTIFICATIONS_INTERVAL", cast=int, default=30)
+JOB_SUB_SNAPSHOTS_INTERVAL = config("JOB_SUB_SNAPSHOTS_INTERVAL", cast=int, default=5)
+JOB_COMPACT_USAGES_INTERVAL = config("JOB_COMPACT_USAGES_INTERVAL", cast=int, default=3600)
@@ -9,12 +9,16 @@ import typer
 from typer._completion_shared import Shells
 
 import cli.admin
+import cli.debug
 import cli.subscription
+import cli.usage
 import cli.user
 
 app = typer.Typer(no_args_is_help=True, add_completion=False)
 app.add_typer(cli.admin.app, name="admin")
+app.add_typer(cli.debug.app, name="debug")
 app.add_typer(cli.subscription.app, name="subscription")
+app.add_typer(cli.usage.app, name="usage")
 app.add_typer(cli.user.app, name="user")
 
 
@@ -0,0 +1,30 @@
+"""
+Standalone subscription server, serves only /sub/{token}/* of the panel's users.
+
+    python sub.py
+
+Only what serving subscriptions needs is loaded, it starts in a moment and runs no core,
+jobs or bot. It needs the panel's database and the panel to have published its inbounds
+and hosts, which it does on startup.
+"""
+
+import os
+
+# before anything reads the config
+os.environ["SUBSCRIPTION_ONLY"] = "1"
+
+import logging  # noqa: E402
+
+import uvicorn  # noqa: E402
+
+from app.subscription.asgi import app  # noqa: E402,F401
+from config import DEBUG, SUB_SERVER_HOST, SUB_SERVER_PORT, SUB_SERVER_WORKERS  # noqa: E402
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "sub:app",
+        host=SUB_SERVER_HOST,
+        port=SUB_SERVER_PORT,
+        workers=SUB_SERVER_WORKERS,
+        log_level=logging.DEBUG if DEBUG else logging.INFO
+    )
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+# config is read on import, so the panel is pointed at a scratch database and archive first
+_directory = tempfile.mkdtemp(prefix="marzban-tests-")
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(_directory, 'db.sqlite3')}"
+os.environ["USAGE_ARCHIVE_DIR"] = os.path.join(_directory, "archive")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    from app.db import GetDB
+    from app.db.base import Base, engine
+
+    Base.metadata.create_all(engine)
+    with GetDB() as db:
+        yield db
+    Base.metadata.drop_all(engine)
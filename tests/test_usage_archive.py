@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+from app.db import archive, crud
+from app.db.models import NodeUsage, NodeUserUsage, User
+from app.dependencies import validate_dates
+from app.models.node import UsagePeriod
+
+
+def archive_usages(db, user: User, *hours_ago: int):
+    for hours in hours_ago:
+        created_at = (datetime.utcnow() - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+        db.add(NodeUserUsage(user_id=user.id, node_id=None, created_at=created_at, used_traffic=1000))
+        db.add(NodeUsage(node_id=None, created_at=created_at, uplink=10, downlink=20))
+    db.commit()
+    for table_name in ("node_user_usages", "node_usages"):
+        assert archive.export(db, table_name, datetime.utcnow())
+
+
+def test_usages_without_archive(db):
+    # the endpoints pass timezone aware dates
+    start, end = validate_dates(None, None)
+    assert [(u.uplink, u.downlink) for u in crud.get_nodes_usage(db, start, end)] == [(0, 0)]
+
+
+def test_usages_with_archive(db):
+    user = User(username="archived")
+    db.add(user)
+    db.commit()
+    archive_usages(db, user, 3, 50)
+
+    start, end = validate_dates(None, None)
+    assert [u.used_traffic for u in crud.get_user_usages(db, user, start, end)] == [2000]
+    assert [u.used_traffic for u in crud.get_all_users_usages(db, None, start, end)] == [2000]
+    assert [(u.uplink, u.downlink) for u in crud.get_nodes_usage(db, start, end)] == [(20, 40)]
+
+    daily = crud.get_nodes_usage(db, start, end, UsagePeriod.day)
+    assert sum(u.uplink for u in daily) == 20
+    assert all(u.period_start.tzinfo is None for u in daily)
+
+    start, _ = validate_dates((datetime.utcnow() - timedelta(hours=10)).isoformat() + "+00:00", None)
+    assert [u.used_traffic for u in crud.get_user_usages(db, user, start, end)] == [1000]
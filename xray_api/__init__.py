@@ -1,12 +1,17 @@
-from . import exceptions
-from . import exceptions as exc
-from . import types
-from .proxyman import Proxyman
-from .stats import Stats
+import importlib
 
 
-class XRay(Proxyman, Stats):
-    pass
+def __getattr__(name: str):
+    # grpc is only imported once the client or its exceptions are used,
+    # importing the types (e.g. for the account models) doesn't need it
+    if name == "XRay":
+        from .client import XRay as value
+    elif name in ("exceptions", "exc", "types"):
+        value = importlib.import_module(f".{'exceptions' if name == 'exc' else name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
 
 
 __all__ = [
@@ -1,5 +1,11 @@
+from typing import Callable, List
+
 import grpc
 
+# called with the target ("address:port") of every new client,
+# the interceptors returned wrap its channel, e.g. to time the calls
+interceptor_factories: List[Callable[[str], grpc.UnaryUnaryClientInterceptor]] = []
+
 
 class XRayBase(object):
     def __init__(self, address: str, port: int, ssl_cert: str = None, ssl_target_name: str = None):
@@ -17,3 +23,7 @@ class XRayBase(object):
             self._channel = grpc.secure_channel(f"{address}:{port}",
                                                 credentials=creds,
                                                 options=opts)
+
+        interceptors = [factory(f"{address}:{port}") for factory in interceptor_factories]
+        if interceptors:
+            self._channel = grpc.intercept_channel(self._channel, *interceptors)
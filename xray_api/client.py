@@ -0,0 +1,6 @@
+from .proxyman import Proxyman
+from .stats import Stats
+
+
+class XRay(Proxyman, Stats):
+    pass